@@ -32,7 +32,7 @@ def cli(ctx, configfile, configclass):
     ctx.obj["config"] = config
 
 
-from .base import initdb, dbinfo, newmetric, newevent, runserver, download_timeseries
+from .base import initdb, dbinfo, newmetric, newevent, runserver, download_timeseries, compact
 
 cli.add_command(initdb)
 cli.add_command(dbinfo)
@@ -40,3 +40,4 @@ cli.add_command(newmetric)
 cli.add_command(newevent)
 cli.add_command(runserver)
 cli.add_command(download_timeseries)
+cli.add_command(compact)
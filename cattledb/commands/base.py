@@ -140,3 +140,25 @@ def download_timeseries(ctx, key):
     fs = os.path.getsize(file_name)
     fs = fs / 1024
     click.echo("Download finished. {:.2f} kb in {:.2f} seconds".format(fs, time.time()-t1))
+
+
+@click.command()
+@click.option('--limit', type=int, default=None, help='Maximum number of rows for this run.')
+@click.option('--rate', type=float, default=None, help='Maximum number of rows per second.')
+@click.option('--restart', is_flag=True, help='Start at the first row instead of the checkpoint.')
+@click.pass_context
+def compact(ctx, limit, rate, restart):
+    """Apply the metric retention to the timeseries storage."""
+    from ..storage.compaction import Compactor
+    db = ctx.obj["db"]
+    db.service_init()
+    assert db.init == True
+
+    t1 = time.time()
+    compactor = Compactor(db, max_rows_per_second=rate)
+    if restart:
+        compactor.reset_checkpoint()
+    res = compactor.run(limit=limit)
+    click.echo("Compaction {}. {} rows, {} raw and {} rollup deletes in {:.2f} seconds".format(
+        "finished" if res["finished"] else "paused", res["rows"], res["raw_deleted"], res["rollups_deleted"],
+        time.time()-t1))
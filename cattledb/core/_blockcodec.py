@@ -0,0 +1,185 @@
+#!/usr/bin/python
+# coding: utf-8
+
+"""Block encoding for float timeseries (format 3).
+
+One block holds many points:
+    header:  format byte, uint32 point count (little endian)
+    first:   ts (64 bit), offset (32 bit), value (64 bit)
+    others:  delta of delta timestamp, offset changed flag, xor value
+All fields after the header are a msb first bit stream.
+This is the pure python version of the codec in cdb_ext_ts, both produce
+the same bytes.
+"""
+
+import struct
+
+
+BLOCK_FORMAT = 3
+
+_HEADER = struct.Struct("<BI")
+_MASK32 = (1 << 32) - 1
+_MASK64 = (1 << 64) - 1
+
+
+class _BitWriter(object):
+    def __init__(self):
+        self._parts = []
+
+    def write(self, value, nbits):
+        self._parts.append(format(value, "0{}b".format(nbits)))
+
+    def getvalue(self):
+        bits = "".join(self._parts)
+        if not bits:
+            return b""
+        bits += "0" * (-len(bits) % 8)
+        return int(bits, 2).to_bytes(len(bits) // 8, "big")
+
+
+class _BitReader(object):
+    def __init__(self, by):
+        self._bits = format(int.from_bytes(by, "big"), "0{}b".format(len(by) * 8)) if by else ""
+        self._pos = 0
+
+    def read(self, nbits):
+        end = self._pos + nbits
+        if end > len(self._bits):
+            raise ValueError("block is truncated")
+        value = int(self._bits[self._pos:end], 2)
+        self._pos = end
+        return value
+
+
+def _double_bits(value):
+    return struct.unpack("<Q", struct.pack("<d", value))[0]
+
+
+def _bits_double(bits):
+    return struct.unpack("<d", struct.pack("<Q", bits))[0]
+
+
+def _signed(value, bits):
+    if value >= 1 << (bits - 1):
+        return value - (1 << bits)
+    return value
+
+
+def encode_block(timestamps, offsets, values):
+    timestamps = list(timestamps)
+    offsets = list(offsets)
+    values = [float(v) for v in values]
+    if not len(timestamps) == len(offsets) == len(values):
+        raise ValueError("encode_block: columns have different lengths")
+    header = _HEADER.pack(BLOCK_FORMAT, len(timestamps))
+    if not timestamps:
+        return header
+
+    w = _BitWriter()
+    w.write(timestamps[0] & _MASK64, 64)
+    w.write(offsets[0] & _MASK32, 32)
+    prev_bits = _double_bits(values[0])
+    w.write(prev_bits, 64)
+
+    prev_delta = 0
+    prev_lead = -1
+    prev_trail = 0
+    for i in range(1, len(timestamps)):
+        delta = _signed((timestamps[i] - timestamps[i-1]) & _MASK64, 64)
+        dod = _signed((delta - prev_delta) & _MASK64, 64)
+        prev_delta = delta
+        if dod == 0:
+            w.write(0, 1)
+        elif -63 <= dod <= 64:
+            w.write(0b10, 2)
+            w.write(dod + 63, 7)
+        elif -255 <= dod <= 256:
+            w.write(0b110, 3)
+            w.write(dod + 255, 9)
+        elif -2047 <= dod <= 2048:
+            w.write(0b1110, 4)
+            w.write(dod + 2047, 12)
+        else:
+            w.write(0b1111, 4)
+            w.write(dod & _MASK64, 64)
+
+        if offsets[i] == offsets[i-1]:
+            w.write(0, 1)
+        else:
+            w.write(1, 1)
+            w.write(offsets[i] & _MASK32, 32)
+
+        bits = _double_bits(values[i])
+        x = bits ^ prev_bits
+        prev_bits = bits
+        if x == 0:
+            w.write(0, 1)
+            continue
+        lead = min(64 - x.bit_length(), 31)
+        trail = (x & -x).bit_length() - 1
+        if prev_lead >= 0 and lead >= prev_lead and trail >= prev_trail:
+            w.write(0b10, 2)
+            w.write(x >> prev_trail, 64 - prev_lead - prev_trail)
+        else:
+            length = 64 - lead - trail
+            w.write(0b11, 2)
+            w.write(lead, 5)
+            w.write(length & 0x3f, 6)
+            w.write(x >> trail, length)
+            prev_lead = lead
+            prev_trail = trail
+    return header + w.getvalue()
+
+
+def decode_block(by):
+    if len(by) < _HEADER.size:
+        raise ValueError("block is truncated")
+    f, count = _HEADER.unpack(by[:_HEADER.size])
+    if f != BLOCK_FORMAT:
+        raise ValueError("unknown block format: {}".format(f))
+    timestamps = []
+    offsets = []
+    values = []
+    if count == 0:
+        return timestamps, offsets, values
+
+    r = _BitReader(by[_HEADER.size:])
+    ts = _signed(r.read(64), 64)
+    offset = _signed(r.read(32), 32)
+    bits = r.read(64)
+    timestamps.append(ts)
+    offsets.append(offset)
+    values.append(_bits_double(bits))
+
+    delta = 0
+    lead = 0
+    trail = 0
+    for _ in range(count - 1):
+        if r.read(1) == 0:
+            dod = 0
+        elif r.read(1) == 0:
+            dod = r.read(7) - 63
+        elif r.read(1) == 0:
+            dod = r.read(9) - 255
+        elif r.read(1) == 0:
+            dod = r.read(12) - 2047
+        else:
+            dod = _signed(r.read(64), 64)
+        delta = _signed((delta + dod) & _MASK64, 64)
+        ts = _signed((ts + delta) & _MASK64, 64)
+
+        if r.read(1) == 1:
+            offset = _signed(r.read(32), 32)
+
+        if r.read(1) == 1:
+            if r.read(1) == 1:
+                lead = r.read(5)
+                length = r.read(6) or 64
+                trail = 64 - lead - length
+                if trail < 0:
+                    raise ValueError("invalid block data")
+            bits ^= r.read(64 - lead - trail) << trail
+        timestamps.append(ts)
+        offsets.append(offset)
+        values.append(_bits_double(bits))
+    return timestamps, offsets, values
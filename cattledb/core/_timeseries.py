@@ -4,6 +4,12 @@
 import pendulum
 import datetime
 import bisect
+import operator
+import struct
+
+from array import array
+
+from ._blockcodec import encode_block, decode_block
 
 
 try:
@@ -71,6 +77,17 @@ class py_timeseries(object):
         self._data.insert(idx, (ts, ts_offset, value))
         return True
 
+    def insert_many(self, timestamps, offsets, values):
+        timestamps = list(timestamps)
+        offsets = list(offsets)
+        values = list(values)
+        if not len(timestamps) == len(offsets) == len(values):
+            raise ValueError("insert_many: columns have different lengths")
+        counter = 0
+        for ts, ts_offset, value in zip(timestamps, offsets, values):
+            counter += self.insert(ts, ts_offset, value)
+        return counter
+
     def insert_iso(self, iso_ts, value):
         dt = pendulum.parse(iso_ts)
         return self.insert(dt.int_timestamp, dt.offset, value)
@@ -156,10 +173,183 @@ class py_timeseries(object):
     def remove(self, key):
         del self._data[key]
 
+    def to_lists(self):
+        return ([x[0] for x in self._data], [x[1] for x in self._data],
+                [x[2] for x in self._data])
+
+    def to_arrays(self):
+        import numpy as np
+        ts, offsets, values = self.to_lists()
+        return (np.array(ts, dtype=np.int64), np.array(offsets, dtype=np.int32),
+                np.array(values))
+
     def __repr__(self):
         return repr(self._data)
 
 
+class array_timeseries(object):
+    """Float timeseries stored in typed arrays (ts, offset, value columns).
+    Fallback for the c extension, same interface as cdb_ext_ts.timeseries.
+    """
+    def __init__(self, key, metric):
+        self._ts = array("q")
+        self._offsets = array("i")
+        self._values = array("d")
+        self.key = key
+        self.metric = metric
+
+    def insert(self, ts, ts_offset, value):
+        if not self._ts or ts > self._ts[-1]:
+            self._ts.append(ts)
+            self._offsets.append(ts_offset)
+            self._values.append(value)
+            return True
+        idx = bisect.bisect_left(self._ts, ts)
+        if self._ts[idx] == ts:
+            self._offsets[idx] = ts_offset
+            self._values[idx] = value
+            return False
+        self._ts.insert(idx, ts)
+        self._offsets.insert(idx, ts_offset)
+        self._values.insert(idx, value)
+        return True
+
+    def insert_many(self, timestamps, offsets, values):
+        timestamps = array("q", timestamps)
+        offsets = array("i", offsets)
+        values = array("d", values)
+        if not len(timestamps) == len(offsets) == len(values):
+            raise ValueError("insert_many: columns have different lengths")
+        if not timestamps:
+            return 0
+
+        # Append
+        if ((not self._ts or timestamps[0] > self._ts[-1]) and
+                all(map(operator.lt, timestamps, timestamps[1:]))):
+            self._ts.extend(timestamps)
+            self._offsets.extend(offsets)
+            self._values.extend(values)
+            return len(timestamps)
+
+        # Merge, everything before the first batch timestamp stays in place
+        first = bisect.bisect_left(self._ts, min(timestamps))
+        merged = dict(zip(self._ts[first:], zip(self._offsets[first:], self._values[first:])))
+        existing = len(merged)
+        merged.update(zip(timestamps, zip(offsets, values)))
+        keys = sorted(merged)
+        del self._ts[first:]
+        del self._offsets[first:]
+        del self._values[first:]
+        self._ts.extend(keys)
+        self._offsets.extend(merged[k][0] for k in keys)
+        self._values.extend(merged[k][1] for k in keys)
+        return len(merged) - existing
+
+    def insert_iso(self, iso_ts, value):
+        dt = pendulum.parse(iso_ts)
+        return self.insert(dt.int_timestamp, dt.offset, value)
+
+    def to_block(self):
+        return encode_block(self._ts, self._offsets, self._values)
+
+    def insert_block(self, by):
+        return self.insert_many(*decode_block(by))
+
+    def bisect_left(self, ts):
+        return bisect.bisect_left(self._ts, ts)
+
+    def bisect_right(self, ts):
+        return bisect.bisect_right(self._ts, ts)
+
+    def at(self, key):
+        return (self._ts[key], self._offsets[key], self._values[key])
+
+    def at_ts(self, ts):
+        return self.at(self.index_of_ts(ts))
+
+    def nearest_index_of_ts(self, ts):
+        idx = self.bisect_left(ts)
+
+        if idx == 0:
+            return idx
+        if idx == len(self):
+            return idx-1
+
+        t2 = self._ts[idx]
+        t1 = self._ts[idx-1]
+
+        if abs(ts - t1) <= abs(ts - t2):
+            return idx-1
+        return idx
+
+    def index_of_ts(self, ts):
+        idx = self.bisect_left(ts)
+        if idx < len(self) and self._ts[idx] == ts:
+            return idx
+        raise KeyError("timestamp: {}".format(ts))
+
+    def iso_at(self, key):
+        t = self.at(key)
+        dt = pendulum.from_timestamp(t[0], t[1]/3600.0)
+        return (dt.isoformat(), t[2])
+
+    def bytes_at(self, key):
+        return struct.pack("=qid", *self.at(key))
+
+    def __len__(self):
+        return len(self._ts)
+
+    def _clear(self):
+        del self._ts[:]
+        del self._offsets[:]
+        del self._values[:]
+
+    def trim_idx(self, start_idx, end_idx):
+        assert 0 <= start_idx
+        assert 0 <= end_idx
+        if start_idx >= len(self):
+            self._clear()
+            return
+        for column in (self._ts, self._offsets, self._values):
+            del column[end_idx+1:]
+            del column[:start_idx]
+
+    def trim_ts(self, start_ts, end_ts):
+        idx1 = self.bisect_left(start_ts)
+        idx2 = self.bisect_right(end_ts)
+        if idx2 > 0:
+            self.trim_idx(idx1, idx2-1)
+        else:
+            self._clear()
+
+    def get_min_ts(self):
+        return self._ts[0] if self._ts else 0
+
+    def get_max_ts(self):
+        return self._ts[-1] if self._ts else 0
+
+    def remove_ts(self, ts):
+        return self.remove(self.index_of_ts(ts))
+
+    def remove(self, key):
+        del self._ts[key]
+        del self._offsets[key]
+        del self._values[key]
+        return True
+
+    def to_lists(self):
+        return (self._ts.tolist(), self._offsets.tolist(), self._values.tolist())
+
+    def to_arrays(self):
+        import numpy as np
+        return (np.frombuffer(self._ts, dtype=np.int64).copy(),
+                np.frombuffer(self._offsets, dtype=np.int32).copy(),
+                np.frombuffer(self._values, dtype=np.float64).copy())
+
+    def __repr__(self):
+        return "<array_timeseries '{}.{}'>".format(self.key, self.metric)
+
+
 class StreamList(list):
     def __init__(self, iterator):
         self.iterator = iterator
@@ -177,6 +367,17 @@ class _TSList(object):
     def insert(self, ts, ts_offset, value):
         return self._data.insert(ts, ts_offset, value)
 
+    def insert_many(self, timestamps, offsets, values):
+        return self._data.insert_many(timestamps, offsets, values)
+
+    def to_block(self):
+        """Encode all points as a compressed block."""
+        return self._data.to_block()
+
+    def insert_block(self, by):
+        """Merge a block into the series, the block wins on duplicate timestamps."""
+        return self._data.insert_block(by)
+
     def insert_datetime(self, dt, value):
         timestamp, offset = extract_ts(dt)
         return self._data.insert(timestamp, offset, value)
@@ -270,6 +471,20 @@ class _TSList(object):
     def to_list(self):
         return list([x for x in self])
 
+    def to_lists(self):
+        """Return (timestamps, offsets, values) as three python lists."""
+        return self._data.to_lists()
+
+    def to_arrays(self):
+        """Return (timestamps, offsets, values) as numpy arrays.
+        The C container returns read only views without copying, the series
+        cannot be modified as long as one of the views is alive.
+        """
+        if hasattr(self._data, "ts_array"):
+            return (self._data.ts_array(), self._data.offset_array(),
+                    self._data.value_array())
+        return self._data.to_arrays()
+
     def trim_index(self, start_idx, end_idx):
         self._data.trim_idx(start_idx, end_idx)
         return self
@@ -294,11 +509,24 @@ class _TSList(object):
 class PyTSList(_TSList):
     __container__ = py_timeseries
 
+
+class ArrayTSList(_TSList):
+    __container__ = array_timeseries
+
+
 class FastFloatTSList(_TSList):
     __container__ = c_container
 
+    def aggregate(self, group, function, tz_mode="utc"):
+        """Aggregate inside the extension, returns (timestamps, offsets, values).
+        For function "all" the values are (count, sum, min, max, mean, stdev, median) tuples.
+        """
+        if function == "all":
+            return self._data.aggregate_all(group, tz_mode)
+        return self._data.aggregate(group, function, tz_mode).to_lists()
+
 
 if c_ext:
     FloatTSList = FastFloatTSList
 else:
-    FloatTSList = PyTSList
+    FloatTSList = ArrayTSList
@@ -2,6 +2,7 @@
 # coding: utf-8
 
 import datetime
+import re
 import time
 import calendar
 import pendulum
@@ -200,6 +201,52 @@ def get_metric_ids(metrics):
     return [m.id for m in metrics]
 
 
+class MetricLookup(object):
+    """Precomputed lookups of a list of metric definitions."""
+    def __init__(self, metrics):
+        self.metrics = list(metrics)
+        self.by_name = get_metric_name_lookup(self.metrics)
+        self.by_id = get_metric_id_lookup(self.metrics)
+        self.names = get_metric_names(self.metrics)
+        self.ids = get_metric_ids(self.metrics)
+
+
+class EventLookup(object):
+    """Matches event names against the event definitions.
+    Names ending with * match as prefix. The first matching definition wins,
+    all of them are compiled into one pattern and results are memoized.
+    """
+    MAX_MEMO = 10000
+
+    def __init__(self, events):
+        self.events = list(events)
+        self.by_name = get_event_name_lookup(self.events)
+        parts = []
+        for i, e in enumerate(self.events):
+            if e.name.endswith("*"):
+                parts.append("(?P<e{}>{})".format(i, re.escape(e.name[:-1])))
+            else:
+                parts.append("(?P<e{}>{}$)".format(i, re.escape(e.name)))
+        self._pattern = re.compile("|".join(parts)) if parts else None
+        self._memo = {}
+
+    def match(self, name):
+        # definition for the event name or None
+        try:
+            return self._memo[name]
+        except KeyError:
+            pass
+        res = None
+        if self._pattern is not None:
+            m = self._pattern.match(name)
+            if m is not None:
+                res = self.events[int(m.lastgroup[1:])]
+        if len(self._memo) >= self.MAX_MEMO:
+            self._memo = {}
+        self._memo[name] = res
+        return res
+
+
 def list_mean(x):
     if len(x) == 1:
         return x[0]
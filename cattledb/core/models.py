@@ -2,6 +2,7 @@
 # coding: utf-8
 
 import abc
+import bisect
 import hashlib
 import pendulum
 import struct
@@ -16,7 +17,7 @@ from .helper import ts_daily_left, ts_daily_right
 from .helper import ts_monthly_left, ts_monthly_right
 from .helper import ts_hourly_left, ts_hourly_right
 from .helper import list_mean
-from ._timeseries import FloatTSList, PyTSList
+from ._timeseries import FloatTSList, PyTSList, extract_ts
 
 
 from ..grpcserver.cdb_pb2 import FloatTimeSeries, Dictionary, DictTimeSeries, Pair, MetaDataDict, ReaderActivity, DeviceActivity, EventSeries
@@ -40,11 +41,19 @@ class EventSeriesType(Enum):
 
 
 class MetricDefinition(object):
-    def __init__(self, name, id, type, delete_possible, _deprecated1=None, _deprecated2=None):
+    def __init__(self, name, id, type, delete_possible, _deprecated1=None, _deprecated2=None,
+                 block_encoding=False, rollups=False, raw_retention=None, rollup_retention=None):
         self.name = name
         self.id = id
         self.type = type
         self.delete_possible = delete_possible
+        # store one compressed cell per day instead of one cell per point
+        self.block_encoding = block_encoding
+        # keep hourly and daily count/sum/min/max in the family {id}_r
+        self.rollups = rollups
+        # days to keep raw points and rollups (None keeps them), see storage.compaction
+        self.raw_retention = raw_retention
+        self.rollup_retention = rollup_retention
 
     @classmethod
     def from_dict(cls, d):
@@ -52,16 +61,32 @@ class MetricDefinition(object):
         id = d["id"]
         t = MetricType(d["type"])
         delete_possible = d["delete_possible"]
-        return cls(name, id, t, delete_possible)
+        block_encoding = d.get("block_encoding", False)
+        rollups = d.get("rollups", False)
+        raw_retention = d.get("raw_retention", None)
+        rollup_retention = d.get("rollup_retention", None)
+        return cls(name, id, t, delete_possible, block_encoding=block_encoding, rollups=rollups,
+                   raw_retention=raw_retention, rollup_retention=rollup_retention)
 
     def to_dict(self):
         return {
             'name': self.name,
             'id': self.id,
             'type': self.type.value,
-            'delete_possible': self.delete_possible
+            'delete_possible': self.delete_possible,
+            'block_encoding': self.block_encoding,
+            'rollups': self.rollups,
+            'raw_retention': self.raw_retention,
+            'rollup_retention': self.rollup_retention
         }
 
+    @property
+    def rollup_id(self):
+        # column family of the rollups
+        if not self.rollups:
+            return None
+        return "{}_r".format(self.id)
+
     def __repr__(self):
         return "Metric: {} (id={}, type={})".format(self.name, self.id, self.type)
 
@@ -279,7 +304,7 @@ class BaseTimeseries(object, metaclass=abc.ABCMeta):
         """
         Possible formats: utc, local, iso, tuple, dt
         Aggregation Spans: hourly, daily, 10min
-        Aggregation Types: mean, count, sum, min, max, all
+        Aggregation Types: mean, count, sum, min, max, amp, stdev, median, all
         """
         data = []
         if timestamp_format == "utc":
@@ -402,11 +427,34 @@ class BaseTimeseries(object, metaclass=abc.ABCMeta):
             func = amp
         elif function == "mean":
             func = list_mean
+        elif function == "stdev":
+            def sample_stdev(x):
+                if len(x) <= 1:
+                    return 0.0
+                return stdev(x)
+            func = sample_stdev
+        elif function == "median":
+            func = median
         elif function == "all":
             func = full_aggregation
         else:
             raise ValueError("Invalid aggregation group")
 
+        if hasattr(self._data, "aggregate"):
+            # native single pass aggregation
+            timestamps, offsets, values = self._data.aggregate(group, function, tz_mode)
+            if function == "count":
+                values = [int(v) for v in values]
+            elif function == "all":
+                values = [AggregationValue(*v) for v in values]
+            if raw:
+                for ts, offset, value in zip(timestamps, offsets, values):
+                    yield RawPoint(ts, value, offset)
+            else:
+                for ts, offset, value in zip(timestamps, offsets, values):
+                    yield Point(ts, value, pendulum.from_timestamp(ts, offset/3600.0))
+            return
+
         if raw:
             for g in it(raw=True):
                 t = list(g)
@@ -429,17 +477,15 @@ class BaseTimeseries(object, metaclass=abc.ABCMeta):
                 value = func([x.value for x in t])
                 yield Point(ts, value, dt)
 
-    # TODO This should be done faster (maybe cdb_ext in c++)
     def _to_lists(self):
-        timestamps = []
-        values = []
-        timestamp_offsets = []
-        for ts, ts_offset, value in self._data:
-            timestamps.append(ts)
-            values.append(value)
-            timestamp_offsets.append(ts_offset)
+        timestamps, timestamp_offsets, values = self._data.to_lists()
         return timestamps, values, timestamp_offsets
 
+    def to_arrays(self):
+        """Return (timestamps, offsets, values) as numpy arrays.
+        """
+        return self._data.to_arrays()
+
     @abc.abstractmethod
     def _storage_item_at(self, index):
         pass
@@ -448,6 +494,12 @@ class BaseTimeseries(object, metaclass=abc.ABCMeta):
     def insert_storage_item(self, index):
         pass
 
+    def insert_storage_items(self, items):
+        counter = 0
+        for timestamp, by in items:
+            counter += self.insert_storage_item(timestamp, by)
+        return counter
+
     @abc.abstractmethod
     def insert_point(self, dt, value):
         pass
@@ -455,10 +507,22 @@ class BaseTimeseries(object, metaclass=abc.ABCMeta):
 
 class FastFloatTimeseries(BaseTimeseries):
     __container__ = FloatTSList
+    _storage_item = struct.Struct("=Bif")
 
     def insert_point(self, dt, value):
         return self._data.insert_datetime(dt, float(value))
 
+    def insert(self, series):
+        timestamps = []
+        offsets = []
+        values = []
+        for dt, value in series:
+            timestamp, offset = extract_ts(dt)
+            timestamps.append(timestamp)
+            offsets.append(offset)
+            values.append(float(value))
+        return self._data.insert_many(timestamps, offsets, values)
+
     def _storage_item_at(self, index):
         assert 0 <= index < len(self)
         item = self._data.at_index(index)
@@ -472,6 +536,39 @@ class FastFloatTimeseries(BaseTimeseries):
         value = float(struct.unpack("f", by[5:9])[0])
         return self._data.insert(ts=timestamp, ts_offset=offset, value=value)
 
+    def insert_storage_items(self, items):
+        timestamps = []
+        offsets = []
+        values = []
+        unpack = self._storage_item.unpack
+        for timestamp, by in items:
+            f, offset, value = unpack(by[0:9])
+            assert f == 1
+            timestamps.append(timestamp)
+            offsets.append(offset)
+            values.append(value)
+        return self._data.insert_many(timestamps, offsets, values)
+
+    def insert_columns(self, timestamps, offsets, values):
+        return self._data.insert_many(timestamps, offsets, values)
+
+    def insert_storage_block(self, by):
+        return self._data.insert_block(by)
+
+    def to_storage_block(self):
+        return self._data.to_block()
+
+    def daily_columns(self):
+        """Yield (day, timestamps, offsets, values) for every utc day.
+        """
+        timestamps, offsets, values = self._data.to_lists()
+        i = 0
+        while i < len(timestamps):
+            day = ts_daily_left(timestamps[i])
+            j = bisect.bisect_left(timestamps, day + 24*60*60, i)
+            yield (day, timestamps[i:j], offsets[i:j], values[i:j])
+            i = j
+
     @classmethod
     def from_proto_bytes(cls, b):
         f = FloatTimeSeries()
@@ -481,16 +578,15 @@ class FastFloatTimeseries(BaseTimeseries):
     @classmethod
     def from_proto(cls, p):
         i = cls(p.key, p.metric)
-        for ts, ts_offset, value in zip(p.timestamps, p.timestamp_offsets, p.values):
-            i._data.insert(ts=ts, ts_offset=ts_offset, value=float(value))
+        i.insert_columns(p.timestamps, p.timestamp_offsets, p.values)
         return i
 
     def to_proto(self):
         fts = FloatTimeSeries()
-        for ts, ts_offset, value in self._data:
-            fts.values.append(value)
-            fts.timestamps.append(ts)
-            fts.timestamp_offsets.append(ts_offset)
+        timestamps, timestamp_offsets, values = self._data.to_lists()
+        fts.values.extend(values)
+        fts.timestamps.extend(timestamps)
+        fts.timestamp_offsets.extend(timestamp_offsets)
         fts.metric = self.metric
         fts.key = self.key
         return fts
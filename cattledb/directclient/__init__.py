@@ -7,7 +7,7 @@ import pendulum
 import time
 
 from datetime import datetime
-from functools import partial
+from functools import partial, wraps
 
 from ..storage.connection import Connection
 from ..storage.models import TimeSeries, EventList, MetaDataItem, FastDictTimeseries
@@ -52,6 +52,17 @@ def to_pendulum(dt, allow_int=True):
         raise ValueError("dt is not instance of pendulum or python datetime")
 
 
+def _releases_engine(func):
+    # the engine of the calling thread goes back to the pool after every call
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            self.db.release_engine()
+    return wrapper
+
+
 class CDBClient(object):
     _enforce_read_only = False
 
@@ -76,12 +87,15 @@ class CDBClient(object):
     def get_connection(self):
         return self.db
 
+    @_releases_engine
     def info(self):
         return self.db.info()
 
+    @_releases_engine
     def service_init(self):
         return self.db.service_init()
 
+    @_releases_engine
     def get_database_structure(self):
         return self.db.read_database_structure()
 
@@ -89,28 +103,52 @@ class CDBClient(object):
     # Timeseries
     # --------------------------------------------------------------------------
 
+    @_releases_engine
     def get_timeseries(self, key, metrics, from_datetime, to_datetime):
         from_ts = to_pendulum(from_datetime).int_timestamp
         to_ts = to_pendulum(to_datetime).int_timestamp
         return self.db.timeseries.get_timeseries(key, metrics, from_ts, to_ts)
 
+    def get_timeseries_multi(self, keys, metrics, from_datetime, to_datetime):
+        from_ts = to_pendulum(from_datetime).int_timestamp
+        to_ts = to_pendulum(to_datetime).int_timestamp
+        try:
+            for item in self.db.timeseries.get_timeseries_multi(keys, metrics, from_ts, to_ts):
+                yield item
+        finally:
+            self.db.release_engine()
+
+    @_releases_engine
+    def get_aggregated_timeseries(self, key, metric, from_datetime, to_datetime, aggregation_span="hourly",
+                                  aggregation_type="mean"):
+        from_ts = to_pendulum(from_datetime).int_timestamp
+        to_ts = to_pendulum(to_datetime).int_timestamp
+        return self.db.timeseries.get_aggregated_timeseries(key, metric, from_ts, to_ts,
+                                                            aggregation_span=aggregation_span,
+                                                            aggregation_type=aggregation_type)
+
+    @_releases_engine
     def delete_timeseries(self, key, metrics, from_datetime, to_datetime):
         self.raise_on_read_only()
         from_ts = to_pendulum(from_datetime).int_timestamp
         to_ts = to_pendulum(to_datetime).int_timestamp
         return self.db.timeseries.delete_timeseries(key, metrics, from_ts, to_ts)
 
+    @_releases_engine
     def get_last_value(self, key, metrics):
         return self.db.timeseries.get_last_value(key, metrics)
 
+    @_releases_engine
     def get_last_values(self, key, metrics):
         return self.db.timeseries.get_last_values(key, metrics)
 
+    @_releases_engine
     def put_timeseries(self, key, metric, data):
         self.raise_on_read_only()
         ts = TimeSeries(key, metric, values=data)
         return self.db.timeseries.insert_timeseries(ts)
 
+    @_releases_engine
     def put_timeseries_multi(self, data):
         self.raise_on_read_only()
         res = []
@@ -119,10 +157,12 @@ class CDBClient(object):
             res.append(self.db.timeseries.insert_timeseries(ts))
         return res
 
+    @_releases_engine
     def get_multi_metrics(self, key, metrics, from_datetime, to_datetime):
         all_timeseries = self.get_timeseries(key, metrics, from_datetime, to_datetime)
         return FastDictTimeseries.from_float_timeseries(*all_timeseries)
 
+    @_releases_engine
     def get_all_metrics(self, key, from_datetime, to_datetime):
         from_ts = to_pendulum(from_datetime).int_timestamp
         to_ts = to_pendulum(to_datetime).int_timestamp
@@ -131,6 +171,7 @@ class CDBClient(object):
             return FastDictTimeseries.from_float_timeseries(*all_timeseries)
         return None
 
+    @_releases_engine
     def get_full_timeseries(self, key):
         all_timeseries = self.db.timeseries.get_full_timeseries(key)
         if len(all_timeseries) > 0:
@@ -141,19 +182,23 @@ class CDBClient(object):
     # Events
     # --------------------------------------------------------------------------
 
+    @_releases_engine
     def put_events(self, key, name, events):
         self.raise_on_read_only()
         ev = EventList(key, name, events)
         return self.db.events.insert_events(ev)
 
+    @_releases_engine
     def get_events(self, key, name, from_datetime, to_datetime):
         from_ts = to_pendulum(from_datetime).int_timestamp
         to_ts = to_pendulum(to_datetime).int_timestamp
         return self.db.events.get_events(key, name, from_ts, to_ts)
 
+    @_releases_engine
     def get_last_events(self, key, name):
         return self.db.events.get_last_events(key, name)
 
+    @_releases_engine
     def delete_events(self, key, name, from_datetime, to_datetime):
         self.raise_on_read_only()
         from_ts = to_pendulum(from_datetime).int_timestamp
@@ -164,6 +209,7 @@ class CDBClient(object):
     # Metadata
     # --------------------------------------------------------------------------
 
+    @_releases_engine
     def put_metadata(self, object_name, object_key, namespace, data, internal=False):
         self.raise_on_read_only()
         if not isinstance(data, dict):
@@ -171,6 +217,7 @@ class CDBClient(object):
         md = MetaDataItem(object_name, object_key, namespace, data)
         return self.db.metadata.put_metadata_items([md], internal=internal)
 
+    @_releases_engine
     def get_metadata(self, object_name, object_key, namespaces=None, internal=False):
         return self.db.metadata.get_metadata(object_name, object_key, keys=namespaces, internal=internal)
 
@@ -178,20 +225,30 @@ class CDBClient(object):
     # Activity
     # --------------------------------------------------------------------------
 
+    @_releases_engine
     def incr_activity(self, reader_id, device_id, timestamp, parent_ids=None, value=1):
         self.raise_on_read_only()
         ts = to_pendulum(timestamp, allow_int=True).int_timestamp
         return self.db.activity.incr_activity(reader_id, device_id,
                                               timestamp=ts, parent_ids=parent_ids, value=value)
 
+    @_releases_engine
+    def incr_activity_bulk(self, items):
+        self.raise_on_read_only()
+        items = [dict(i, timestamp=to_pendulum(i["timestamp"], allow_int=True).int_timestamp) for i in items]
+        return self.db.activity.incr_activity_bulk(items)
+
+    @_releases_engine
     def get_total_activity(self, day):
         day_ts = to_pendulum(day, allow_int=True).int_timestamp
         return self.db.activity.get_total_activity_for_day(day_ts)
 
+    @_releases_engine
     def get_day_activity(self, parent_id, day):
         day_ts = to_pendulum(day, allow_int=True).int_timestamp
         return self.db.activity.get_activity_for_day(parent_id, day_ts)
 
+    @_releases_engine
     def get_reader_activity(self, reader_id, from_datetime, to_datetime):
         from_ts = to_pendulum(from_datetime).int_timestamp
         to_ts = to_pendulum(to_datetime).int_timestamp
@@ -244,6 +301,10 @@ class AsyncCDBClient(object):
         call = partial(self._client.get_timeseries, *args, **kwargs)
         return await self.loop.run_in_executor(self.executor, call)
 
+    async def get_aggregated_timeseries(self, *args, **kwargs):
+        call = partial(self._client.get_aggregated_timeseries, *args, **kwargs)
+        return await self.loop.run_in_executor(self.executor, call)
+
     async def delete_timeseries(self, *args, **kwargs):
         call = partial(self._client.delete_timeseries, *args, **kwargs)
         return await self.loop.run_in_executor(self.executor, call)
@@ -312,6 +373,10 @@ class AsyncCDBClient(object):
         call = partial(self._client.incr_activity, *args, **kwargs)
         return await self.loop.run_in_executor(self.executor, call)
 
+    async def incr_activity_bulk(self, *args, **kwargs):
+        call = partial(self._client.incr_activity_bulk, *args, **kwargs)
+        return await self.loop.run_in_executor(self.executor, call)
+
     async def get_total_activity(self, *args, **kwargs):
         call = partial(self._client.get_total_activity, *args, **kwargs)
         return await self.loop.run_in_executor(self.executor, call)
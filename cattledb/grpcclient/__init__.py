@@ -102,6 +102,28 @@ class CDBClient(object):
         res = self.timeseries.putMulti(l)
         return int(res.counter)
 
+    def stream_timeseries(self, key, metrics, from_datetime, to_datetime):
+        """Generator yielding a list of TimeSeries for every day with data, newest day first.
+        """
+        req = cdb_pb2.MultiTimeSeriesRequest(key=key, metrics=metrics,
+                                            from_datetime=from_datetime.isoformat(),
+                                            to_datetime=to_datetime.isoformat())
+        for ts in self.timeseries.getStream(req):
+            yield [TimeSeries.from_proto(t) for t in ts.data]
+
+    def put_timeseries_stream(self, data):
+        """Streams an iterable of dicts (key, metric, data) to the server.
+        """
+        self.raise_on_read_only()
+
+        def gen():
+            for item in data:
+                ts = TimeSeries(item["key"], item["metric"], values=item["data"])
+                yield ts.to_proto()
+
+        res = self.timeseries.putStream(gen())
+        return int(res.counter)
+
     # --------------------------------------------------------------------------
     # Events
     # --------------------------------------------------------------------------
@@ -120,6 +142,28 @@ class CDBClient(object):
         ts = self.events.get(req)
         return EventList.from_proto(ts)
 
+    def stream_events(self, key, name, from_datetime, to_datetime):
+        """Generator yielding an EventList for every row (day or month) with events.
+        """
+        req = cdb_pb2.EventsRequest(key=key, name=name,
+                                    from_datetime=from_datetime.isoformat(),
+                                    to_datetime=to_datetime.isoformat())
+        for ts in self.events.getStream(req):
+            yield EventList.from_proto(ts)
+
+    def put_events_stream(self, data):
+        """Streams an iterable of dicts (key, name, events) to the server.
+        """
+        self.raise_on_read_only()
+
+        def gen():
+            for item in data:
+                ev = EventList(item["key"], item["name"], item["events"])
+                yield ev.to_proto()
+
+        res = self.events.putStream(gen())
+        return int(res.counter)
+
     def get_last_events(self, key, name):
         req = cdb_pb2.LastEventsRequest(key=key, name=name)
         ts = self.events.lastEvents(req)
@@ -13,15 +13,52 @@ from .cdb_pb2_grpc import add_TimeSeriesServicer_to_server, add_EventsServicer_t
 logger = logging.getLogger(__name__)
 
 
+class _ReleaseEngineInterceptor(grpc.ServerInterceptor):
+    """Returns the engine of the worker thread to the pool after every call."""
+    def __init__(self, db_connection):
+        self.db = db_connection
+
+    def _wrap(self, behavior, streaming):
+        db = self.db
+
+        def call(request, context):
+            try:
+                return behavior(request, context)
+            finally:
+                db.release_engine()
+
+        def stream(request, context):
+            try:
+                for response in behavior(request, context):
+                    yield response
+            finally:
+                db.release_engine()
+
+        return stream if streaming else call
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return None
+        if handler.unary_unary is not None:
+            return handler._replace(unary_unary=self._wrap(handler.unary_unary, False))
+        if handler.unary_stream is not None:
+            return handler._replace(unary_stream=self._wrap(handler.unary_stream, True))
+        if handler.stream_unary is not None:
+            return handler._replace(stream_unary=self._wrap(handler.stream_unary, False))
+        return handler._replace(stream_stream=self._wrap(handler.stream_stream, True))
+
+
 def _create_server(config):
     from ..core.helper import setup_logging
     setup_logging(config)
 
     from ..storage.connection import Connection
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=config.POOL_SIZE))
 
     # Setup DB
     db_connection = Connection.from_config(config)
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=config.POOL_SIZE),
+                         interceptors=[_ReleaseEngineInterceptor(db_connection)])
     server.db = db_connection
 
     from .services import TimeSeriesServicer
@@ -40,19 +77,53 @@ def _create_server(config):
     return server
 
 
-def create_server_by_configfile(configfile=None):
+def _create_aio_server(config):
+    # has to be called from inside the running event loop
+    from ..core.helper import setup_logging
+    setup_logging(config)
+
+    from ..storage.connection import Connection
+    server = grpc.aio.server()
+
+    # Setup DB
+    db_connection = Connection.from_config(config)
+    server.db = db_connection
+
+    # storage calls run on a fixed pool, every worker keeps its own engine
+    pool_size = config.POOL_SIZE if db_connection.threaded_engines else 1
+    executor = futures.ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="cdb-grpc")
+    server.executor = executor
+
+    from .aioservices import AsyncTimeSeriesServicer
+    add_TimeSeriesServicer_to_server(AsyncTimeSeriesServicer(db_connection, executor), server)
+    from .aioservices import AsyncEventsServicer
+    add_EventsServicer_to_server(AsyncEventsServicer(db_connection, executor), server)
+    from .aioservices import AsyncMetaDataServicer
+    add_MetaDataServicer_to_server(AsyncMetaDataServicer(db_connection, executor), server)
+    from .aioservices import AsyncActivityServicer
+    add_ActivityServicer_to_server(AsyncActivityServicer(db_connection, executor), server)
+
+    return server
+
+
+def _load_config(configfile=None):
     from ..core.helper import import_config_file
     from ..settings import default as _default_config
 
     if configfile:
         _imported = import_config_file(configfile)
         logger.warning("Using Config: {}".format(configfile))
-        config = _imported
-    else:
-        config = _default_config
-        logger.warning("Using Default Config")
+        return _imported
+    logger.warning("Using Default Config")
+    return _default_config
+
+
+def create_server_by_configfile(configfile=None):
+    return _create_server(_load_config(configfile))
+
 
-    return _create_server(config)
+def create_aio_server_by_configfile(configfile=None):
+    return _create_aio_server(_load_config(configfile))
 
 
 # def create_server_by_config(config_name=None):
@@ -0,0 +1,172 @@
+#!/usr/bin/python
+# coding: utf-8
+
+"""Coroutine servicers for the grpc.aio server.
+
+Every call runs the matching synchronous servicer from services.py on a fixed
+size executor. In-flight requests only hold a coroutine, the executor bounds
+the concurrent storage calls and therefore the number of engines.
+"""
+
+import asyncio
+
+from . import services
+from .cdb_pb2_grpc import TimeSeriesServicer, ActivityServicer, MetaDataServicer, EventsServicer
+
+
+_DONE = object()
+
+
+class _ContextProxy(object):
+    """Collects status changes made in a worker thread.
+    They are applied to the aio context on the event loop.
+    """
+    def __init__(self, context):
+        self._context = context
+        self._code = None
+        self._details = None
+
+    def set_code(self, code):
+        self._code = code
+
+    def set_details(self, details):
+        self._details = details
+
+    def is_active(self):
+        return not self._context.done()
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+    def apply(self):
+        if self._code is not None:
+            self._context.set_code(self._code)
+        if self._details is not None:
+            self._context.set_details(self._details)
+
+
+class _AsyncServicer(object):
+    def __init__(self, servicer, executor):
+        self._servicer = servicer
+        self._executor = executor
+
+    def _call(self, func, *args):
+        # runs in the worker, its engine goes back to the pool after every job
+        try:
+            return func(*args)
+        finally:
+            self._servicer.db.release_engine()
+
+    async def _unary(self, method, request, context):
+        loop = asyncio.get_running_loop()
+        proxy = _ContextProxy(context)
+        try:
+            return await loop.run_in_executor(self._executor, self._call, method, request, proxy)
+        finally:
+            proxy.apply()
+
+    async def _unary_stream(self, method, request, context):
+        loop = asyncio.get_running_loop()
+        proxy = _ContextProxy(context)
+        gen = method(request, proxy)
+        try:
+            while True:
+                item = await loop.run_in_executor(self._executor, self._call, next, gen, _DONE)
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            gen.close()
+            proxy.apply()
+
+    async def _stream_unary(self, method, request_iterator, context):
+        loop = asyncio.get_running_loop()
+        proxy = _ContextProxy(context)
+        # the messages are read on the event loop, a slow client does not hold a worker
+        messages = [m async for m in request_iterator]
+        try:
+            return await loop.run_in_executor(self._executor, self._call, method, iter(messages), proxy)
+        finally:
+            proxy.apply()
+
+
+class AsyncTimeSeriesServicer(_AsyncServicer, TimeSeriesServicer):
+    def __init__(self, db_instance, executor):
+        super(AsyncTimeSeriesServicer, self).__init__(services.TimeSeriesServicer(db_instance), executor)
+
+    async def get(self, request, context):
+        return await self._unary(self._servicer.get, request, context)
+
+    async def getMulti(self, request, context):
+        return await self._unary(self._servicer.getMulti, request, context)
+
+    async def lastValues(self, request, context):
+        return await self._unary(self._servicer.lastValues, request, context)
+
+    async def getStream(self, request, context):
+        async for item in self._unary_stream(self._servicer.getStream, request, context):
+            yield item
+
+    async def put(self, request, context):
+        return await self._unary(self._servicer.put, request, context)
+
+    async def putMulti(self, request, context):
+        return await self._unary(self._servicer.putMulti, request, context)
+
+    async def putStream(self, request_iterator, context):
+        return await self._stream_unary(self._servicer.putStream, request_iterator, context)
+
+    async def delete(self, request, context):
+        return await self._unary(self._servicer.delete, request, context)
+
+
+class AsyncEventsServicer(_AsyncServicer, EventsServicer):
+    def __init__(self, db_instance, executor):
+        super(AsyncEventsServicer, self).__init__(services.EventsServicer(db_instance), executor)
+
+    async def get(self, request, context):
+        return await self._unary(self._servicer.get, request, context)
+
+    async def lastEvents(self, request, context):
+        return await self._unary(self._servicer.lastEvents, request, context)
+
+    async def getStream(self, request, context):
+        async for item in self._unary_stream(self._servicer.getStream, request, context):
+            yield item
+
+    async def put(self, request, context):
+        return await self._unary(self._servicer.put, request, context)
+
+    async def putStream(self, request_iterator, context):
+        return await self._stream_unary(self._servicer.putStream, request_iterator, context)
+
+    async def delete(self, request, context):
+        return await self._unary(self._servicer.delete, request, context)
+
+
+class AsyncMetaDataServicer(_AsyncServicer, MetaDataServicer):
+    def __init__(self, db_instance, executor):
+        super(AsyncMetaDataServicer, self).__init__(services.MetaDataServicer(db_instance), executor)
+
+    async def get(self, request, context):
+        return await self._unary(self._servicer.get, request, context)
+
+    async def put(self, request, context):
+        return await self._unary(self._servicer.put, request, context)
+
+
+class AsyncActivityServicer(_AsyncServicer, ActivityServicer):
+    def __init__(self, db_instance, executor):
+        super(AsyncActivityServicer, self).__init__(services.ActivityServicer(db_instance), executor)
+
+    async def getTotal(self, request, context):
+        return await self._unary(self._servicer.getTotal, request, context)
+
+    async def getDay(self, request, context):
+        return await self._unary(self._servicer.getDay, request, context)
+
+    async def getReader(self, request, context):
+        return await self._unary(self._servicer.getReader, request, context)
+
+    async def increment(self, request, context):
+        return await self._unary(self._servicer.increment, request, context)
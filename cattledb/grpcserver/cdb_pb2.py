@@ -19,7 +19,7 @@ DESCRIPTOR = _descriptor.FileDescriptor(
   name='cdb.proto',
   package='',
   syntax='proto3',
-  serialized_pb=_b('\n\tcdb.proto\"\\\n\x11TimeSeriesRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x0e\n\x06metric\x18\x02 \x01(\t\x12\x15\n\rfrom_datetime\x18\x03 \x01(\t\x12\x13\n\x0bto_datetime\x18\x04 \x01(\t\"b\n\x16MultiTimeSeriesRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x15\n\rfrom_datetime\x18\x03 \x01(\t\x12\x13\n\x0bto_datetime\x18\x04 \x01(\t\x12\x0f\n\x07metrics\x18\x06 \x03(\t\"b\n\x11LastValuesRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05\x63ount\x18\x02 \x01(\x05\x12\x10\n\x08max_days\x18\x03 \x01(\x05\x12\x0e\n\x06max_ts\x18\x04 \x01(\t\x12\x0f\n\x07metrics\x18\x06 \x03(\t\"V\n\rEventsRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\x15\n\rfrom_datetime\x18\x03 \x01(\t\x12\x13\n\x0bto_datetime\x18\x04 \x01(\t\"_\n\x11LastEventsRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\r\n\x05\x63ount\x18\x03 \x01(\x05\x12\x10\n\x08max_days\x18\x04 \x01(\x05\x12\x0e\n\x06max_ts\x18\x05 \x01(\t\"v\n\x18IncrementActivityRequest\x12\x11\n\treader_id\x18\x01 \x01(\t\x12\x11\n\tdevice_id\x18\x02 \x01(\t\x12\x11\n\ttimestamp\x18\x03 \x01(\t\x12\r\n\x05value\x18\x04 \x01(\x05\x12\x12\n\nparent_ids\x18\x05 \x03(\t\",\n\x14TotalActivityRequest\x12\x14\n\x0c\x64\x61y_datetime\x18\x01 \x01(\t\"=\n\x12\x41\x63tivityDayRequest\x12\x11\n\tparent_id\x18\x02 \x01(\t\x12\x14\n\x0c\x64\x61y_datetime\x18\x01 \x01(\t\"V\n\x15ReaderActivityRequest\x12\x11\n\treader_id\x18\x01 \x01(\t\x12\x15\n\rfrom_datetime\x18\x02 \x01(\t\x12\x13\n\x0bto_datetime\x18\x03 \x01(\t\"7\n\x10\x41\x63tivityResponse\x12#\n\nactivities\x18\x01 \x03(\x0b\x32\x0f.ReaderActivity\"=\n\x16\x44\x65viceActivityResponse\x12#\n\nactivities\x18\x01 \x03(\x0b\x32\x0f.DeviceActivity\"F\n\x0e\x44\x65viceActivity\x12\x10\n\x08\x64\x61y_hour\x18\x01 \x01(\t\x12\x11\n\tdevice_id\x18\x02 \x01(\t\x12\x0f\n\x07\x63ounter\x18\x04 \x01(\x05\"I\n\x0eReaderActivity\x12\x10\n\x08\x64\x61y_hour\x18\x01 \x01(\t\x12\x11\n\treader_id\x18\x02 \x01(\t\x12\x12\n\ndevice_ids\x18\x04 \x03(\t\"`\n\x0fMetaDataRequest\x12\x13\n\x0bobject_name\x18\x01 \x01(\t\x12\x12\n\nobject_key\x18\x02 \x01(\t\x12\x12\n\nnamespaces\x18\x03 \x03(\t\x12\x10\n\x08internal\x18\x04 \x01(\x08\"X\n\x10MetaDataResponse\x12\x13\n\x0bobject_name\x18\x01 \x01(\t\x12\x12\n\nobject_key\x18\x02 \x01(\t\x12\x1b\n\x04\x64\x61ta\x18\x03 \x03(\x0b\x32\r.MetaDataDict\"f\n\x0cMetaDataPost\x12\x13\n\x0bobject_name\x18\x01 \x01(\t\x12\x12\n\nobject_key\x18\x02 \x01(\t\x12\x1b\n\x04\x64\x61ta\x18\x03 \x03(\x0b\x32\r.MetaDataDict\x12\x10\n\x08internal\x18\x04 \x01(\x08\"7\n\x0cMetaDataDict\x12\x11\n\tnamespace\x18\x01 \x01(\t\x12\x14\n\x05pairs\x18\x02 \x03(\x0b\x32\x05.Pair\";\n\tPutResult\x12\x0c\n\x04\x63ode\x18\x01 \x01(\x05\x12\x0f\n\x07\x63ounter\x18\x02 \x01(\x03\x12\x0f\n\x07message\x18\x03 \x01(\t\">\n\x0c\x44\x65leteResult\x12\x0c\n\x04\x63ode\x18\x01 \x01(\x05\x12\x0f\n\x07\x63ounter\x18\x02 \x01(\x03\x12\x0f\n\x07message\x18\x03 \x01(\t\"*\n\tFloatItem\x12\x0e\n\x06offset\x18\x01 \x01(\x11\x12\r\n\x05value\x18\x02 \x01(\x02\")\n\x08\x42lobItem\x12\x0e\n\x06offset\x18\x01 \x01(\x11\x12\r\n\x05value\x18\x02 \x01(\x0c\"\"\n\x04Pair\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t\"\"\n\nDictionary\x12\x14\n\x05pairs\x18\x01 \x03(\x0b\x32\x05.Pair\"y\n\x0e\x44ictTimeSeries\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x0e\n\x06metric\x18\x02 \x01(\t\x12\x12\n\ntimestamps\x18\x03 \x03(\x03\x12\x1b\n\x06values\x18\x04 \x03(\x0b\x32\x0b.Dictionary\x12\x19\n\x11timestamp_offsets\x18\x05 \x03(\x11\"t\n\x0b\x45ventSeries\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\x12\n\ntimestamps\x18\x03 \x03(\x03\x12\x1b\n\x06values\x18\x04 \x03(\x0b\x32\x0b.Dictionary\x12\x19\n\x11timestamp_offsets\x18\x05 \x03(\x11\"m\n\x0f\x46loatTimeSeries\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x0e\n\x06metric\x18\x02 \x01(\t\x12\x12\n\ntimestamps\x18\x03 \x03(\x03\x12\x0e\n\x06values\x18\x04 \x03(\x02\x12\x19\n\x11timestamp_offsets\x18\x05 \x03(\x11\"5\n\x13\x46loatTimeSeriesList\x12\x1e\n\x04\x64\x61ta\x18\x01 \x03(\x0b\x32\x10.FloatTimeSeries2\xbd\x02\n\nTimeSeries\x12-\n\x03get\x12\x12.TimeSeriesRequest\x1a\x10.FloatTimeSeries\"\x00\x12;\n\x08getMulti\x12\x17.MultiTimeSeriesRequest\x1a\x14.FloatTimeSeriesList\"\x00\x12\x38\n\nlastValues\x12\x12.LastValuesRequest\x1a\x14.FloatTimeSeriesList\"\x00\x12%\n\x03put\x12\x10.FloatTimeSeries\x1a\n.PutResult\"\x00\x12.\n\x08putMulti\x12\x14.FloatTimeSeriesList\x1a\n.PutResult\"\x00\x12\x32\n\x06\x64\x65lete\x12\x17.MultiTimeSeriesRequest\x1a\r.DeleteResult\"\x00\x32\xaf\x01\n\x06\x45vents\x12%\n\x03get\x12\x0e.EventsRequest\x1a\x0c.EventSeries\"\x00\x12\x30\n\nlastEvents\x12\x12.LastEventsRequest\x1a\x0c.EventSeries\"\x00\x12!\n\x03put\x12\x0c.EventSeries\x1a\n.PutResult\"\x00\x12)\n\x06\x64\x65lete\x12\x0e.EventsRequest\x1a\r.DeleteResult\"\x00\x32\xec\x01\n\x08\x41\x63tivity\x12\x36\n\x08getTotal\x12\x15.TotalActivityRequest\x1a\x11.ActivityResponse\"\x00\x12\x32\n\x06getDay\x12\x13.ActivityDayRequest\x1a\x11.ActivityResponse\"\x00\x12>\n\tgetReader\x12\x16.ReaderActivityRequest\x1a\x17.DeviceActivityResponse\"\x00\x12\x34\n\tincrement\x12\x19.IncrementActivityRequest\x1a\n.PutResult\"\x00\x32\\\n\x08MetaData\x12,\n\x03get\x12\x10.MetaDataRequest\x1a\x11.MetaDataResponse\"\x00\x12\"\n\x03put\x12\r.MetaDataPost\x1a\n.PutResult\"\x00\x62\x06proto3')
+  serialized_pb=_b('\n\tcdb.proto\"\\\n\x11TimeSeriesRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x0e\n\x06metric\x18\x02 \x01(\t\x12\x15\n\rfrom_datetime\x18\x03 \x01(\t\x12\x13\n\x0bto_datetime\x18\x04 \x01(\t\"b\n\x16MultiTimeSeriesRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x15\n\rfrom_datetime\x18\x03 \x01(\t\x12\x13\n\x0bto_datetime\x18\x04 \x01(\t\x12\x0f\n\x07metrics\x18\x06 \x03(\t\"b\n\x11LastValuesRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05\x63ount\x18\x02 \x01(\x05\x12\x10\n\x08max_days\x18\x03 \x01(\x05\x12\x0e\n\x06max_ts\x18\x04 \x01(\t\x12\x0f\n\x07metrics\x18\x06 \x03(\t\"V\n\rEventsRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\x15\n\rfrom_datetime\x18\x03 \x01(\t\x12\x13\n\x0bto_datetime\x18\x04 \x01(\t\"_\n\x11LastEventsRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\r\n\x05\x63ount\x18\x03 \x01(\x05\x12\x10\n\x08max_days\x18\x04 \x01(\x05\x12\x0e\n\x06max_ts\x18\x05 \x01(\t\"v\n\x18IncrementActivityRequest\x12\x11\n\treader_id\x18\x01 \x01(\t\x12\x11\n\tdevice_id\x18\x02 \x01(\t\x12\x11\n\ttimestamp\x18\x03 \x01(\t\x12\r\n\x05value\x18\x04 \x01(\x05\x12\x12\n\nparent_ids\x18\x05 \x03(\t\",\n\x14TotalActivityRequest\x12\x14\n\x0c\x64\x61y_datetime\x18\x01 \x01(\t\"=\n\x12\x41\x63tivityDayRequest\x12\x11\n\tparent_id\x18\x02 \x01(\t\x12\x14\n\x0c\x64\x61y_datetime\x18\x01 \x01(\t\"V\n\x15ReaderActivityRequest\x12\x11\n\treader_id\x18\x01 \x01(\t\x12\x15\n\rfrom_datetime\x18\x02 \x01(\t\x12\x13\n\x0bto_datetime\x18\x03 \x01(\t\"7\n\x10\x41\x63tivityResponse\x12#\n\nactivities\x18\x01 \x03(\x0b\x32\x0f.ReaderActivity\"=\n\x16\x44\x65viceActivityResponse\x12#\n\nactivities\x18\x01 \x03(\x0b\x32\x0f.DeviceActivity\"F\n\x0e\x44\x65viceActivity\x12\x10\n\x08\x64\x61y_hour\x18\x01 \x01(\t\x12\x11\n\tdevice_id\x18\x02 \x01(\t\x12\x0f\n\x07\x63ounter\x18\x04 \x01(\x05\"I\n\x0eReaderActivity\x12\x10\n\x08\x64\x61y_hour\x18\x01 \x01(\t\x12\x11\n\treader_id\x18\x02 \x01(\t\x12\x12\n\ndevice_ids\x18\x04 \x03(\t\"`\n\x0fMetaDataRequest\x12\x13\n\x0bobject_name\x18\x01 \x01(\t\x12\x12\n\nobject_key\x18\x02 \x01(\t\x12\x12\n\nnamespaces\x18\x03 \x03(\t\x12\x10\n\x08internal\x18\x04 \x01(\x08\"X\n\x10MetaDataResponse\x12\x13\n\x0bobject_name\x18\x01 \x01(\t\x12\x12\n\nobject_key\x18\x02 \x01(\t\x12\x1b\n\x04\x64\x61ta\x18\x03 \x03(\x0b\x32\r.MetaDataDict\"f\n\x0cMetaDataPost\x12\x13\n\x0bobject_name\x18\x01 \x01(\t\x12\x12\n\nobject_key\x18\x02 \x01(\t\x12\x1b\n\x04\x64\x61ta\x18\x03 \x03(\x0b\x32\r.MetaDataDict\x12\x10\n\x08internal\x18\x04 \x01(\x08\"7\n\x0cMetaDataDict\x12\x11\n\tnamespace\x18\x01 \x01(\t\x12\x14\n\x05pairs\x18\x02 \x03(\x0b\x32\x05.Pair\";\n\tPutResult\x12\x0c\n\x04\x63ode\x18\x01 \x01(\x05\x12\x0f\n\x07\x63ounter\x18\x02 \x01(\x03\x12\x0f\n\x07message\x18\x03 \x01(\t\">\n\x0c\x44\x65leteResult\x12\x0c\n\x04\x63ode\x18\x01 \x01(\x05\x12\x0f\n\x07\x63ounter\x18\x02 \x01(\x03\x12\x0f\n\x07message\x18\x03 \x01(\t\"*\n\tFloatItem\x12\x0e\n\x06offset\x18\x01 \x01(\x11\x12\r\n\x05value\x18\x02 \x01(\x02\")\n\x08\x42lobItem\x12\x0e\n\x06offset\x18\x01 \x01(\x11\x12\r\n\x05value\x18\x02 \x01(\x0c\"\"\n\x04Pair\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t\"\"\n\nDictionary\x12\x14\n\x05pairs\x18\x01 \x03(\x0b\x32\x05.Pair\"y\n\x0e\x44ictTimeSeries\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x0e\n\x06metric\x18\x02 \x01(\t\x12\x12\n\ntimestamps\x18\x03 \x03(\x03\x12\x1b\n\x06values\x18\x04 \x03(\x0b\x32\x0b.Dictionary\x12\x19\n\x11timestamp_offsets\x18\x05 \x03(\x11\"t\n\x0b\x45ventSeries\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\x12\n\ntimestamps\x18\x03 \x03(\x03\x12\x1b\n\x06values\x18\x04 \x03(\x0b\x32\x0b.Dictionary\x12\x19\n\x11timestamp_offsets\x18\x05 \x03(\x11\"m\n\x0f\x46loatTimeSeries\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x0e\n\x06metric\x18\x02 \x01(\t\x12\x12\n\ntimestamps\x18\x03 \x03(\x03\x12\x0e\n\x06values\x18\x04 \x03(\x02\x12\x19\n\x11timestamp_offsets\x18\x05 \x03(\x11\"5\n\x13\x46loatTimeSeriesList\x12\x1e\n\x04\x64\x61ta\x18\x01 \x03(\x0b\x32\x10.FloatTimeSeries2\xac\x03\n\nTimeSeries\x12-\n\x03get\x12\x12.TimeSeriesRequest\x1a\x10.FloatTimeSeries\"\x00\x12;\n\x08getMulti\x12\x17.MultiTimeSeriesRequest\x1a\x14.FloatTimeSeriesList\"\x00\x12\x38\n\nlastValues\x12\x12.LastValuesRequest\x1a\x14.FloatTimeSeriesList\"\x00\x12>\n\tgetStream\x12\x17.MultiTimeSeriesRequest\x1a\x14.FloatTimeSeriesList\"\x00\x30\x01\x12%\n\x03put\x12\x10.FloatTimeSeries\x1a\n.PutResult\"\x00\x12.\n\x08putMulti\x12\x14.FloatTimeSeriesList\x1a\n.PutResult\"\x00\x12-\n\tputStream\x12\x10.FloatTimeSeries\x1a\n.PutResult\"\x00(\x01\x12\x32\n\x06\x64\x65lete\x12\x17.MultiTimeSeriesRequest\x1a\r.DeleteResult\"\x00\x32\x89\x02\n\x06\x45vents\x12%\n\x03get\x12\x0e.EventsRequest\x1a\x0c.EventSeries\"\x00\x12\x30\n\nlastEvents\x12\x12.LastEventsRequest\x1a\x0c.EventSeries\"\x00\x12-\n\tgetStream\x12\x0e.EventsRequest\x1a\x0c.EventSeries\"\x00\x30\x01\x12!\n\x03put\x12\x0c.EventSeries\x1a\n.PutResult\"\x00\x12)\n\tputStream\x12\x0c.EventSeries\x1a\n.PutResult\"\x00(\x01\x12)\n\x06\x64\x65lete\x12\x0e.EventsRequest\x1a\r.DeleteResult\"\x00\x32\xec\x01\n\x08\x41\x63tivity\x12\x36\n\x08getTotal\x12\x15.TotalActivityRequest\x1a\x11.ActivityResponse\"\x00\x12\x32\n\x06getDay\x12\x13.ActivityDayRequest\x1a\x11.ActivityResponse\"\x00\x12>\n\tgetReader\x12\x16.ReaderActivityRequest\x1a\x17.DeviceActivityResponse\"\x00\x12\x34\n\tincrement\x12\x19.IncrementActivityRequest\x1a\n.PutResult\"\x00\x32\\\n\x08MetaData\x12,\n\x03get\x12\x10.MetaDataRequest\x1a\x11.MetaDataResponse\"\x00\x12\"\n\x03put\x12\r.MetaDataPost\x1a\n.PutResult\"\x00\x62\x06proto3')
 )
 
 
@@ -1489,7 +1489,7 @@ _TIMESERIES = _descriptor.ServiceDescriptor(
   index=0,
   options=None,
   serialized_start=2117,
-  serialized_end=2434,
+  serialized_end=2545,
   methods=[
   _descriptor.MethodDescriptor(
     name='get',
@@ -1518,10 +1518,19 @@ _TIMESERIES = _descriptor.ServiceDescriptor(
     output_type=_FLOATTIMESERIESLIST,
     options=None,
   ),
+  _descriptor.MethodDescriptor(
+    name='getStream',
+    full_name='TimeSeries.getStream',
+    index=3,
+    containing_service=None,
+    input_type=_MULTITIMESERIESREQUEST,
+    output_type=_FLOATTIMESERIESLIST,
+    options=None,
+  ),
   _descriptor.MethodDescriptor(
     name='put',
     full_name='TimeSeries.put',
-    index=3,
+    index=4,
     containing_service=None,
     input_type=_FLOATTIMESERIES,
     output_type=_PUTRESULT,
@@ -1530,16 +1539,25 @@ _TIMESERIES = _descriptor.ServiceDescriptor(
   _descriptor.MethodDescriptor(
     name='putMulti',
     full_name='TimeSeries.putMulti',
-    index=4,
+    index=5,
     containing_service=None,
     input_type=_FLOATTIMESERIESLIST,
     output_type=_PUTRESULT,
     options=None,
   ),
+  _descriptor.MethodDescriptor(
+    name='putStream',
+    full_name='TimeSeries.putStream',
+    index=6,
+    containing_service=None,
+    input_type=_FLOATTIMESERIES,
+    output_type=_PUTRESULT,
+    options=None,
+  ),
   _descriptor.MethodDescriptor(
     name='delete',
     full_name='TimeSeries.delete',
-    index=5,
+    index=7,
     containing_service=None,
     input_type=_MULTITIMESERIESREQUEST,
     output_type=_DELETERESULT,
@@ -1557,8 +1575,8 @@ _EVENTS = _descriptor.ServiceDescriptor(
   file=DESCRIPTOR,
   index=1,
   options=None,
-  serialized_start=2437,
-  serialized_end=2612,
+  serialized_start=2548,
+  serialized_end=2813,
   methods=[
   _descriptor.MethodDescriptor(
     name='get',
@@ -1578,10 +1596,28 @@ _EVENTS = _descriptor.ServiceDescriptor(
     output_type=_EVENTSERIES,
     options=None,
   ),
+  _descriptor.MethodDescriptor(
+    name='getStream',
+    full_name='Events.getStream',
+    index=2,
+    containing_service=None,
+    input_type=_EVENTSREQUEST,
+    output_type=_EVENTSERIES,
+    options=None,
+  ),
   _descriptor.MethodDescriptor(
     name='put',
     full_name='Events.put',
-    index=2,
+    index=3,
+    containing_service=None,
+    input_type=_EVENTSERIES,
+    output_type=_PUTRESULT,
+    options=None,
+  ),
+  _descriptor.MethodDescriptor(
+    name='putStream',
+    full_name='Events.putStream',
+    index=4,
     containing_service=None,
     input_type=_EVENTSERIES,
     output_type=_PUTRESULT,
@@ -1590,7 +1626,7 @@ _EVENTS = _descriptor.ServiceDescriptor(
   _descriptor.MethodDescriptor(
     name='delete',
     full_name='Events.delete',
-    index=3,
+    index=5,
     containing_service=None,
     input_type=_EVENTSREQUEST,
     output_type=_DELETERESULT,
@@ -1608,8 +1644,8 @@ _ACTIVITY = _descriptor.ServiceDescriptor(
   file=DESCRIPTOR,
   index=2,
   options=None,
-  serialized_start=2615,
-  serialized_end=2851,
+  serialized_start=2816,
+  serialized_end=3052,
   methods=[
   _descriptor.MethodDescriptor(
     name='getTotal',
@@ -1659,8 +1695,8 @@ _METADATA = _descriptor.ServiceDescriptor(
   file=DESCRIPTOR,
   index=3,
   options=None,
-  serialized_start=2853,
-  serialized_end=2945,
+  serialized_start=3054,
+  serialized_end=3146,
   methods=[
   _descriptor.MethodDescriptor(
     name='get',
@@ -29,6 +29,11 @@ class TimeSeriesStub(object):
         request_serializer=cdb__pb2.LastValuesRequest.SerializeToString,
         response_deserializer=cdb__pb2.FloatTimeSeriesList.FromString,
         )
+    self.getStream = channel.unary_stream(
+        '/TimeSeries/getStream',
+        request_serializer=cdb__pb2.MultiTimeSeriesRequest.SerializeToString,
+        response_deserializer=cdb__pb2.FloatTimeSeriesList.FromString,
+        )
     self.put = channel.unary_unary(
         '/TimeSeries/put',
         request_serializer=cdb__pb2.FloatTimeSeries.SerializeToString,
@@ -39,6 +44,11 @@ class TimeSeriesStub(object):
         request_serializer=cdb__pb2.FloatTimeSeriesList.SerializeToString,
         response_deserializer=cdb__pb2.PutResult.FromString,
         )
+    self.putStream = channel.stream_unary(
+        '/TimeSeries/putStream',
+        request_serializer=cdb__pb2.FloatTimeSeries.SerializeToString,
+        response_deserializer=cdb__pb2.PutResult.FromString,
+        )
     self.delete = channel.unary_unary(
         '/TimeSeries/delete',
         request_serializer=cdb__pb2.MultiTimeSeriesRequest.SerializeToString,
@@ -71,6 +81,13 @@ class TimeSeriesServicer(object):
     context.set_details('Method not implemented!')
     raise NotImplementedError('Method not implemented!')
 
+  def getStream(self, request, context):
+    # missing associated documentation comment in .proto file
+    pass
+    context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+    context.set_details('Method not implemented!')
+    raise NotImplementedError('Method not implemented!')
+
   def put(self, request, context):
     """push
     """
@@ -85,6 +102,13 @@ class TimeSeriesServicer(object):
     context.set_details('Method not implemented!')
     raise NotImplementedError('Method not implemented!')
 
+  def putStream(self, request_iterator, context):
+    # missing associated documentation comment in .proto file
+    pass
+    context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+    context.set_details('Method not implemented!')
+    raise NotImplementedError('Method not implemented!')
+
   def delete(self, request, context):
     """delete
     """
@@ -110,6 +134,11 @@ def add_TimeSeriesServicer_to_server(servicer, server):
           request_deserializer=cdb__pb2.LastValuesRequest.FromString,
           response_serializer=cdb__pb2.FloatTimeSeriesList.SerializeToString,
       ),
+      'getStream': grpc.unary_stream_rpc_method_handler(
+          servicer.getStream,
+          request_deserializer=cdb__pb2.MultiTimeSeriesRequest.FromString,
+          response_serializer=cdb__pb2.FloatTimeSeriesList.SerializeToString,
+      ),
       'put': grpc.unary_unary_rpc_method_handler(
           servicer.put,
           request_deserializer=cdb__pb2.FloatTimeSeries.FromString,
@@ -120,6 +149,11 @@ def add_TimeSeriesServicer_to_server(servicer, server):
           request_deserializer=cdb__pb2.FloatTimeSeriesList.FromString,
           response_serializer=cdb__pb2.PutResult.SerializeToString,
       ),
+      'putStream': grpc.stream_unary_rpc_method_handler(
+          servicer.putStream,
+          request_deserializer=cdb__pb2.FloatTimeSeries.FromString,
+          response_serializer=cdb__pb2.PutResult.SerializeToString,
+      ),
       'delete': grpc.unary_unary_rpc_method_handler(
           servicer.delete,
           request_deserializer=cdb__pb2.MultiTimeSeriesRequest.FromString,
@@ -151,11 +185,21 @@ class EventsStub(object):
         request_serializer=cdb__pb2.LastEventsRequest.SerializeToString,
         response_deserializer=cdb__pb2.EventSeries.FromString,
         )
+    self.getStream = channel.unary_stream(
+        '/Events/getStream',
+        request_serializer=cdb__pb2.EventsRequest.SerializeToString,
+        response_deserializer=cdb__pb2.EventSeries.FromString,
+        )
     self.put = channel.unary_unary(
         '/Events/put',
         request_serializer=cdb__pb2.EventSeries.SerializeToString,
         response_deserializer=cdb__pb2.PutResult.FromString,
         )
+    self.putStream = channel.stream_unary(
+        '/Events/putStream',
+        request_serializer=cdb__pb2.EventSeries.SerializeToString,
+        response_deserializer=cdb__pb2.PutResult.FromString,
+        )
     self.delete = channel.unary_unary(
         '/Events/delete',
         request_serializer=cdb__pb2.EventsRequest.SerializeToString,
@@ -181,6 +225,13 @@ class EventsServicer(object):
     context.set_details('Method not implemented!')
     raise NotImplementedError('Method not implemented!')
 
+  def getStream(self, request, context):
+    # missing associated documentation comment in .proto file
+    pass
+    context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+    context.set_details('Method not implemented!')
+    raise NotImplementedError('Method not implemented!')
+
   def put(self, request, context):
     """push
     """
@@ -188,6 +239,13 @@ class EventsServicer(object):
     context.set_details('Method not implemented!')
     raise NotImplementedError('Method not implemented!')
 
+  def putStream(self, request_iterator, context):
+    # missing associated documentation comment in .proto file
+    pass
+    context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+    context.set_details('Method not implemented!')
+    raise NotImplementedError('Method not implemented!')
+
   def delete(self, request, context):
     """delete
     """
@@ -208,11 +266,21 @@ def add_EventsServicer_to_server(servicer, server):
           request_deserializer=cdb__pb2.LastEventsRequest.FromString,
           response_serializer=cdb__pb2.EventSeries.SerializeToString,
       ),
+      'getStream': grpc.unary_stream_rpc_method_handler(
+          servicer.getStream,
+          request_deserializer=cdb__pb2.EventsRequest.FromString,
+          response_serializer=cdb__pb2.EventSeries.SerializeToString,
+      ),
       'put': grpc.unary_unary_rpc_method_handler(
           servicer.put,
           request_deserializer=cdb__pb2.EventSeries.FromString,
           response_serializer=cdb__pb2.PutResult.SerializeToString,
       ),
+      'putStream': grpc.stream_unary_rpc_method_handler(
+          servicer.putStream,
+          request_deserializer=cdb__pb2.EventSeries.FromString,
+          response_serializer=cdb__pb2.PutResult.SerializeToString,
+      ),
       'delete': grpc.unary_unary_rpc_method_handler(
           servicer.delete,
           request_deserializer=cdb__pb2.EventsRequest.FromString,
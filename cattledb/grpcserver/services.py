@@ -59,6 +59,33 @@ class TimeSeriesServicer(TimeSeriesServicer):
         l.data.extend([r.to_proto() for r in ts_list])
         return l
 
+    def getStream(self, request, context):
+        # request: MultiTimeSeriesRequest
+        # return: stream FloatTimeSeriesList (one message per day, newest first)
+
+        if not request.key or not request.metrics or not request.from_datetime or not request.to_datetime:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details('Invalid Request')
+            return
+
+        try:
+            from_dt = pendulum.parse(request.from_datetime)
+            to_dt = pendulum.parse(request.to_datetime)
+        except ParserError:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details("use iso-timestamp for from_datetime and to_datetime")
+            return
+
+        from_ts = from_dt.int_timestamp
+        to_ts = to_dt.int_timestamp
+
+        for ts_list in self.db.timeseries.iter_timeseries(request.key, request.metrics, from_ts, to_ts):
+            if not context.is_active():
+                return
+            l = FloatTimeSeriesList()
+            l.data.extend([r.to_proto() for r in ts_list if bool(r)])
+            yield l
+
     def put(self, request, context):
         # request: FloatTimeSeries
         # return: PutResult
@@ -101,6 +128,31 @@ class TimeSeriesServicer(TimeSeriesServicer):
             res_counter += int(res)
         return PutResult(code=200, counter=res_counter, message="success")
 
+    def putStream(self, request_iterator, context):
+        # request: stream FloatTimeSeries
+        # return: PutResult
+
+        # all messages are validated before anything is written
+        data = []
+        for p in request_iterator:
+            if (not p.key or not p.metric or not p.timestamps
+                or not p.values or not p.timestamp_offsets):
+                context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+                context.set_details('Invalid Request')
+                return PutResult()
+
+            assert 2 <= len(p.metric) <= 64
+            assert 3 <= len(p.key) <= 32
+            assert len(p.values) == len(p.timestamps) == len(p.timestamp_offsets)
+            data.append(p)
+
+        res_counter = 0
+        for p in data:
+            ts = TimeSeries.from_proto(p)
+            res = self.db.timeseries.insert_timeseries(ts)
+            res_counter += int(res)
+        return PutResult(code=200, counter=res_counter, message="success")
+
     def lastValues(self, request, context):
         # request: LastValuesRequest
         # return: FloatTimeSeriesList
@@ -323,6 +375,31 @@ class EventsServicer(EventsServicer):
         ts = self.db.events.get_events(request.key, request.name, from_ts, to_ts)
         return ts.to_proto()
 
+    def getStream(self, request, context):
+        # request: EventsRequest
+        # return: stream EventSeries (one message per row)
+
+        if not request.key or not request.name or not request.from_datetime or not request.to_datetime:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details('Invalid Request')
+            return
+
+        try:
+            from_dt = pendulum.parse(request.from_datetime)
+            to_dt = pendulum.parse(request.to_datetime)
+        except ParserError:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details("use iso-timestamp for from_datetime and to_datetime")
+            return
+
+        from_ts = from_dt.int_timestamp
+        to_ts = to_dt.int_timestamp
+
+        for events in self.db.events.iter_events(request.key, request.name, from_ts, to_ts):
+            if not context.is_active():
+                return
+            yield events.to_proto()
+
     def lastEvents(self, request, context):
         # request: LastEventsRequest
         # return: EventSeries
@@ -354,6 +431,31 @@ class EventsServicer(EventsServicer):
         res = self.db.events.insert_events(ts)
         return PutResult(code=200, counter=int(res), message="success")
 
+    def putStream(self, request_iterator, context):
+        # request: stream EventSeries
+        # return: PutResult
+
+        # all messages are validated before anything is written
+        data = []
+        for p in request_iterator:
+            if (not p.key or not p.name or not p.timestamps
+                    or not p.values or not p.timestamp_offsets):
+                context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+                context.set_details('Invalid Request')
+                return PutResult()
+
+            assert 2 <= len(p.name) <= 64
+            assert 3 <= len(p.key) <= 32
+            assert len(p.values) == len(p.timestamps) == len(p.timestamp_offsets)
+            data.append(p)
+
+        res_counter = 0
+        for p in data:
+            ts = EventList.from_proto(p)
+            res = self.db.events.insert_events(ts)
+            res_counter += int(res)
+        return PutResult(code=200, counter=res_counter, message="success")
+
     def delete(self, request, context):
         # request: EventsRequest
         # return: DeleteResult
@@ -41,6 +41,7 @@ class FlaskCDB(object):
         :param obj app: The Flask application.
         """
         self.init_settings(app)
+        app.teardown_appcontext(self.teardown)
 
     def init_settings(self, app):
         """Initialize all of the extension settings."""
@@ -51,6 +52,11 @@ class FlaskCDB(object):
         app.config.setdefault('CATTLEDB_TABLE_PREFIX', self.table_prefix)
         app.config.setdefault('CATTLEDB_CLIENT_CLASS', CDBClient)
 
+    def teardown(self, exception):
+        """Returns the engine of the request thread to the pool."""
+        if self._db is not None:
+            self._db.get_connection().release_engine()
+
     def _connect(self, _app):
         if _app.config["CATTLEDB_CLIENT_CLASS"] and callable(_app.config["CATTLEDB_CLIENT_CLASS"]):
             cl = _app.config["CATTLEDB_CLIENT_CLASS"]
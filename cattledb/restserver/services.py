@@ -55,6 +55,19 @@ def metric_days(key, metric, days):
     return jsonify([x for x in s.get_serializable_iterator("iso")])
 
 
+@bp.route('/timeseries/<key>/<metric>/<int:days>days/<aggregation_span>/<aggregation_type>')
+def metric_days_aggregated(key, metric, days, aggregation_span, aggregation_type):
+    db = current_app.cdb
+    t = pendulum.now("utc").add(hours=1)
+    f = pendulum.now("utc").subtract(days=days)
+    try:
+        s = db.get_aggregated_timeseries(key, metric, f, t, aggregation_span=aggregation_span,
+                                         aggregation_type=aggregation_type)
+    except ValueError:
+        abort(400)
+    return jsonify([x for x in s.get_serializable_iterator("iso")])
+
+
 @bp.route('/timeseries/<key>/<int:days>days')
 def days(key, days):
     db = current_app.cdb
@@ -0,0 +1,321 @@
+#!/usr/bin/python
+# coding: utf-8
+
+import atexit
+import logging
+import threading
+import time
+
+from abc import ABCMeta, abstractmethod
+from blinker import signal
+
+from .models import RowUpsert
+
+
+logger = logging.getLogger(__name__)
+
+
+class _FlushingBuffer(metaclass=ABCMeta):
+    """Base for buffers that flush on size, age or flush().
+    With background set a daemon thread flushes, otherwise the adding thread.
+    If max_pending is reached the adding thread flushes itself. A full buffer
+    is flushed before anything is added, if that fails the error goes to the
+    caller and nothing is added, so the buffer does not grow while the
+    backend is down.
+    """
+    THREAD_NAME = "cdb-buffer"
+
+    def __init__(self, max_size, max_age, max_pending=None, background=True):
+        assert max_size > 0
+        self.max_size = max_size
+        self.max_age = max_age
+        self.max_pending = max_pending or 10 * max_size
+        self.background = background
+
+        self._first = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return self._pending()
+
+    @abstractmethod
+    def _pending(self):
+        pass
+
+    def _due(self):
+        if self._pending() >= self.max_size:
+            return True
+        return self._first is not None and time.time() - self._first >= self.max_age
+
+    def _make_room(self):
+        # call without the lock, blocks until a flush of the full buffer succeeded
+        with self._lock:
+            full = self._pending() >= self.max_pending
+        if full:
+            self.flush()
+
+    def _prepare_add(self):
+        # call with the lock held
+        if self._closed:
+            raise RuntimeError("buffer is closed")
+        if self._first is None:
+            self._first = time.time()
+
+    def _added(self, pending, due):
+        if pending >= self.max_pending:
+            # backpressure, the writer pays for the flush
+            self.flush()
+        elif due:
+            if self.background:
+                self._start()
+                self._wakeup.set()
+            else:
+                self.flush()
+        elif self.background:
+            self._start()
+
+    @abstractmethod
+    def flush(self):
+        pass
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None or self._closed:
+                return
+            self._thread = threading.Thread(target=self._run, name=self.THREAD_NAME, daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while not self._closed:
+            with self._lock:
+                timeout = self.max_age
+                if self._first is not None:
+                    timeout = max(0.0, self._first + self.max_age - time.time())
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+            with self._lock:
+                due = self._due()
+            if due:
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("{} flush failed".format(self.__class__.__name__))
+                finally:
+                    # the engine goes back to the pool until the next flush
+                    self.store.connection_object.release_engine()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._wakeup.set()
+            thread.join()
+            atexit.unregister(self.close)
+        return self.flush()
+
+
+class TimeSeriesWriteBuffer(_FlushingBuffer):
+    """Write behind buffer for the timeseries table.
+    Cells of many inserts are merged per row (key and day) and written with one
+    upsert_rows call. A flush happens when max_points are pending, when the oldest
+    pending insert is older than max_age seconds or on flush().
+    Buffered points are not visible to reads before they are flushed, deletes
+    drop the pending cells of the deleted rows.
+    """
+    THREAD_NAME = "cdb-write-buffer"
+
+    def __init__(self, store, max_points=10000, max_age=1.0, max_pending=None, background=True):
+        super(TimeSeriesWriteBuffer, self).__init__(max_points, max_age, max_pending=max_pending,
+                                                    background=background)
+        self.store = store
+        self._rows = {}
+        self._metric_ids = set()
+        self._points = 0
+        self._inserts = 0
+
+    def _pending(self):
+        return self._points
+
+    def add(self, upserts, metric_id, points):
+        self._make_room()
+        with self._lock:
+            self._prepare_add()
+            for u in upserts:
+                self._rows.setdefault(u.row_key, {}).update(u.cells)
+            self._metric_ids.add(metric_id)
+            self._points += points
+            self._inserts += 1
+            pending = self._points
+            due = self._due()
+        self._added(pending, due)
+        return points
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                rows = self._rows
+                metric_ids = self._metric_ids
+                points = self._points
+                inserts = self._inserts
+                self._rows = {}
+                self._metric_ids = set()
+                self._points = 0
+                self._inserts = 0
+                self._first = None
+            if not rows:
+                return 0
+
+            timer = time.time()
+            upserts = [RowUpsert(row_key, cells) for row_key, cells in rows.items()]
+            try:
+                self.store._write_upserts(upserts, list(metric_ids))
+                # a failed update keeps the batch, the writes are repeated
+                self.store._update_last_values(upserts)
+            except Exception:
+                self._restore(rows, metric_ids, points, inserts)
+                raise
+            timer = time.time() - timer
+
+            # emit signal
+            row_keys = list(rows.keys())
+            signal_payload = {"count": len(row_keys), "row_keys": row_keys, "timer": timer, "method": "FLUSH",
+                              "points": points, "batch": inserts}
+            sig = signal('timeseries.put')
+            sig.send(self.store, info=signal_payload)
+            logger.debug("FLUSH: {} inserts, {} points, {} rows in {}".format(inserts, points, len(row_keys), timer),
+                         extra=signal_payload)
+            return points
+
+    def discard(self, row_keys, families):
+        """Drops the pending cells of the column families in these rows.
+        A flush that is running is finished first.
+        """
+        families = set(families)
+        removed = 0
+        with self._flush_lock:
+            with self._lock:
+                for row_key in row_keys:
+                    cells = self._rows.get(row_key)
+                    if cells is None:
+                        continue
+                    for column in [c for c in cells if c.split(":", 1)[0] in families]:
+                        del cells[column]
+                        removed += 1
+                    if not cells:
+                        del self._rows[row_key]
+                self._points = max(0, self._points - removed)
+                if not self._rows:
+                    self._points = 0
+                    self._first = None
+        return removed
+
+    def _restore(self, rows, metric_ids, points, inserts):
+        # put a failed batch back, cells written in the meantime win
+        with self._lock:
+            for row_key, cells in rows.items():
+                newer = self._rows.get(row_key)
+                if newer is not None:
+                    cells.update(newer)
+                self._rows[row_key] = cells
+            self._metric_ids.update(metric_ids)
+            self._points += points
+            self._inserts += inserts
+            self._first = time.time()
+
+    def info(self):
+        with self._lock:
+            return {
+                "points": self._points,
+                "rows": len(self._rows),
+                "inserts": self._inserts,
+                "max_points": self.max_size,
+                "max_age": self.max_age
+            }
+
+
+class ActivityAggregator(_FlushingBuffer):
+    """Sums activity increments per row and column in memory.
+    The sums are written with ActivityStore._incr_rows when max_cells are
+    pending, after max_age seconds or on flush(). Rows that fail to flush are
+    kept and retried (at least once).
+    """
+    THREAD_NAME = "cdb-activity-buffer"
+
+    def __init__(self, store, max_cells=10000, max_age=10.0, max_pending=None, background=True):
+        super(ActivityAggregator, self).__init__(max_cells, max_age, max_pending=max_pending,
+                                                 background=background)
+        self.store = store
+        self._rows = {}
+        self._cells = 0
+        self._increments = 0
+
+    def _pending(self):
+        return self._cells
+
+    def add(self, row_keys, column, value):
+        self._make_room()
+        with self._lock:
+            self._prepare_add()
+            for r in row_keys:
+                row = self._rows.setdefault(r, {})
+                if column not in row:
+                    row[column] = 0
+                    self._cells += 1
+                row[column] += value
+            self._increments += 1
+            pending = self._cells
+            due = self._due()
+        self._added(pending, due)
+        return [value for _ in row_keys]
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                rows = self._rows
+                cells = self._cells
+                increments = self._increments
+                self._rows = {}
+                self._cells = 0
+                self._increments = 0
+                self._first = None
+            if not rows:
+                return 0
+
+            done = {}
+            try:
+                self.store._incr_rows(rows, done=done)
+            except Exception:
+                # every row without a result is kept, whatever failed
+                self._restore({r: v for r, v in rows.items() if r not in done})
+                raise
+            logger.debug("FLUSH ACTIVITY: {} increments, {} cells".format(increments, cells))
+            return cells
+
+    def _restore(self, rows):
+        with self._lock:
+            for row_key, column_values in rows.items():
+                row = self._rows.setdefault(row_key, {})
+                for column, value in column_values.items():
+                    if column not in row:
+                        row[column] = 0
+                        self._cells += 1
+                    row[column] += value
+            self._first = time.time()
+
+    def info(self):
+        with self._lock:
+            return {
+                "cells": self._cells,
+                "rows": len(self._rows),
+                "increments": self._increments,
+                "max_cells": self.max_size,
+                "max_age": self.max_age
+            }
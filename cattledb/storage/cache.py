@@ -0,0 +1,74 @@
+#!/usr/bin/python
+# coding: utf-8
+
+import threading
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """Thread safe LRU cache bounded by the summed size of its entries.
+    """
+    def __init__(self, max_size):
+        assert max_size > 0
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, size = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, size=1):
+        if size > self.max_size:
+            return False
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._data[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.size -= evicted_size
+        return True
+
+    def invalidate(self, key):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+                return True
+        return False
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def info(self):
+        with self._lock:
+            return {
+                "items": len(self._data),
+                "size": self.size,
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses
+            }
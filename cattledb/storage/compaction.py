@@ -0,0 +1,155 @@
+#!/usr/bin/python
+# coding: utf-8
+
+import logging
+import time
+
+from blinker import signal
+
+
+logger = logging.getLogger(__name__)
+
+
+class Compactor(object):
+    """Applies the retention of the metric definitions to the timeseries table.
+    Rows are walked in key order. Raw cells of days older than raw_retention
+    are deleted after their rollups were written, raw_retention is ignored
+    for metrics without rollups. Rollups older than rollup_retention are
+    deleted.
+    The last processed row key is kept in the config store, a new run
+    continues there until the whole table is done.
+    """
+    CHECKPOINT_KEY = "compaction_checkpoint"
+    DAY = 24 * 60 * 60
+
+    def __init__(self, connection_object, max_rows_per_second=None, checkpoint_interval=100):
+        assert checkpoint_interval > 0
+        self.connection_object = connection_object
+        self.max_rows_per_second = max_rows_per_second
+        self.checkpoint_interval = checkpoint_interval
+
+    @property
+    def store(self):
+        return self.connection_object.timeseries
+
+    def get_metrics(self):
+        return [m for m in self.connection_object.metric_definitions
+                if m.raw_retention is not None or m.rollup_retention is not None]
+
+    @classmethod
+    def raw_retention_possible(cls, m):
+        # raw points are only deleted if something downsampled is kept
+        return m.raw_retention is not None and m.delete_possible and m.rollups
+
+    def get_checkpoint(self):
+        try:
+            return self.connection_object.read_config(self.CHECKPOINT_KEY)["row_key"]
+        except KeyError:
+            return None
+
+    def save_checkpoint(self, row_key):
+        self.connection_object.write_config(self.CHECKPOINT_KEY, {"row_key": row_key, "ts": int(time.time())})
+
+    def reset_checkpoint(self):
+        self.save_checkpoint(None)
+
+    def run(self, limit=None, now=None):
+        """Compacts up to limit rows, returns a dict with counters.
+        finished is set once the end of the table is reached.
+        """
+        if self.connection_object.read_only:
+            raise RuntimeError("Cannot execute compaction in readonly mode")
+
+        now = now or time.time()
+        timer = time.time()
+        stats = {"rows": 0, "raw_deleted": 0, "rollups_deleted": 0, "finished": False}
+        metrics = self.get_metrics()
+        if not metrics:
+            stats["finished"] = True
+            return stats
+        for m in metrics:
+            if m.raw_retention is not None and not m.delete_possible:
+                logger.warning("COMPACTION: delete not possible on metric {}, raw retention ignored".format(m.name))
+            elif m.raw_retention is not None and not m.rollups:
+                logger.warning("COMPACTION: no rollups on metric {}, raw retention ignored".format(m.name))
+
+        table = self.store.table()
+        checkpoint = self.get_checkpoint()
+        next_row = 0.0
+        while limit is None or stats["rows"] < limit:
+            # keys are read in pages, rows are changed in between
+            page_size = self.checkpoint_interval
+            if limit is not None:
+                page_size = min(page_size, limit - stats["rows"])
+            page = []
+            for row_key in table.row_key_generator(start_key=checkpoint):
+                if row_key == checkpoint:
+                    continue
+                page.append(row_key)
+                if len(page) >= page_size:
+                    break
+            if not page:
+                stats["finished"] = True
+                checkpoint = None
+                break
+
+            for row_key in page:
+                if self.max_rows_per_second:
+                    wait = next_row - time.time()
+                    if wait > 0:
+                        time.sleep(wait)
+                    next_row = max(next_row, time.time()) + 1.0 / self.max_rows_per_second
+                raw_deleted, rollups_deleted = self.compact_row(row_key, metrics, now)
+                stats["rows"] += 1
+                stats["raw_deleted"] += raw_deleted
+                stats["rollups_deleted"] += rollups_deleted
+            checkpoint = page[-1]
+            self.save_checkpoint(checkpoint)
+        self.save_checkpoint(checkpoint)
+
+        timer = time.time() - timer
+        # emit signal
+        signal_payload = dict(stats, timer=timer, method="COMPACT")
+        sig = signal('timeseries.compact')
+        sig.send(self, info=signal_payload)
+        logger.info("COMPACTION: {} rows, {} raw and {} rollup deletes in {}".format(
+            stats["rows"], stats["raw_deleted"], stats["rollups_deleted"], timer), extra=signal_payload)
+        return stats
+
+    def compact_row(self, row_key, metrics, now):
+        try:
+            key, day = self.store.split_row_key(row_key)
+        except ValueError:
+            logger.warning("COMPACTION: skipping row {}".format(row_key))
+            return 0, 0
+        age = now - (day + self.DAY)
+        raw_due = [m for m in metrics
+                   if self.raw_retention_possible(m) and age >= m.raw_retention * self.DAY]
+        rollups_due = [m for m in metrics
+                       if m.rollups and m.rollup_retention is not None and age >= m.rollup_retention * self.DAY]
+        if not raw_due and not rollups_due:
+            return 0, 0
+
+        families = [m.id for m in raw_due] + [m.rollup_id for m in rollups_due]
+        table = self.store.table()
+        try:
+            data_dict = table.read_row(row_key, column_families=families)
+        except KeyError:
+            return 0, 0
+        present = set(k.split(":")[0] for k in data_dict.keys())
+
+        raw_deleted = 0
+        rollups_deleted = 0
+        for m in raw_due:
+            if m.id not in present:
+                continue
+            if m not in rollups_due:
+                self.store.recompute_rollups(key, m.name, day, day)
+            self.store.delete_timeseries(key, [m.name], day, day, keep_rollups=True)
+            raw_deleted += 1
+        for m in rollups_due:
+            if m.rollup_id not in present:
+                continue
+            table.delete_row(row_key, column_families=[m.rollup_id])
+            rollups_deleted += 1
+        return raw_deleted, rollups_deleted
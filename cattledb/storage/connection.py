@@ -5,19 +5,23 @@ import logging
 import time
 import os
 import threading
+import uuid
 import warnings
 
 from grpc import RpcError
 
 from .engines import engine_factory, get_engine_capabilities
+from .pool import EnginePool
 from ..core.models import MetricDefinition, EventDefinition
-from ..core.helper import merge_lists_on_key
+from ..core.helper import merge_lists_on_key, MetricLookup, EventLookup
 
 logger = logging.getLogger(__name__)
 
 
 class Connection(object):
-    MAX_THREADS = 1000
+    # defaults for the engine options engine_pool_size and engine_pool_idle
+    ENGINE_POOL_SIZE = 16
+    ENGINE_POOL_IDLE = 300.0
 
     def __init__(self, read_only=False, table_prefix="mycdb", engine_options=None,
                  metric_definitions=None, event_definitions=None, engine="bigtable",
@@ -38,11 +42,23 @@ class Connection(object):
         # self.admin_engine = None
 
         self.threaded_engines = False
+        self.engine_pool = None
         if self.engine_capabilities.get("threading"):
             self.threaded_engines = True
+            pool_idle = self.get_engine_option("engine_pool_idle")
+            self.engine_pool = EnginePool(self._new_engine,
+                                          max_size=self.get_engine_option("engine_pool_size") or self.ENGINE_POOL_SIZE,
+                                          max_idle=pool_idle if pool_idle is not None else self.ENGINE_POOL_IDLE)
 
         self.stores = {}
 
+        # bumped on every change of the metric or event definitions
+        self.definitions_version = 0
+        self._definitions_lock = threading.Lock()
+        self._metric_lookup = MetricLookup([])
+        self._event_lookup = EventLookup([])
+        self.refresher = None
+
         self._metric_definitions = []
         if metric_definitions is not None:
             self.add_metric_definitions(metric_definitions)
@@ -67,6 +83,10 @@ class Connection(object):
         from .stores import MetaDataStore
         self.metadata = MetaDataStore(self)
         self.register_store(self.metadata)
+        # Optional Data Stores
+        if self.get_engine_option("last_value_store"):
+            from .stores import LastValueStore
+            self.register_store(LastValueStore(self))
 
     @classmethod
     def from_config(cls, config):
@@ -74,15 +94,42 @@ class Connection(object):
                    read_only=config.READ_ONLY, admin=config.ADMIN, _config=config)
 
     def info(self):
-        return {
+        info = {
             "name": "cattledb",
             "read_only": self.read_only,
             "admin": self.admin,
             "engine": self.engine_type,
             "stores": list(self.stores.keys()),
-            "engine_pool": list(self.engines.keys()),
-            "engine_pool_size": len(self.engines)
         }
+        if self.engine_pool is not None:
+            info["engine_pool"] = self.engine_pool.info()
+        else:
+            info["engine_pool"] = {"size": len(self.engines)}
+        if self.timeseries.row_cache is not None:
+            info["row_cache"] = self.timeseries.row_cache.info()
+        if self.timeseries.write_buffer is not None:
+            info["write_buffer"] = self.timeseries.write_buffer.info()
+        if self.activity.aggregator is not None:
+            info["activity_buffer"] = self.activity.aggregator.info()
+        return info
+
+    def flush(self):
+        # writes all buffered timeseries points and activity increments
+        res = self.timeseries.flush()
+        self.activity.flush()
+        return res
+
+    def disconnect(self):
+        # flushes pending writes and stops the store workers
+        for s in self.stores.values():
+            close = getattr(s, "close", None)
+            if close is not None:
+                close()
+        if self.refresher is not None:
+            self.refresher.stop()
+            self.refresher = None
+        if self.engine_pool is not None:
+            self.engine_pool.close()
 
     def register_store(self, store):
         self.stores[store.STOREID] = store
@@ -101,16 +148,17 @@ class Connection(object):
         table_name = self.timeseries.TABLENAME
         for m in self.metric_definitions:
             eng.setup_column_family(table_name, column_family=m.id, silent=silent)
+            if m.rollups:
+                eng.setup_column_family(table_name, column_family=m.rollup_id, silent=silent)
 
     def create_metric(self, metric_name, silent=False):
         eng = self.get_engine()
         table_name = self.timeseries.TABLENAME
         for m in self.metric_definitions:
-            if m.name == metric_name:
-                eng.setup_column_family(table_name, column_family=m.id, silent=silent)
-                break
-            elif m.id == metric_name:
+            if m.name == metric_name or m.id == metric_name:
                 eng.setup_column_family(table_name, column_family=m.id, silent=silent)
+                if m.rollups:
+                    eng.setup_column_family(table_name, column_family=m.rollup_id, silent=silent)
                 break
         else:
             raise KeyError("metric {} not known (add it to settings)".format(metric_name))
@@ -126,19 +174,19 @@ class Connection(object):
                 self.engines["main"] = self._new_engine()
                 logger.warning("New Database Engine created (Thread: {})".format("main"))
             return self.engines["main"]
-        # check if this thread already has an engine
-        engine = getattr(self.thread_local, 'engine', None)
-        if engine is None:
-            # no engine found for this thread
-            t = threading.currentThread().getName()
-            engine = self._new_engine()
-            self.thread_local.engine = engine
-            self.engines[t] = engine
-            logger.warning("New Database Engine created (Thread: {})".format(t))
-            if len(self.engines) > self.MAX_THREADS:
-                logger.warning("MAX_THREAD sized reached with {} threads".format(len(self.engines)))
-                raise RuntimeError("too many threads")
-        return engine
+        # check if this thread already has an engine from the pool
+        lease = getattr(self.thread_local, 'lease', None)
+        if lease is None or not lease.valid:
+            lease = self.engine_pool.checkout()
+            self.thread_local.lease = lease
+        return lease.engine
+
+    def release_engine(self):
+        # returns the engine of this thread to the pool, this happens as well when the thread ends
+        lease = getattr(self.thread_local, 'lease', None)
+        if lease is not None:
+            self.thread_local.lease = None
+            lease.release()
 
     # def get_admin_engine(self):
     #     if self.admin_engine is None:
@@ -179,6 +227,17 @@ class Connection(object):
     def service_init(self):
         self.restore_configuration()
         self.init = True
+        interval = self.get_engine_option("definitions_refresh_interval")
+        if interval:
+            self.start_refresher(interval)
+
+    def start_refresher(self, interval):
+        # reloads the definitions when another process changes them
+        from .refresher import DefinitionRefresher
+        if self.refresher is None:
+            self.refresher = DefinitionRefresher(self, interval=interval)
+            self.refresher.start()
+        return self.refresher
 
     def database_init(self, silent=False):
         if not silent:
@@ -214,15 +273,56 @@ class Connection(object):
         self.check_init()
         return self._event_definitions
 
+    @property
+    def metric_lookup(self):
+        self.check_init()
+        return self._metric_lookup
+
+    @property
+    def event_lookup(self):
+        self.check_init()
+        return self._event_lookup
+
+    # definitions are merged (or replaced) and swapped together with their lookups
+    @classmethod
+    def _same_definitions(cls, a, b, key):
+        return {key(d): d.to_dict() for d in a} == {key(d): d.to_dict() for d in b}
+
+    def _merge_metric_definitions(self, defs, replace=False):
+        with self._definitions_lock:
+            if replace:
+                merged = list(defs)
+            else:
+                merged = merge_lists_on_key(self._metric_definitions, defs, key=lambda x: x.id)
+            if self._same_definitions(merged, self._metric_definitions, key=lambda x: x.id):
+                return False
+            self._metric_lookup = MetricLookup(merged)
+            self._metric_definitions = merged
+            self.definitions_version += 1
+            return True
+
+    def _merge_event_definitions(self, defs, replace=False):
+        with self._definitions_lock:
+            if replace:
+                merged = list(defs)
+            else:
+                merged = merge_lists_on_key(self._event_definitions, defs, key=lambda x: x.name)
+            if self._same_definitions(merged, self._event_definitions, key=lambda x: x.name):
+                return False
+            self._event_lookup = EventLookup(merged)
+            self._event_definitions = merged
+            self.definitions_version += 1
+            return True
+
     def add_metric_definitions(self, defs):
         for d in defs:
             assert isinstance(d, MetricDefinition)
-        self._metric_definitions = merge_lists_on_key(self._metric_definitions, defs, key=lambda x: x.id)
+        self._merge_metric_definitions(defs)
 
     def add_event_definitions(self, defs):
         for d in defs:
             assert isinstance(d, EventDefinition)
-        self._event_definitions = merge_lists_on_key(self._event_definitions, defs, key=lambda x: x.name)
+        self._merge_event_definitions(defs)
 
     def new_metric_definition(self, metric_def):
         self.check_init()
@@ -244,48 +344,55 @@ class Connection(object):
     def write_config(self, key, value):
         return self._config_store.put(key, value)
 
-    def read_config(self, key):
-        return self._config_store.get(key)
+    def read_config(self, key, cached=True):
+        return self._config_store.get(key, cached=cached)
 
     def store_metric_definitions(self):
         data = []
         for m in self._metric_definitions:
             data.append(m.to_dict())
         self.write_config("metrics", data)
-        self.write_config("last_change", {"ts": int(time.time())})
+        self._write_last_change()
 
     def _get_metric_definitions(self):
         try:
-            data = self.read_config("metrics")
+            data = self.read_config("metrics", cached=False)
         except KeyError:
-            return []
+            return None
         metrics = [MetricDefinition.from_dict(m) for m in data]
         return metrics
 
-    def load_metric_definitions(self):
+    def load_metric_definitions(self, replace=False):
+        # with replace the stored definitions are the new set, nothing stored keeps the current ones
         m_new = self._get_metric_definitions()
-        merged = merge_lists_on_key(self._metric_definitions, m_new, key=lambda x: x.id)
-        self._metric_definitions = merged
+        if m_new is None:
+            return False
+        return self._merge_metric_definitions(m_new, replace=replace)
 
     def store_event_definitions(self):
         data = []
         for e in self._event_definitions:
             data.append(e.to_dict())
         self.write_config("events", data)
-        self.write_config("last_change", {"ts": int(time.time())})
+        self._write_last_change()
+
+    def _write_last_change(self):
+        # the change_id tells apart changes within the same second
+        self.write_config("last_change", {"ts": int(time.time()), "change_id": uuid.uuid4().hex})
 
     def _get_event_definitions(self):
         try:
-            data = self.read_config("events")
+            data = self.read_config("events", cached=False)
         except KeyError:
-            return []
+            return None
         events = [EventDefinition.from_dict(e) for e in data]
         return events
 
-    def load_event_definitions(self):
+    def load_event_definitions(self, replace=False):
         e_new = self._get_event_definitions()
-        merged = merge_lists_on_key(self._event_definitions, e_new, key=lambda x: x.name)
-        self._event_definitions = merged
+        if e_new is None:
+            return False
+        return self._merge_event_definitions(e_new, replace=replace)
 
     def restore_configuration(self):
         try:
@@ -3,13 +3,19 @@
 
 from .bigtable import BigtableEngine
 from .localsql import SQLiteEngine
+from .logstore import LogStoreEngine
+from .memory import MemoryEngine
 
 
 def get_engine_capabilities(engine_name):
     if engine_name == "bigtable":
         return {"threading": True}
     if engine_name == "localsql":
-        return {"threading": False}
+        return {"threading": True}
+    if engine_name == "logstore":
+        return {"threading": True}
+    if engine_name == "memory":
+        return {"threading": True}
     raise ValueError("invalid storage engine")
 
 
@@ -21,4 +27,8 @@ def engine_factory(engine_name, read_only, table_prefix, admin=False, engine_opt
         return BigtableEngine(engine_options=engine_options, read_only=read_only, table_prefix=table_prefix, admin=admin)
     if engine_name == "localsql":
         return SQLiteEngine(engine_options=engine_options, read_only=read_only, table_prefix=table_prefix, admin=admin)
+    if engine_name == "logstore":
+        return LogStoreEngine(engine_options=engine_options, read_only=read_only, table_prefix=table_prefix, admin=admin)
+    if engine_name == "memory":
+        return MemoryEngine(engine_options=engine_options, read_only=read_only, table_prefix=table_prefix, admin=admin)
     raise ValueError("invalid storage engine")
@@ -68,23 +68,36 @@ class StorageTable(metaclass=ABCMeta):
     def upsert_rows(self, row_upserts):
         pass
 
+    # column_range: (start, end) of the qualifiers to return (inclusive, compared as strings)
     @abstractmethod
     def row_generator(self, row_keys=None, start_key=None, end_key=None,
-                      column_families=None, check_prefix=None):
+                      column_families=None, check_prefix=None, column_range=None):
         pass
 
     @abstractmethod
     def get_first_row(self, start_key, column_families=None, end_key=None):
         pass
 
+    # yields the row keys only, start_key and end_key are inclusive
+    @abstractmethod
+    def row_key_generator(self, start_key=None, end_key=None):
+        pass
+
     @abstractmethod
     def increment_counter(self, row_id, column, value):
         pass
 
+    def increment_counters(self, row_id, column_values):
+        """Increments many counter columns of one row.
+        Returns a dict with the new value per column.
+        """
+        return {c: self.increment_counter(row_id, c, v) for c, v in column_values.items()}
+
     def read_rows(self, row_keys=None, start_key=None, end_key=None,
-                  column_families=None, check_prefix=None):
+                  column_families=None, check_prefix=None, column_range=None):
         generator = self.row_generator(row_keys=row_keys, start_key=start_key, end_key=end_key,
-                                       column_families=column_families, check_prefix=check_prefix)
+                                       column_families=column_families, check_prefix=check_prefix,
+                                       column_range=column_range)
         return [(rk, data) for rk, data in generator]
 
     @abstractmethod
@@ -10,7 +10,8 @@ from collections import OrderedDict
 
 from google.cloud import bigtable
 from google.auth.credentials import AnonymousCredentials
-from google.cloud.bigtable.row_filters import CellsColumnLimitFilter, FamilyNameRegexFilter, RowFilterChain, RowFilterUnion, RowKeyRegexFilter
+from google.cloud.bigtable.row_filters import CellsColumnLimitFilter, FamilyNameRegexFilter, RowFilterChain, RowFilterUnion, RowKeyRegexFilter, ColumnRangeFilter
+from google.cloud.bigtable.row_filters import CellsRowLimitFilter, StripValueTransformerFilter
 from google.cloud.bigtable.row_set import RowSet
 from google.cloud._helpers import _to_bytes
 from google.cloud.bigtable.column_family import MaxVersionsGCRule
@@ -200,17 +201,23 @@ class BigtableTable(StorageTable):
         return responses
 
     def row_generator(self, row_keys=None, start_key=None, end_key=None,
-                      column_families=None, check_prefix=None):
+                      column_families=None, check_prefix=None, column_range=None):
         if row_keys is None and start_key is None:
             raise ValueError("use row_keys or start_key parameter")
         if start_key is not None and (end_key is None and check_prefix is None):
             raise ValueError("use start_key together with end_key or check_prefix")
+        if column_range is not None and column_families is None:
+            raise ValueError("use column_range together with column_families")
 
         filters = [CellsColumnLimitFilter(1)]
         if column_families is not None:
             c_filters = []
             for c in column_families:
-                c_filters.append(FamilyNameRegexFilter(c))
+                if column_range is not None:
+                    c_filters.append(ColumnRangeFilter(c, start_column=_to_bytes(column_range[0]),
+                                                       end_column=_to_bytes(column_range[1])))
+                else:
+                    c_filters.append(FamilyNameRegexFilter(c))
             if len(c_filters) == 1:
                 filters.append(c_filters[0])
             elif len(c_filters) > 1:
@@ -244,6 +251,15 @@ class BigtableTable(StorageTable):
             curr_row_dict = self.partial_row_to_ordered_dict(rowdata)
             yield (rk, curr_row_dict)
 
+    def row_key_generator(self, start_key=None, end_key=None):
+        # one cell without value per row
+        filter_ = RowFilterChain(filters=[CellsRowLimitFilter(1), StripValueTransformerFilter(True)])
+        row_set = RowSet()
+        row_set.add_row_range_from_keys(start_key=start_key, end_key=end_key,
+                                        start_inclusive=True, end_inclusive=True)
+        for rowdata in self._low_level.read_rows(filter_=filter_, row_set=row_set):
+            yield rowdata.row_key.decode("utf-8")
+
     def get_first_row(self, start_key, column_families=None, end_key=None):
         filters = [CellsColumnLimitFilter(1)]
         if column_families is not None:
@@ -260,9 +276,11 @@ class BigtableTable(StorageTable):
             filter_ = filters[0]
 
         row_set = RowSet()
-        row_set.add_row_range_from_keys(start_key=start_key, start_inclusive=True, end_key=end_key)
+        row_set.add_row_range_from_keys(start_key=start_key, end_key=end_key,
+                                        start_inclusive=True, end_inclusive=True)
 
-        generator = self._low_level.read_rows(filter_=filter_, row_set=row_set)
+        # rows without cells are not returned, one row is enough
+        generator = self._low_level.read_rows(filter_=filter_, row_set=row_set, limit=1)
 
         i = -1
         for rowdata in generator:
@@ -330,5 +348,33 @@ class BigtableTable(StorageTable):
         int_value, = struct.Struct('>q').unpack(bytes_value)
         return int_value
 
+    def increment_counters(self, row_id, column_values):
+        """Atomically increment many counter columns of one row with a
+        single ReadModifyWriteRow call.
+        :type column_values: dict
+        :param column_values: Amount to increment per column (``fam:col``).
+        :rtype: dict
+        :returns: Counter value after incrementing per column.
+        """
+        row = self._low_level.append_row(row_id.encode("utf-8"))
+        for column, value in column_values.items():
+            column_family_id, column_qualifier = column.split(':')
+            row.increment_cell_value(column_family_id.encode("utf-8"),
+                                     column_qualifier.encode("utf-8"), value)
+        modified_cells = row.commit()
+
+        out = {}
+        for column in column_values:
+            column_family_id, column_qualifier = column.split(':')
+            family_cells = modified_cells.get(column_family_id, {})
+            column_cells = family_cells.get(column_qualifier.encode("utf-8"))
+            if column_cells is None:
+                column_cells = family_cells.get(column_qualifier)
+            if not column_cells:
+                raise KeyError(column_qualifier)
+            int_value, = struct.Struct('>q').unpack(column_cells[0][0])
+            out[column] = int_value
+        return out
+
     def get_column_families(self):
         return list(self._low_level.list_column_families().keys())
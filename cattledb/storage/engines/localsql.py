@@ -7,8 +7,10 @@ import os
 import json
 import base64
 import struct
+import threading
 
-from collections import defaultdict, OrderedDict
+from collections import OrderedDict
+from contextlib import contextmanager
 from sqlite3 import OperationalError
 
 from .base import StorageEngine, StorageTable
@@ -16,7 +18,80 @@ from .base import StorageEngine, StorageTable
 logger = logging.getLogger(__name__)
 
 
+class SQLiteWriter(object):
+    """The one connection that writes to a sqlite database.
+    Writers are shared by all engines of the process that open the same
+    database, transactions are serialized by a lock. The connection is
+    opened on the first transaction.
+    """
+    _writers = {}
+    _writers_lock = threading.Lock()
+
+    def __init__(self, database, uri=False):
+        self.database = database
+        self.uri = uri
+        self.con = None
+        self.refs = 0
+        self.lock = threading.RLock()
+
+    @classmethod
+    def acquire(cls, database, uri=False):
+        with cls._writers_lock:
+            writer = cls._writers.get(database)
+            if writer is None:
+                writer = cls._writers[database] = cls(database, uri=uri)
+            writer.refs += 1
+            return writer
+
+    def release(self):
+        with self._writers_lock:
+            self.refs -= 1
+            if self.refs > 0:
+                return
+            self._writers.pop(self.database, None)
+        with self.lock:
+            if self.con is not None:
+                self.con.close()
+                self.con = None
+
+    def connection(self):
+        # call with the lock held
+        if self.con is None:
+            self.con = sqlite3.connect(self.database, uri=self.uri, isolation_level=None,
+                                       check_same_thread=False)
+            self.con.execute("PRAGMA journal_mode=WAL;")
+            self.con.execute("PRAGMA synchronous=NORMAL;")
+        return self.con
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            con = self.connection()
+            con.execute("BEGIN IMMEDIATE;")
+            try:
+                yield con
+            except BaseException:
+                con.execute("ROLLBACK;")
+                raise
+            con.execute("COMMIT;")
+
+
 class SQLiteEngine(StorageEngine):
+    """Local storage in one sqlite file.
+    Every cell is one row (k, f, c, v) of a WITHOUT ROWID table with the
+    primary key (k, f, c), so reads are index range scans and writes only
+    touch the written cells. The column families of all tables are kept in
+    FAMILY_TABLE. Files are opened in WAL mode.
+    Each thread reads through its own connection, all writes of the process
+    go through one SQLiteWriter per database. In memory databases use a
+    shared cache so all connections see the same data. Their readers run
+    with read_uncommitted, otherwise the table locks of the shared cache
+    fail reads during writes. Reads may therefore see writes of a running
+    transaction (dirty reads), in_memory is meant for tests only.
+    """
+    FAMILY_TABLE = "cdb_families"
+    SCHEMA_VERSION = 2
+
     def setup_engine_options(self, engine_options):
         self.data_dir = None
         self.in_memory = False
@@ -29,64 +104,159 @@ class SQLiteEngine(StorageEngine):
         if "in_memory" in engine_options:
             self.in_memory = True
 
+        # reader connection per thread ident, writer shared with the other engines
+        self._readers = {}
+        self._readers_lock = threading.Lock()
+        self._writer = None
+
+    @property
+    def database(self):
+        path = os.path.abspath(os.path.join(self.data_dir, "cattle.db"))
+        if self.in_memory:
+            return "file:{}?mode=memory&cache=shared".format(path)
+        return path
+
     def connect(self):
-        if self.db_connection is None:
-            f = ":memory:" if self.in_memory else os.path.join(self.data_dir, "cattle.db")
-            self.db_connection = sqlite3.connect(f, uri=self.read_only)
-        return self.db_connection
+        # returns the reader connection of the calling thread
+        ident = threading.get_ident()
+        con = self._readers.get(ident)
+        if con is None:
+            con = sqlite3.connect(self.database, uri=self.in_memory or self.read_only,
+                                  isolation_level=None, check_same_thread=False)
+            if self.in_memory:
+                # dirty reads, see the class docstring
+                con.execute("PRAGMA read_uncommitted=1;")
+            with self._readers_lock:
+                # connections of finished threads are closed
+                alive = set(t.ident for t in threading.enumerate())
+                for i in [i for i in self._readers if i not in alive]:
+                    self._readers.pop(i).close()
+                self._readers[ident] = con
+        return con
+
+    def writer(self):
+        if self._writer is None:
+            with self._readers_lock:
+                if self._writer is None:
+                    self._writer = SQLiteWriter.acquire(self.database, uri=self.in_memory)
+        return self._writer
 
     def disconnect(self):
-        if self.db_connection is not None:
-            self.db_connection.close()
-            self.db_connection = None
+        with self._readers_lock:
+            readers = list(self._readers.values())
+            self._readers = {}
+            writer = self._writer
+            self._writer = None
+        for con in readers:
+            con.close()
+        if writer is not None:
+            writer.release()
+
+    def _setup_family_table(self, con):
+        _SQL = """CREATE TABLE IF NOT EXISTS {}
+        (
+            t TEXT NOT NULL,
+            f TEXT NOT NULL,
+            PRIMARY KEY (t, f)
+        ) WITHOUT ROWID
+        """.format(self.FAMILY_TABLE)
+        con.execute(_SQL)
+
+    @classmethod
+    def _table_columns(cls, con, full_table_name):
+        cur = con.execute("PRAGMA table_info('{}');".format(full_table_name))
+        return [r[1] for r in cur]
 
     def setup_table(self, table_name, silent=False):
         if not self.admin or self.read_only:
             raise RuntimeError("admin operations not allowed")
 
-        con = self.connect()
         full_table_name = self.get_full_table_name(table_name)
-        _SQL = """CREATE TABLE {}
-        (
-            k TEXT PRIMARY KEY,
-            row_meta TEXT
-        )
-        """.format(full_table_name)
+        with self.writer().transaction() as con:
+            self._setup_family_table(con)
+            old_layout = "row_meta" in self._table_columns(con, full_table_name)
+        if old_layout:
+            self.migrate_table(table_name)
         try:
-            con.execute(_SQL)
+            with self.writer().transaction() as con:
+                self._create_cell_table(con, full_table_name)
         except OperationalError as e:
             if silent:
                 logger.warning("CREATE: TABLE {} ALREADY EXISTING".format(full_table_name))
                 logger.warning(e)
             else:
                 raise
-        self.disconnect()
         logger.warning("CREATE: Created Table: {}".format(full_table_name))
 
+    @classmethod
+    def _create_cell_table(cls, con, full_table_name):
+        _SQL = """CREATE TABLE {}
+        (
+            k TEXT NOT NULL,
+            f TEXT NOT NULL,
+            c TEXT NOT NULL,
+            v BLOB,
+            PRIMARY KEY (k, f, c)
+        ) WITHOUT ROWID
+        """.format(full_table_name)
+        con.execute(_SQL)
+
+    def migrate_table(self, table_name):
+        """Converts a table of the old layout (one json column per family) to one row per cell."""
+        if not self.admin or self.read_only:
+            raise RuntimeError("admin operations not allowed")
+
+        full_table_name = self.get_full_table_name(table_name)
+        old_table_name = "{}_v1".format(full_table_name)
+        _SQL_INSERT = "INSERT OR REPLACE INTO {} (k, f, c, v) VALUES (?, ?, ?, ?);".format(full_table_name)
+        cells = 0
+        # one transaction, the table is converted completely or not at all
+        with self.writer().transaction() as con:
+            families = [c for c in self._table_columns(con, full_table_name) if c not in ("k", "row_meta")]
+            logger.warning("MIGRATE: Converting Table {} with families {}".format(full_table_name, families))
+            self._setup_family_table(con)
+            con.execute("ALTER TABLE {} RENAME TO {};".format(full_table_name, old_table_name))
+            self._create_cell_table(con, full_table_name)
+            con.executemany("INSERT OR IGNORE INTO {} (t, f) VALUES (?, ?);".format(self.FAMILY_TABLE),
+                            [(full_table_name, f) for f in families])
+
+            read_cur = con.cursor()
+            read_cur.execute("SELECT {} FROM {};".format(", ".join(["k"] + families), old_table_name))
+            for row in read_cur.fetchall():
+                values = []
+                for fam, raw_val in zip(families, row[1:]):
+                    if raw_val is None:
+                        continue
+                    for col, v in json.loads(raw_val).items():
+                        values.append((row[0], fam, col, base64.b64decode(v)))
+                con.executemany(_SQL_INSERT, values)
+                cells += len(values)
+            con.execute("DROP TABLE {};".format(old_table_name))
+        logger.warning("MIGRATE: Converted Table {} ({} cells)".format(full_table_name, cells))
+        return cells
+
     def setup_column_family(self, table_name, column_family, silent=True):
         if not self.admin or self.read_only:
             raise RuntimeError("admin operations not allowed")
 
-        con = self.connect()
         full_table_name = self.get_full_table_name(table_name)
-        _SQL = """
-        ALTER TABLE {} ADD COLUMN {} BLOB
-        """.format(full_table_name, column_family)
+        _SQL = "INSERT INTO {} (t, f) VALUES (?, ?);".format(self.FAMILY_TABLE)
         try:
-            con.execute(_SQL)
-        except OperationalError as e:
+            with self.writer().transaction() as con:
+                self._setup_family_table(con)
+                con.execute(_SQL, (full_table_name, column_family))
+        except sqlite3.IntegrityError as e:
             if silent:
                 logger.warning("CREATE CF: Ignoring existing family: {}".format(column_family))
                 logger.warning(e)
             else:
                 raise
-        self.disconnect()
         logger.warning("CREATE CF: Created Family: {}".format(column_family))
 
     def get_table(self, table_name):
         con = self.connect()
         full_table_name = self.get_full_table_name(table_name)
-        return SQLiteTable(con, full_table_name)
+        return SQLiteTable(con, full_table_name, family_table=self.FAMILY_TABLE, writer=self.writer)
 
     def get_admin_table(self, table_name):
         if not self.admin or self.read_only:
@@ -95,202 +265,208 @@ class SQLiteEngine(StorageEngine):
 
 
 class SQLiteTable(StorageTable):
-    def __init__(self, con, table):
+    # keys per lookup query, stays below the bound parameter limit of old sqlite builds (999)
+    ROW_KEYS_CHUNK = 500
+
+    def __init__(self, con, table, family_table=SQLiteEngine.FAMILY_TABLE, writer=None):
+        # con reads, writer returns the SQLiteWriter on the first write
         self.con = con
         self.table = table
+        self.family_table = family_table
+        self._writer = writer
+
+    @contextmanager
+    def _transaction(self):
+        if self._writer is None:
+            raise RuntimeError("table opened without writer")
+        with self._writer().transaction() as con:
+            yield con
 
     @classmethod
     def split_column(cls, column_name):
         fam, col = column_name.split(":", 1)
         return fam, col
 
-    def decode_row_data(self, row_data, column_names):
-        d = OrderedDict()
-        for col_name, raw_val in zip(column_names, row_data):
-            if col_name == "k" or col_name == "row_meta":
-                continue
-            if raw_val is None:
-                continue
-            decoded = json.loads(raw_val)
-            assert decoded
-            for k, v in decoded.items():
-                val = base64.b64decode(v)
-                col = self.build_column(col_name, k)
-                d[col] = val
-        return d
-
     @classmethod
     def build_column(cls, fam, col):
         return "{}:{}".format(fam, col)
 
-    def _read_column_family(self, row_id, column_family):
-        _SQL = "SELECT {} FROM {} WHERE k = ?;".format(column_family, self.table)
-        cur = self.con.cursor()
-        cur.execute(_SQL, (row_id,))
-        res = cur.fetchone()
-        if res and res[0]:
-            return json.loads(res[0])
-        return None
-
-    def _write_cells(self, row_id, column_family, values):
-        old_col = self._read_column_family(row_id, column_family)
-        if old_col is None:
-            d = {}
-        else:
-            d = dict(old_col)
-        for k, v in values.items():
-            fam, col = self.split_column(k)
-            assert fam == column_family
-            d[col] = base64.b64encode(v).decode('ascii')
-        # Below is the SQLite >3.24 version
-        # _SQL = 'INSERT INTO {} (k, {}) VALUES (?, ?) ON CONFLICT(k) DO UPDATE SET {} = ? WHERE k = ?'.format(self.table, fam, fam)
-        _SQL_UPDATE = 'UPDATE {} SET {} = ? WHERE k = ?;'.format(self.table, fam)
-        _SQL_INSERT = 'INSERT INTO {} (k, {}) SELECT ?, ? WHERE (Select Changes() = 0);'.format(self.table, fam)
-        cur = self.con.cursor()
-        raw_value = json.dumps(d)
-        # try update
-        cur.execute(_SQL_UPDATE, (raw_value, row_id,))
-        # try insert
-        cur.execute(_SQL_INSERT, (row_id, raw_value,))
-        self.con.commit()
-        return cur.lastrowid
+    @classmethod
+    def _cell_filter(cls, column_families=None, column_range=None):
+        # sql terms and parameters for the family and qualifier filter
+        terms = []
+        params = []
+        if column_families is not None:
+            terms.append("f IN ({})".format(", ".join("?" * len(column_families))))
+            params.extend(column_families)
+        if column_range is not None:
+            terms.append("c BETWEEN ? AND ?")
+            params.extend(column_range)
+        return terms, params
+
+    def _upsert_cells(self, cells):
+        # cells: iterable of (row_key, family, qualifier, value), written in one transaction
+        _SQL = "INSERT OR REPLACE INTO {} (k, f, c, v) VALUES (?, ?, ?, ?);".format(self.table)
+        with self._transaction() as con:
+            con.executemany(_SQL, cells)
 
     def write_cell(self, row_id, column, value):
         fam, col = self.split_column(column)
-        return self._write_cells(row_id, fam, {column: value})
+        self._upsert_cells([(row_id, fam, col, value)])
+        return 1
 
     def read_row(self, row_id, column_families=None):
-        if column_families is None:
-            sel = "*"
-        else:
-            sel = ", ".join(["k"] + column_families)
-        _SQL = "SELECT {} FROM {} WHERE k = ?;".format(sel, self.table)
+        terms, params = self._cell_filter(column_families)
+        filter = " AND ".join(["k = ?"] + terms)
+        _SQL = "SELECT f, c, v FROM {} WHERE {} ORDER BY f, c;".format(self.table, filter)
         cur = self.con.cursor()
-        cur.execute(_SQL, (row_id,))
-        cols = [t[0] for t in cur.description]
-        res = cur.fetchone()
-        if res:
-            return self.decode_row_data(res, cols)
-        raise KeyError("row {} not found".format(row_id))
+        cur.execute(_SQL, tuple([row_id] + params))
+        d = OrderedDict()
+        for fam, col, val in cur:
+            d[self.build_column(fam, col)] = val
+        if not d:
+            raise KeyError("row {} not found".format(row_id))
+        return d
 
     def delete_row(self, row_id, column_families=None):
-        cur = self.con.cursor()
-        if column_families is None:
-            _SQL = "DELETE FROM {} WHERE k = ?;".format(self.table)
-            cur.execute(_SQL, (row_id,))
-        else:
-            ups = ", ".join(["{} = null".format(c) for c in column_families])
-            _SQL = "UPDATE {} SET {} WHERE k = ?;".format(self.table, ups)
-            cur.execute(_SQL, (row_id,))
-        self.con.commit()
+        terms, params = self._cell_filter(column_families)
+        filter = " AND ".join(["k = ?"] + terms)
+        _SQL = "DELETE FROM {} WHERE {};".format(self.table, filter)
+        with self._transaction() as con:
+            con.execute(_SQL, tuple([row_id] + params))
 
     def upsert_row(self, row_id, values):
-        inserts = defaultdict(dict)
-        # sort by family
+        cells = []
         for k, v in values.items():
             fam, col = self.split_column(k)
-            inserts[fam][k] = v
-        for fam, vals in inserts.items():
-            self._write_cells(row_id, fam, vals)
+            cells.append((row_id, fam, col, v))
+        self._upsert_cells(cells)
         return True
 
     def upsert_rows(self, row_upserts):
-        res = []
+        cells = []
         for r in row_upserts:
-            res.append(self.upsert_row(r.row_key, r.cells))
-        return res
+            for k, v in r.cells.items():
+                fam, col = self.split_column(k)
+                cells.append((r.row_key, fam, col, v))
+        self._upsert_cells(cells)
+        return [True] * len(row_upserts)
+
+    def _group_rows(self, cur):
+        # cells are ordered by key, yields one dict per row
+        rk = None
+        d = None
+        for k, fam, col, val in cur:
+            if k != rk:
+                if d:
+                    yield (rk, d)
+                rk = k
+                d = OrderedDict()
+            d[self.build_column(fam, col)] = val
+        if d:
+            yield (rk, d)
 
     def row_generator(self, row_keys=None, start_key=None, end_key=None,
-                      column_families=None, check_prefix=None):
+                      column_families=None, check_prefix=None, column_range=None):
         if row_keys is None and start_key is None:
             raise ValueError("use row_keys or start_key parameter")
         if start_key is not None and (end_key is None and check_prefix is None):
             raise ValueError("use start_key together with end_key or check_prefix")
+        if column_range is not None and column_families is None:
+            raise ValueError("use column_range together with column_families")
 
-        if column_families is None:
-            sel = "*"
-        else:
-            sel = ", ".join(["k"] + column_families)
-
-        params = []
         if row_keys is not None:
-            filter_terms = []
-            for r in row_keys:
-                filter_terms.append("k = ?")
-                params.append(r)
-            filter = " OR ".join(filter_terms)
-        elif start_key is not None:
-            filter = "k >= ?"
-            params.append(start_key)
+            cells = self._select_keys(row_keys, column_families, column_range)
+        else:
+            filter_terms = ["k >= ?"]
+            params = [start_key]
             if end_key is not None:
-                filter = filter + " AND k <= ?"
+                filter_terms.append("k <= ?")
                 params.append(end_key)
-        else:
-            raise ValueError("use row_keys or start_key parameter")
-
-        _SQL = "SELECT {} FROM {} WHERE {} ORDER BY k;".format(sel, self.table, filter)
-        cur = self.con.cursor()
-        cur.execute(_SQL, tuple(params))
-        cols = [t[0] for t in cur.description]
-        # first should be key
-        assert cols[0] == "k"
+            cells = self._select_cells(filter_terms, params, column_families, column_range)
 
-        for row in cur:
-            curr_row_dict = self.decode_row_data(row, cols)
-            rk = row[0]
-            if len(curr_row_dict) == 0:
-                continue
+        # rows without cells never show up, the same as missing rows in bigtable
+        for rk, curr_row_dict in self._group_rows(cells):
             if check_prefix:
                 if not rk.startswith(check_prefix):
                     break
             yield (rk, curr_row_dict)
 
-    def get_first_row(self, start_key, column_families=None, end_key=None):
-        if column_families is None:
-            sel = "*"
-        else:
-            sel = ", ".join(["k"] + column_families)
-
-        filter = "k >= ?"
-        _SQL = "SELECT {} FROM {} WHERE {} ORDER BY k;".format(sel, self.table, filter)
+    def _select_cells(self, filter_terms, params, column_families=None, column_range=None):
+        terms, cell_params = self._cell_filter(column_families, column_range)
+        _SQL = "SELECT k, f, c, v FROM {} WHERE {} ORDER BY k, f, c;".format(
+            self.table, " AND ".join(filter_terms + terms))
         cur = self.con.cursor()
-        cur.execute(_SQL, (start_key,))
-        cols = [t[0] for t in cur.description]
-        # first should be key
-        assert cols[0] == "k"
-
+        cur.execute(_SQL, tuple(params + cell_params))
+        return cur
+
+    def _select_keys(self, row_keys, column_families=None, column_range=None):
+        # primary key lookups in chunks of sorted keys, the cells stay in key order
+        keys = sorted(set(row_keys))
+        for i in range(0, len(keys), self.ROW_KEYS_CHUNK):
+            chunk = keys[i:i + self.ROW_KEYS_CHUNK]
+            filter_terms = ["k IN ({})".format(", ".join("?" * len(chunk)))]
+            for cell in self._select_cells(filter_terms, chunk, column_families, column_range):
+                yield cell
+
+    def row_key_generator(self, start_key=None, end_key=None):
+        params = []
+        filters = []
+        if start_key is not None:
+            filters.append("k >= ?")
+            params.append(start_key)
+        if end_key is not None:
+            filters.append("k <= ?")
+            params.append(end_key)
+        where = "WHERE {} ".format(" AND ".join(filters)) if filters else ""
+        _SQL = "SELECT DISTINCT k FROM {} {}ORDER BY k;".format(self.table, where)
+        cur = self.con.cursor()
+        cur.execute(_SQL, tuple(params))
         for row in cur:
-            curr_row_dict = self.decode_row_data(row, cols)
-            rk = row[0]
-            if len(curr_row_dict) == 0:
-                continue
-            if not rk.startswith(start_key):
-                break
-            return (rk, curr_row_dict)
+            yield row[0]
 
-    def increment_counter(self, row_id, column, value):
-        fam, col = self.split_column(column)
-        try:
-            d = self.read_row(row_id, column_families=[fam])
-            b = d.get(column, None)
-            if b is None:
-                old_value = 0
-            else:
-                old_value = struct.Struct('>q').unpack(b)[0]
-        except KeyError:
-            old_value = 0
+    def get_first_row(self, start_key, column_families=None, end_key=None):
+        filter_terms = ["k >= ?"]
+        params = [start_key]
+        if end_key is not None:
+            filter_terms.append("k <= ?")
+            params.append(end_key)
+        terms, cell_params = self._cell_filter(column_families)
+
+        # rows without any of the families are skipped by the index scan
+        _SQL = "SELECT k FROM {} WHERE {} ORDER BY k LIMIT 1;".format(
+            self.table, " AND ".join(filter_terms + terms))
+        cur = self.con.cursor()
+        cur.execute(_SQL, tuple(params + cell_params))
+        res = cur.fetchone()
+        if res is None:
+            return None
+        rk = res[0]
+        if end_key is None and not rk.startswith(start_key):
+            return None
+        return (rk, self.read_row(rk, column_families=column_families))
 
-        if old_value:
-            new_value = old_value + value
-        else:
-            new_value = 0 + value
-        d = struct.Struct('>q').pack(new_value)
-        self.write_cell(row_id, column, d)
-        return new_value
+    def increment_counter(self, row_id, column, value):
+        return self.increment_counters(row_id, {column: value})[column]
+
+    def increment_counters(self, row_id, column_values):
+        _SQL = "SELECT v FROM {} WHERE k = ? AND f = ? AND c = ?;".format(self.table)
+        out = {}
+        cells = []
+        # the read and the write are one transaction of the writer
+        with self._transaction() as con:
+            for column, value in column_values.items():
+                fam, col = self.split_column(column)
+                res = con.execute(_SQL, (row_id, fam, col)).fetchone()
+                old_value = 0 if res is None else struct.Struct('>q').unpack(res[0])[0]
+                out[column] = old_value + value
+                cells.append((row_id, fam, col, struct.Struct('>q').pack(out[column])))
+            _SQL_UPSERT = "INSERT OR REPLACE INTO {} (k, f, c, v) VALUES (?, ?, ?, ?);".format(self.table)
+            con.executemany(_SQL_UPSERT, cells)
+        return out
 
     def get_column_families(self):
-        _SQL = "PRAGMA table_info('{}');".format(self.table)
+        _SQL = "SELECT f FROM {} WHERE t = ? ORDER BY f;".format(self.family_table)
         cur = self.con.cursor()
-        cur.execute(_SQL)
-        columns = [r[1] for r in cur if r[1] not in ("row_meta", "k")]
-        return columns
+        cur.execute(_SQL, (self.table,))
+        return [r[0] for r in cur]
@@ -0,0 +1,833 @@
+#!/usr/bin/python
+# coding: utf-8
+
+import logging
+import os
+import re
+import json
+import mmap
+import struct
+import threading
+import zlib
+import heapq
+
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from .base import StorageEngine, StorageTable
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+# log operations
+OP_PUT = 0
+OP_DELETE_FAMILY = 1
+OP_DELETE_ROW = 2
+
+_record_header = struct.Struct(">II")  # payload length, crc32
+_op_header = struct.Struct(">BHHHI")  # op, key, family, qualifier and value length
+_row_header = struct.Struct(">BH")  # row tombstone, family tombstones
+_cell_header = struct.Struct(">HHI")  # family, qualifier and value length
+_short = struct.Struct(">H")
+_int = struct.Struct(">I")
+_index_entry = struct.Struct(">HQ")  # key length, row offset
+_footer = struct.Struct(">QI8s")  # index offset, rows, magic
+_counter = struct.Struct(">q")
+
+SEGMENT_MAGIC = b"CDBSEG01"
+TOMBSTONE = 0xFFFFFFFF
+LOCK_FILE = "LOCK"
+
+_segment_name = re.compile(r"^seg-(\d+)-(\d+)\.sst$")
+_log_name = re.compile(r"^log-(\d+)\.wal$")
+
+
+class _Entry(object):
+    """The cells of one row in one layer (memtable or segment).
+    A value of None deletes the cell, family and row tombstones delete the
+    cells of older layers.
+    """
+    __slots__ = ["row_tomb", "family_tombs", "cells"]
+
+    def __init__(self, row_tomb=False, family_tombs=None, cells=None):
+        self.row_tomb = row_tomb
+        self.family_tombs = family_tombs or set()
+        self.cells = cells if cells is not None else {}
+
+    def delete_family(self, family):
+        for fc in [fc for fc in self.cells if fc[0] == family]:
+            del self.cells[fc]
+        self.family_tombs.add(family)
+
+    def apply(self, newer):
+        # newer layer on top of this one
+        if newer.row_tomb:
+            self.row_tomb = True
+            self.family_tombs = set(newer.family_tombs)
+            self.cells = dict(newer.cells)
+            return
+        for family in newer.family_tombs:
+            self.delete_family(family)
+        self.cells.update(newer.cells)
+
+    def live_cells(self):
+        return {fc: v for fc, v in self.cells.items() if v is not None}
+
+
+def _merge_entries(entries, bottom=True):
+    # entries from the oldest to the newest layer, bottom drops the tombstones
+    merged = _Entry()
+    for e in entries:
+        merged.apply(e)
+    if bottom:
+        return _Entry(cells=merged.live_cells())
+    return merged
+
+
+class _MemTable(object):
+    def __init__(self, seq):
+        self.seq = seq
+        self.rows = {}
+        self.keys = []
+        self.cells = 0
+
+    def entry(self, row_key):
+        e = self.rows.get(row_key)
+        if e is None:
+            e = self.rows[row_key] = _Entry()
+            insort(self.keys, row_key)
+        return e
+
+    def get(self, row_key):
+        return self.rows.get(row_key)
+
+    def apply(self, ops):
+        for op, row_key, family, qualifier, value in ops:
+            e = self.entry(row_key)
+            if op == OP_PUT:
+                e.cells[(family, qualifier)] = value
+                self.cells += 1
+            elif op == OP_DELETE_FAMILY:
+                e.delete_family(family)
+            else:
+                e.row_tomb = True
+                e.family_tombs = set()
+                e.cells = {}
+
+    def key_range(self, lo, hi):
+        # hi is exclusive, None for no limit
+        start = bisect_left(self.keys, lo) if lo is not None else 0
+        end = bisect_left(self.keys, hi) if hi is not None else len(self.keys)
+        return self.keys[start:end]
+
+    def items(self):
+        for k in self.keys:
+            yield k, self.rows[k]
+
+
+def _encode_ops(ops):
+    parts = []
+    for op, row_key, family, qualifier, value in ops:
+        k = row_key.encode("utf-8")
+        f = family.encode("utf-8") if family else b""
+        c = qualifier.encode("utf-8") if qualifier else b""
+        v = value or b""
+        parts.append(_op_header.pack(op, len(k), len(f), len(c), len(v)))
+        parts.append(k)
+        parts.append(f)
+        parts.append(c)
+        parts.append(v)
+    return b"".join(parts)
+
+
+def _decode_ops(payload):
+    ops = []
+    pos = 0
+    while pos < len(payload):
+        op, kl, fl, cl, vl = _op_header.unpack_from(payload, pos)
+        pos += _op_header.size
+        k = payload[pos:pos + kl].decode("utf-8")
+        pos += kl
+        f = payload[pos:pos + fl].decode("utf-8")
+        pos += fl
+        c = payload[pos:pos + cl].decode("utf-8")
+        pos += cl
+        v = bytes(payload[pos:pos + vl])
+        pos += vl
+        ops.append((op, k, f, c, v))
+    return ops
+
+
+class _Segment(object):
+    """Immutable sorted file of rows with the row key index in memory."""
+    def __init__(self, path, seq, min_seq):
+        self.path = path
+        self.seq = seq
+        self.min_seq = min_seq
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self._map)
+        index_offset, rows, magic = _footer.unpack_from(self._map, self.size - _footer.size)
+        if magic != SEGMENT_MAGIC:
+            raise ValueError("invalid segment file {}".format(path))
+        self.keys = []
+        self.offsets = []
+        pos = index_offset
+        for _ in range(rows):
+            kl, offset = _index_entry.unpack_from(self._map, pos)
+            pos += _index_entry.size
+            self.keys.append(self._map[pos:pos + kl].decode("utf-8"))
+            self.offsets.append(offset)
+            pos += kl
+
+    @classmethod
+    def write(cls, path, seq, min_seq, rows, sync=False):
+        """Writes (row_key, entry) pairs sorted by row key."""
+        tmp_path = path + ".tmp"
+        index = []
+        with open(tmp_path, "wb") as f:
+            offset = 0
+            for row_key, e in rows:
+                parts = [_row_header.pack(1 if e.row_tomb else 0, len(e.family_tombs))]
+                for family in sorted(e.family_tombs):
+                    fb = family.encode("utf-8")
+                    parts.append(_short.pack(len(fb)))
+                    parts.append(fb)
+                parts.append(_int.pack(len(e.cells)))
+                for (family, qualifier), value in sorted(e.cells.items()):
+                    fb = family.encode("utf-8")
+                    cb = qualifier.encode("utf-8")
+                    if value is None:
+                        parts.append(_cell_header.pack(len(fb), len(cb), TOMBSTONE))
+                        parts.append(fb)
+                        parts.append(cb)
+                    else:
+                        parts.append(_cell_header.pack(len(fb), len(cb), len(value)))
+                        parts.append(fb)
+                        parts.append(cb)
+                        parts.append(value)
+                data = b"".join(parts)
+                index.append((row_key.encode("utf-8"), offset))
+                f.write(data)
+                offset += len(data)
+            index_offset = offset
+            f.write(b"".join(_index_entry.pack(len(kb), o) + kb for kb, o in index))
+            f.write(_footer.pack(index_offset, len(index), SEGMENT_MAGIC))
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return cls(path, seq, min_seq)
+
+    def _decode(self, offset):
+        m = self._map
+        row_tomb, n_tombs = _row_header.unpack_from(m, offset)
+        pos = offset + _row_header.size
+        family_tombs = set()
+        for _ in range(n_tombs):
+            fl, = _short.unpack_from(m, pos)
+            pos += _short.size
+            family_tombs.add(m[pos:pos + fl].decode("utf-8"))
+            pos += fl
+        n_cells, = _int.unpack_from(m, pos)
+        pos += _int.size
+        cells = {}
+        for _ in range(n_cells):
+            fl, cl, vl = _cell_header.unpack_from(m, pos)
+            pos += _cell_header.size
+            family = m[pos:pos + fl].decode("utf-8")
+            pos += fl
+            qualifier = m[pos:pos + cl].decode("utf-8")
+            pos += cl
+            if vl == TOMBSTONE:
+                cells[(family, qualifier)] = None
+            else:
+                cells[(family, qualifier)] = m[pos:pos + vl]
+                pos += vl
+        return _Entry(bool(row_tomb), family_tombs, cells)
+
+    def get(self, row_key):
+        i = bisect_left(self.keys, row_key)
+        if i < len(self.keys) and self.keys[i] == row_key:
+            return self._decode(self.offsets[i])
+        return None
+
+    def key_range(self, lo, hi):
+        start = bisect_left(self.keys, lo) if lo is not None else 0
+        end = bisect_left(self.keys, hi) if hi is not None else len(self.keys)
+        return self.keys[start:end]
+
+    def items(self):
+        for k, offset in zip(self.keys, self.offsets):
+            yield k, self._decode(offset)
+
+    def remove(self):
+        # open maps stay readable until the last reader is gone
+        try:
+            os.remove(self.path)
+        except OSError:
+            logger.exception("LOGSTORE: could not remove segment {}".format(self.path))
+
+
+class _LogTableState(object):
+    """Log, memtables and segments of one table, shared by all engines of the process.
+    Writes are appended to the log and applied to the memtable. A full
+    memtable is written as a new segment, the log is then removed. Too many
+    segments are merged by a background thread.
+    """
+    def __init__(self, path, memtable_cells=250000, max_segments=4, sync=False):
+        self.path = path
+        self.memtable_cells = memtable_cells
+        self.max_segments = max_segments
+        self.sync = sync
+
+        self.lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compact_wakeup = threading.Event()
+        self._compact_thread = None
+        self._closed = False
+
+        self.segments = []
+        self.immutable = None
+        self.memtable = None
+        self._log = None
+        self.families = set()
+        self.flushes = 0
+        self.compactions = 0
+        self._load()
+
+    @property
+    def families_path(self):
+        return os.path.join(self.path, "families.json")
+
+    def _load(self):
+        os.makedirs(self.path, exist_ok=True)
+        if os.path.exists(self.families_path):
+            with open(self.families_path, "r") as f:
+                self.families = set(json.load(f))
+
+        segments = []
+        logs = []
+        for name in os.listdir(self.path):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(self.path, name))
+                continue
+            m = _segment_name.match(name)
+            if m:
+                segments.append((int(m.group(1)), int(m.group(2)), name))
+                continue
+            m = _log_name.match(name)
+            if m:
+                logs.append((int(m.group(1)), name))
+
+        # inputs of a finished compaction are covered by its output
+        ranges = [(seq, min_seq) for seq, min_seq, _ in segments]
+        for seq, min_seq, name in list(segments):
+            if any((o_seq, o_min) != (seq, min_seq) and o_min <= min_seq and seq <= o_seq
+                   for o_seq, o_min in ranges):
+                os.remove(os.path.join(self.path, name))
+                segments.remove((seq, min_seq, name))
+        self.segments = [_Segment(os.path.join(self.path, name), seq, min_seq)
+                         for seq, min_seq, name in sorted(segments)]
+
+        # logs of memtables that are not in a segment yet
+        last_seq = max([s.seq for s in self.segments] or [0])
+        pending = []
+        for seq, name in sorted(logs):
+            if seq <= last_seq:
+                os.remove(os.path.join(self.path, name))
+            else:
+                pending.append(seq)
+        self.memtable = _MemTable(pending[-1] if pending else last_seq + 1)
+        for seq in pending:
+            self._replay(seq)
+        self._log = open(self._log_path(self.memtable.seq), "ab")
+
+    def _log_path(self, seq):
+        return os.path.join(self.path, "log-{:012d}.wal".format(seq))
+
+    def _segment_path(self, seq, min_seq):
+        return os.path.join(self.path, "seg-{:012d}-{:012d}.sst".format(seq, min_seq))
+
+    def _replay(self, seq):
+        path = self._log_path(seq)
+        with open(path, "rb") as f:
+            data = f.read()
+        pos = 0
+        while pos + _record_header.size <= len(data):
+            length, crc = _record_header.unpack_from(data, pos)
+            payload = data[pos + _record_header.size:pos + _record_header.size + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            self.memtable.apply(_decode_ops(payload))
+            pos += _record_header.size + length
+        if pos < len(data):
+            # incomplete last write, new records go behind the last complete one
+            logger.warning("LOGSTORE: truncating log {} at {} of {} bytes".format(path, pos, len(data)))
+            with open(path, "r+b") as f:
+                f.truncate(pos)
+
+    def write(self, ops):
+        with self.lock:
+            full = self.append(ops)
+        if full:
+            self.flush()
+
+    def append(self, ops):
+        """Logs and applies ops, call with the lock held and flush() after releasing it if True is returned."""
+        if self._closed:
+            raise RuntimeError("table is closed")
+        payload = _encode_ops(ops)
+        self._log.write(_record_header.pack(len(payload), zlib.crc32(payload)))
+        self._log.write(payload)
+        self._log.flush()
+        if self.sync:
+            os.fsync(self._log.fileno())
+        self.memtable.apply(ops)
+        return self.memtable.cells >= self.memtable_cells
+
+    def layers(self):
+        # oldest first, call with the lock held
+        layers = list(self.segments)
+        if self.immutable is not None:
+            layers.append(self.immutable)
+        layers.append(self.memtable)
+        return layers
+
+    def get(self, row_key, layers=None):
+        with self.lock:
+            if layers is None:
+                layers = self.layers()
+            # memtable entries change with every write
+            entries = [e for e in (layer.get(row_key) for layer in layers) if e is not None]
+            if not entries:
+                return {}
+            return _merge_entries(entries).cells
+
+    def keys(self, lo=None, hi=None):
+        """Snapshot of the layers and the sorted row keys in [lo, hi)."""
+        with self.lock:
+            layers = self.layers()
+            ranges = [layer.key_range(lo, hi) for layer in layers]
+        keys = []
+        for k in heapq.merge(*ranges):
+            if not keys or keys[-1] != k:
+                keys.append(k)
+        return layers, keys
+
+    def flush(self):
+        """Writes the memtable as a new segment."""
+        with self._flush_lock:
+            with self.lock:
+                if self._closed or not self.memtable.rows:
+                    return False
+                frozen = self.immutable = self.memtable
+                self.memtable = _MemTable(frozen.seq + 1)
+                self._log.close()
+                self._log = open(self._log_path(self.memtable.seq), "ab")
+
+            segment = _Segment.write(self._segment_path(frozen.seq, frozen.seq), frozen.seq, frozen.seq,
+                                     frozen.items(), sync=self.sync)
+            with self.lock:
+                self.segments.append(segment)
+                self.immutable = None
+                self.flushes += 1
+                compact = len(self.segments) > self.max_segments
+            os.remove(self._log_path(frozen.seq))
+        logger.info("LOGSTORE: flushed {} rows to {}".format(len(frozen.rows), segment.path))
+        if compact:
+            self._start_compaction()
+        return True
+
+    def _pick_segments(self):
+        # newest run of segments, older ones are added while they are not much bigger
+        segments = self.segments
+        if len(segments) < 2:
+            return 0, segments[:0]
+        i = len(segments) - 1
+        total = segments[i].size
+        while i > 0 and segments[i - 1].size <= 2 * total:
+            i -= 1
+            total += segments[i].size
+        if i == len(segments) - 1:
+            i -= 1
+        return i, segments[i:]
+
+    def compact(self, full=False):
+        """Merges segments into one, returns the number of merged segments."""
+        with self._compact_lock:
+            with self.lock:
+                if full:
+                    start, inputs = 0, list(self.segments)
+                else:
+                    start, inputs = self._pick_segments()
+            if len(inputs) < 2:
+                return 0
+            # tombstones are dropped if nothing older is left
+            bottom = start == 0
+            seq = inputs[-1].seq
+            min_seq = inputs[0].min_seq
+
+            def rows():
+                streams = [((k, i, e) for k, e in s.items()) for i, s in enumerate(inputs)]
+                key = None
+                entries = []
+                for k, i, e in heapq.merge(*streams, key=lambda x: (x[0], x[1])):
+                    if k != key and entries:
+                        merged = _merge_entries(entries, bottom=bottom)
+                        if merged.cells or merged.row_tomb or merged.family_tombs:
+                            yield key, merged
+                        entries = []
+                    key = k
+                    entries.append(e)
+                if entries:
+                    merged = _merge_entries(entries, bottom=bottom)
+                    if merged.cells or merged.row_tomb or merged.family_tombs:
+                        yield key, merged
+
+            segment = _Segment.write(self._segment_path(seq, min_seq), seq, min_seq, rows(), sync=self.sync)
+            with self.lock:
+                pos = self.segments.index(inputs[0])
+                self.segments[pos:pos + len(inputs)] = [segment]
+                self.compactions += 1
+            for s in inputs:
+                s.remove()
+        logger.info("LOGSTORE: compacted {} segments to {}".format(len(inputs), segment.path))
+        return len(inputs)
+
+    def _start_compaction(self):
+        with self.lock:
+            if self._compact_thread is None and not self._closed:
+                self._compact_thread = threading.Thread(target=self._run_compaction,
+                                                        name="cdb-logstore-compaction", daemon=True)
+                self._compact_thread.start()
+        self._compact_wakeup.set()
+
+    def _run_compaction(self):
+        while not self._closed:
+            self._compact_wakeup.wait()
+            self._compact_wakeup.clear()
+            if self._closed:
+                break
+            try:
+                while not self._closed and len(self.segments) > self.max_segments:
+                    if not self.compact():
+                        break
+            except Exception:
+                logger.exception("LOGSTORE: compaction of {} failed".format(self.path))
+
+    def add_family(self, family):
+        with self.lock:
+            if family in self.families:
+                return False
+            self.families.add(family)
+            tmp_path = self.families_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(sorted(self.families), f)
+            os.replace(tmp_path, self.families_path)
+            return True
+
+    def close(self):
+        with self.lock:
+            self._closed = True
+            thread = self._compact_thread
+            self._compact_thread = None
+        if thread is not None:
+            self._compact_wakeup.set()
+            thread.join()
+        with self.lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    def info(self):
+        with self.lock:
+            return {
+                "segments": len(self.segments),
+                "segment_bytes": sum(s.size for s in self.segments),
+                "memtable_rows": len(self.memtable.rows),
+                "memtable_cells": self.memtable.cells,
+                "flushes": self.flushes,
+                "compactions": self.compactions
+            }
+
+
+class _LogDatabase(object):
+    """Tables of one data directory, shared by the engines of the process."""
+    _databases = {}
+    _databases_lock = threading.Lock()
+
+    def __init__(self, path, options):
+        self.path = path
+        self.options = options
+        self.refs = 0
+        self.tables = {}
+        self.lock = threading.Lock()
+        self._lock_file = None
+
+    @classmethod
+    def acquire(cls, path, options):
+        with cls._databases_lock:
+            db = cls._databases.get(path)
+            if db is None:
+                db = cls(path, options)
+                db._lock_directory()
+                cls._databases[path] = db
+            db.refs += 1
+            return db
+
+    def _lock_directory(self):
+        # exclusive lock of the data directory, held until the last release
+        f = open(os.path.join(self.path, LOCK_FILE), "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            raise RuntimeError("logstore directory {} is used by another process".format(self.path))
+        self._lock_file = f
+
+    def _unlock_directory(self):
+        if self._lock_file is None:
+            return
+        if fcntl is None:
+            self._lock_file.seek(0)
+            msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._lock_file.close()
+        self._lock_file = None
+
+    def release(self):
+        with self._databases_lock:
+            self.refs -= 1
+            if self.refs > 0:
+                return
+            self._databases.pop(self.path, None)
+        with self.lock:
+            tables = list(self.tables.values())
+            self.tables = {}
+        for t in tables:
+            t.close()
+        self._unlock_directory()
+
+    def exists(self, full_table_name):
+        return os.path.isdir(os.path.join(self.path, full_table_name))
+
+    def table(self, full_table_name):
+        with self.lock:
+            state = self.tables.get(full_table_name)
+            if state is None:
+                state = self.tables[full_table_name] = _LogTableState(
+                    os.path.join(self.path, full_table_name), **self.options)
+            return state
+
+
+class LogStoreEngine(StorageEngine):
+    """Embedded append only storage for single node installs.
+    Writes go to a log per table and to an in memory sorted table, full
+    memtables become immutable sorted segment files which are merged in
+    the background. One process per data directory, this is enforced with
+    a lock file.
+    Options: data_dir, logstore_memtable_cells, logstore_max_segments and
+    logstore_sync (fsync every write).
+    """
+    def setup_engine_options(self, engine_options):
+        if "data_dir" not in engine_options:
+            raise ValueError("missing data_dir option for logstore engine")
+        self.data_dir = engine_options["data_dir"]
+        self.path = os.path.abspath(os.path.join(self.data_dir, "logstore"))
+        self.table_options = {
+            "memtable_cells": engine_options.get("logstore_memtable_cells") or 250000,
+            "max_segments": engine_options.get("logstore_max_segments") or 4,
+            "sync": bool(engine_options.get("logstore_sync"))
+        }
+        self.database = None
+
+    def connect(self):
+        if self.database is None:
+            os.makedirs(self.path, exist_ok=True)
+            self.database = _LogDatabase.acquire(self.path, self.table_options)
+        return self.database
+
+    def disconnect(self):
+        if self.database is not None:
+            self.database.release()
+            self.database = None
+
+    def setup_table(self, table_name, silent=False):
+        if not self.admin or self.read_only:
+            raise RuntimeError("admin operations not allowed")
+
+        db = self.connect()
+        full_table_name = self.get_full_table_name(table_name)
+        if db.exists(full_table_name):
+            if not silent:
+                raise RuntimeError("table {} already exists".format(full_table_name))
+            logger.warning("CREATE: TABLE {} ALREADY EXISTING".format(full_table_name))
+        db.table(full_table_name)
+        logger.warning("CREATE: Created Table: {}".format(full_table_name))
+
+    def setup_column_family(self, table_name, column_family, silent=True):
+        if not self.admin or self.read_only:
+            raise RuntimeError("admin operations not allowed")
+
+        full_table_name = self.get_full_table_name(table_name)
+        if not self.connect().table(full_table_name).add_family(column_family):
+            if not silent:
+                raise RuntimeError("column family {} already exists".format(column_family))
+            logger.warning("CREATE CF: Ignoring existing family: {}".format(column_family))
+        logger.warning("CREATE CF: Created Family: {}".format(column_family))
+
+    def get_table(self, table_name):
+        full_table_name = self.get_full_table_name(table_name)
+        return LogStoreTable(self.connect().table(full_table_name))
+
+    def get_admin_table(self, table_name):
+        if not self.admin or self.read_only:
+            raise RuntimeError("admin operations not allowed")
+        return self.get_table(table_name)
+
+
+class LogStoreTable(StorageTable):
+    def __init__(self, state):
+        self.state = state
+
+    @classmethod
+    def split_column(cls, column_name):
+        fam, col = column_name.split(":", 1)
+        return fam, col
+
+    @classmethod
+    def build_row(cls, cells, column_families=None, column_range=None):
+        d = OrderedDict()
+        for (family, qualifier), value in sorted(cells.items()):
+            if column_families is not None and family not in column_families:
+                continue
+            if column_range is not None and not column_range[0] <= qualifier <= column_range[1]:
+                continue
+            d["{}:{}".format(family, qualifier)] = bytes(value)
+        return d
+
+    def flush(self):
+        return self.state.flush()
+
+    def compact(self, full=True):
+        return self.state.compact(full=full)
+
+    def info(self):
+        return self.state.info()
+
+    def write_cell(self, row_id, column, value):
+        self.upsert_row(row_id, {column: value})
+        return 1
+
+    def read_row(self, row_id, column_families=None):
+        d = self.build_row(self.state.get(row_id), column_families)
+        if not d:
+            raise KeyError("row {} not found".format(row_id))
+        return d
+
+    def delete_row(self, row_id, column_families=None):
+        if column_families is None:
+            self.state.write([(OP_DELETE_ROW, row_id, None, None, None)])
+        else:
+            self.state.write([(OP_DELETE_FAMILY, row_id, c, None, None) for c in column_families])
+
+    def upsert_row(self, row_id, values):
+        ops = []
+        for column, value in values.items():
+            fam, col = self.split_column(column)
+            ops.append((OP_PUT, row_id, fam, col, value))
+        self.state.write(ops)
+        return True
+
+    def upsert_rows(self, row_upserts):
+        ops = []
+        for r in row_upserts:
+            for column, value in r.cells.items():
+                fam, col = self.split_column(column)
+                ops.append((OP_PUT, r.row_key, fam, col, value))
+        self.state.write(ops)
+        return [True] * len(row_upserts)
+
+    @classmethod
+    def _prefix_end(cls, prefix):
+        # smallest key behind all keys with this prefix
+        return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    def row_generator(self, row_keys=None, start_key=None, end_key=None,
+                      column_families=None, check_prefix=None, column_range=None):
+        if row_keys is None and start_key is None:
+            raise ValueError("use row_keys or start_key parameter")
+        if start_key is not None and (end_key is None and check_prefix is None):
+            raise ValueError("use start_key together with end_key or check_prefix")
+        if column_range is not None and column_families is None:
+            raise ValueError("use column_range together with column_families")
+
+        if row_keys is not None:
+            with self.state.lock:
+                layers = self.state.layers()
+            keys = sorted(set(row_keys))
+        else:
+            hi = None
+            if check_prefix:
+                hi = self._prefix_end(check_prefix)
+            if end_key is not None:
+                hi = end_key + "\x00" if hi is None else min(hi, end_key + "\x00")
+            layers, keys = self.state.keys(start_key, hi)
+
+        # rows without cells are skipped, the same as missing rows in bigtable
+        for rk in keys:
+            if check_prefix and not rk.startswith(check_prefix):
+                break
+            d = self.build_row(self.state.get(rk, layers), column_families, column_range)
+            if d:
+                yield (rk, d)
+
+    def row_key_generator(self, start_key=None, end_key=None):
+        hi = end_key + "\x00" if end_key is not None else None
+        layers, keys = self.state.keys(start_key, hi)
+        for rk in keys:
+            if self.state.get(rk, layers):
+                yield rk
+
+    def get_first_row(self, start_key, column_families=None, end_key=None):
+        hi = end_key + "\x00" if end_key is not None else self._prefix_end(start_key)
+        layers, keys = self.state.keys(start_key, hi)
+        for rk in keys:
+            d = self.build_row(self.state.get(rk, layers), column_families)
+            if d:
+                return (rk, d)
+        return None
+
+    def increment_counter(self, row_id, column, value):
+        return self.increment_counters(row_id, {column: value})[column]
+
+    def increment_counters(self, row_id, column_values):
+        out = {}
+        ops = []
+        # the read and the write are done with the table lock held
+        with self.state.lock:
+            cells = self.state.get(row_id)
+            for column, value in column_values.items():
+                fam, col = self.split_column(column)
+                b = cells.get((fam, col))
+                old_value = 0 if b is None else _counter.unpack(b)[0]
+                out[column] = old_value + value
+                ops.append((OP_PUT, row_id, fam, col, _counter.pack(out[column])))
+            full = self.state.append(ops)
+        if full:
+            self.state.flush()
+        return out
+
+    def get_column_families(self):
+        return sorted(self.state.families)
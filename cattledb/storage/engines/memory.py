@@ -0,0 +1,248 @@
+#!/usr/bin/python
+# coding: utf-8
+
+import logging
+import struct
+import threading
+
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from .base import StorageEngine, StorageTable
+
+logger = logging.getLogger(__name__)
+
+
+_counter = struct.Struct(">q")
+
+
+class _MemoryTableState(object):
+    """Rows of one table, cells by (family, qualifier) and the sorted row keys."""
+    def __init__(self):
+        self.rows = {}
+        self.keys = []
+        self.families = set()
+        self.lock = threading.RLock()
+
+    def put(self, row_key, cells):
+        # call with the lock held, rows without cells are never stored
+        if not cells:
+            return
+        row = self.rows.get(row_key)
+        if row is None:
+            row = self.rows[row_key] = {}
+            insort(self.keys, row_key)
+        row.update(cells)
+
+    def remove(self, row_key):
+        # call with the lock held
+        if self.rows.pop(row_key, None) is not None:
+            del self.keys[bisect_left(self.keys, row_key)]
+
+    def key_range(self, lo=None, hi=None):
+        # hi is exclusive, None for no limit
+        with self.lock:
+            start = bisect_left(self.keys, lo) if lo is not None else 0
+            end = bisect_left(self.keys, hi) if hi is not None else len(self.keys)
+            return self.keys[start:end]
+
+
+class MemoryEngine(StorageEngine):
+    """Storage in process memory for tests and benchmarks.
+    Databases are named by the memory_name option (default "default") and
+    live as long as the process, all engines with the same name share the
+    data. drop_database() removes one.
+    """
+    _databases = {}
+    _databases_lock = threading.Lock()
+
+    def setup_engine_options(self, engine_options):
+        self.name = engine_options.get("memory_name") or "default"
+        self.tables = None
+
+    @classmethod
+    def drop_database(cls, name="default"):
+        with cls._databases_lock:
+            cls._databases.pop(name, None)
+
+    def connect(self):
+        if self.tables is None:
+            with self._databases_lock:
+                self.tables = self._databases.setdefault(self.name, {})
+        return self.tables
+
+    def disconnect(self):
+        self.tables = None
+
+    def _table_state(self, full_table_name, create=True):
+        tables = self.connect()
+        with self._databases_lock:
+            state = tables.get(full_table_name)
+            if state is None and create:
+                state = tables[full_table_name] = _MemoryTableState()
+            return state
+
+    def setup_table(self, table_name, silent=False):
+        if not self.admin or self.read_only:
+            raise RuntimeError("admin operations not allowed")
+
+        full_table_name = self.get_full_table_name(table_name)
+        if self._table_state(full_table_name, create=False) is not None:
+            if not silent:
+                raise RuntimeError("table {} already exists".format(full_table_name))
+            logger.warning("CREATE: TABLE {} ALREADY EXISTING".format(full_table_name))
+            return
+        self._table_state(full_table_name)
+        logger.warning("CREATE: Created Table: {}".format(full_table_name))
+
+    def setup_column_family(self, table_name, column_family, silent=True):
+        if not self.admin or self.read_only:
+            raise RuntimeError("admin operations not allowed")
+
+        state = self._table_state(self.get_full_table_name(table_name))
+        with state.lock:
+            if column_family in state.families:
+                if not silent:
+                    raise RuntimeError("column family {} already exists".format(column_family))
+                logger.warning("CREATE CF: Ignoring existing family: {}".format(column_family))
+                return
+            state.families.add(column_family)
+        logger.warning("CREATE CF: Created Family: {}".format(column_family))
+
+    def get_table(self, table_name):
+        return MemoryTable(self._table_state(self.get_full_table_name(table_name)))
+
+    def get_admin_table(self, table_name):
+        if not self.admin or self.read_only:
+            raise RuntimeError("admin operations not allowed")
+        return self.get_table(table_name)
+
+
+class MemoryTable(StorageTable):
+    def __init__(self, state):
+        self.state = state
+
+    @classmethod
+    def split_column(cls, column_name):
+        fam, col = column_name.split(":", 1)
+        return fam, col
+
+    @classmethod
+    def _prefix_end(cls, prefix):
+        # smallest key behind all keys with this prefix, None (no limit) for an empty prefix
+        if not prefix:
+            return None
+        return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    def _read(self, row_key, column_families=None, column_range=None):
+        with self.state.lock:
+            row = self.state.rows.get(row_key)
+            if not row:
+                return None
+            cells = sorted(row.items())
+        d = OrderedDict()
+        for (fam, col), value in cells:
+            if column_families is not None and fam not in column_families:
+                continue
+            if column_range is not None and not column_range[0] <= col <= column_range[1]:
+                continue
+            d["{}:{}".format(fam, col)] = value
+        return d or None
+
+    def write_cell(self, row_id, column, value):
+        with self.state.lock:
+            self.state.put(row_id, {self.split_column(column): value})
+        return 1
+
+    def read_row(self, row_id, column_families=None):
+        d = self._read(row_id, column_families)
+        if d is None:
+            raise KeyError("row {} not found".format(row_id))
+        return d
+
+    def delete_row(self, row_id, column_families=None):
+        with self.state.lock:
+            row = self.state.rows.get(row_id)
+            if row is None:
+                return
+            if column_families is not None:
+                for fc in [fc for fc in row if fc[0] in column_families]:
+                    del row[fc]
+            if column_families is None or not row:
+                self.state.remove(row_id)
+
+    def upsert_row(self, row_id, values):
+        cells = {self.split_column(k): v for k, v in values.items()}
+        with self.state.lock:
+            self.state.put(row_id, cells)
+        return True
+
+    def upsert_rows(self, row_upserts):
+        rows = [(r.row_key, {self.split_column(k): v for k, v in r.cells.items()}) for r in row_upserts]
+        with self.state.lock:
+            for row_key, cells in rows:
+                self.state.put(row_key, cells)
+        return [True] * len(rows)
+
+    def row_generator(self, row_keys=None, start_key=None, end_key=None,
+                      column_families=None, check_prefix=None, column_range=None):
+        if row_keys is None and start_key is None:
+            raise ValueError("use row_keys or start_key parameter")
+        if start_key is not None and (end_key is None and check_prefix is None):
+            raise ValueError("use start_key together with end_key or check_prefix")
+        if column_range is not None and column_families is None:
+            raise ValueError("use column_range together with column_families")
+
+        if row_keys is not None:
+            keys = sorted(set(row_keys))
+        else:
+            # the scan ends behind end_key and behind the last key with check_prefix
+            hi = None
+            if check_prefix:
+                hi = self._prefix_end(check_prefix)
+            if end_key is not None:
+                hi = end_key + "\x00" if hi is None else min(hi, end_key + "\x00")
+            keys = self.state.key_range(start_key, hi)
+
+        # rows without cells are skipped, the same as missing rows in bigtable
+        for rk in keys:
+            if check_prefix and not rk.startswith(check_prefix):
+                break
+            d = self._read(rk, column_families, column_range)
+            if d is not None:
+                yield (rk, d)
+
+    def row_key_generator(self, start_key=None, end_key=None):
+        hi = end_key + "\x00" if end_key is not None else None
+        for rk in self.state.key_range(start_key, hi):
+            yield rk
+
+    def get_first_row(self, start_key, column_families=None, end_key=None):
+        hi = end_key + "\x00" if end_key is not None else self._prefix_end(start_key)
+        for rk in self.state.key_range(start_key, hi):
+            d = self._read(rk, column_families)
+            if d is not None:
+                return (rk, d)
+        return None
+
+    def increment_counter(self, row_id, column, value):
+        return self.increment_counters(row_id, {column: value})[column]
+
+    def increment_counters(self, row_id, column_values):
+        out = {}
+        cells = {}
+        # the read and the write are done with the table lock held
+        with self.state.lock:
+            row = self.state.rows.get(row_id, {})
+            for column, value in column_values.items():
+                fc = self.split_column(column)
+                b = row.get(fc)
+                old_value = 0 if b is None else _counter.unpack(b)[0]
+                out[column] = old_value + value
+                cells[fc] = _counter.pack(out[column])
+            self.state.put(row_id, cells)
+        return out
+
+    def get_column_families(self):
+        with self.state.lock:
+            return sorted(self.state.families)
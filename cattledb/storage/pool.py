@@ -0,0 +1,174 @@
+#!/usr/bin/python
+# coding: utf-8
+
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class _PoolEntry(object):
+    def __init__(self, engine, name):
+        self.engine = engine
+        self.name = name
+        self.leases = 0
+        self.last_used = time.time()
+        self.closed = False
+
+
+class EngineLease(object):
+    """An engine checked out by one thread.
+    The lease is kept in the thread local storage of the connection, it is
+    checked in on release() or when the thread ends.
+    """
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+        self._released = False
+
+    @property
+    def engine(self):
+        return self._entry.engine
+
+    @property
+    def valid(self):
+        return not self._released and not self._entry.closed
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._pool.checkin(self._entry)
+
+    def __del__(self):
+        try:
+            self.release()
+        except Exception:
+            pass
+
+
+class EnginePool(object):
+    """Bounded pool of storage engines (clients and channels).
+    A checkout returns the most recently used free engine or creates a new one
+    until max_size engines exist. After that the engine with the fewest leases
+    is shared, this needs thread safe engines. Free engines are disconnected
+    after max_idle seconds. New engines are created outside of the lock.
+    """
+    def __init__(self, factory, max_size=16, max_idle=300.0):
+        assert max_size > 0
+        self.factory = factory
+        self.max_size = max_size
+        self.max_idle = max_idle
+
+        self._entries = []
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._creating = 0
+        self._created = 0
+        self._evicted = 0
+        self._checkouts = 0
+        self._shared = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def checkout(self):
+        with self._lock:
+            closing = self._evict_idle()
+            while True:
+                free = [e for e in self._entries if e.leases == 0]
+                if free:
+                    entry = max(free, key=lambda e: e.last_used)
+                    break
+                if len(self._entries) + self._creating < self.max_size:
+                    # the slot is reserved, the engine is created below
+                    self._creating += 1
+                    entry = None
+                    break
+                if self._entries:
+                    entry = min(self._entries, key=lambda e: e.leases)
+                    self._shared += 1
+                    break
+                # all slots are taken by engines still being created
+                self._changed.wait()
+            if entry is not None:
+                entry.leases += 1
+                entry.last_used = time.time()
+                self._checkouts += 1
+        self._close(closing)
+        if entry is None:
+            entry = self._create()
+        return EngineLease(self, entry)
+
+    def _create(self):
+        try:
+            engine = self.factory()
+        except Exception:
+            with self._lock:
+                self._creating -= 1
+                self._changed.notify_all()
+            raise
+        with self._lock:
+            self._creating -= 1
+            self._created += 1
+            entry = _PoolEntry(engine, "engine-{}".format(self._created))
+            entry.leases = 1
+            self._entries.append(entry)
+            self._checkouts += 1
+            self._changed.notify_all()
+            size = len(self._entries)
+        logger.warning("New Database Engine created ({} of {})".format(size, self.max_size))
+        return entry
+
+    def checkin(self, entry):
+        with self._lock:
+            entry.leases -= 1
+            entry.last_used = time.time()
+            closing = self._evict_idle()
+        self._close(closing)
+
+    def _evict_idle(self):
+        # call with the lock held, returns the entries to close
+        if self.max_idle is None:
+            return []
+        limit = time.time() - self.max_idle
+        idle = [e for e in self._entries if e.leases == 0 and e.last_used < limit]
+        for e in idle:
+            self._entries.remove(e)
+            self._evicted += 1
+        return idle
+
+    def _close(self, entries):
+        for e in entries:
+            e.closed = True
+            try:
+                e.engine.disconnect()
+            except Exception:
+                logger.exception("disconnect of {} failed".format(e.name))
+
+    def engines(self):
+        with self._lock:
+            return [e.engine for e in self._entries]
+
+    def close(self):
+        with self._lock:
+            entries = self._entries
+            self._entries = []
+        self._close(entries)
+
+    def info(self):
+        with self._lock:
+            in_use = len([e for e in self._entries if e.leases > 0])
+            return {
+                "size": len(self._entries),
+                "in_use": in_use,
+                "idle": len(self._entries) - in_use,
+                "leases": sum(e.leases for e in self._entries),
+                "max_size": self.max_size,
+                "max_idle": self.max_idle,
+                "created": self._created,
+                "evicted": self._evicted,
+                "checkouts": self._checkouts,
+                "shared": self._shared
+            }
@@ -0,0 +1,89 @@
+#!/usr/bin/python
+# coding: utf-8
+
+import logging
+import threading
+
+from blinker import signal
+
+
+logger = logging.getLogger(__name__)
+
+
+class DefinitionRefresher(object):
+    """Reloads the metric and event definitions of a long running connection.
+    The last_change config key is polled every interval seconds past the
+    config cache, the definitions are read again if the stamp differs from
+    the last poll. The stamp is read on start, the connection loaded the
+    definitions already.
+    A reload replaces the definitions with the stored ones, definitions that
+    were deleted elsewhere are gone after it. The connection swaps the
+    definitions together with their lookups.
+    """
+    CHANGE_KEY = "last_change"
+
+    def __init__(self, connection_object, interval=30.0):
+        assert interval > 0
+        self.connection_object = connection_object
+        self.interval = interval
+        self.last_change = None
+        self.reloads = 0
+
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _read_change(self):
+        try:
+            return self.connection_object.read_config(self.CHANGE_KEY, cached=False)
+        except KeyError:
+            return None
+
+    def check(self):
+        """Polls the change stamp once, returns True if definitions were reloaded."""
+        change = self._read_change()
+        if change is None or change == self.last_change:
+            return False
+
+        old_version = self.connection_object.definitions_version
+        self.connection_object.load_metric_definitions(replace=True)
+        self.connection_object.load_event_definitions(replace=True)
+        self.last_change = change
+        self.reloads += 1
+
+        # emit signal
+        signal_payload = {"change": change, "old_version": old_version,
+                          "version": self.connection_object.definitions_version}
+        sig = signal('definitions.reload')
+        sig.send(self, info=signal_payload)
+        logger.info("RELOAD DEFINITIONS: version {}".format(signal_payload["version"]), extra=signal_payload)
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("definition refresh failed")
+            finally:
+                # the engine goes back to the pool until the next poll
+                self.connection_object.release_engine()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if self.last_change is None:
+            self.last_change = self._read_change()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cdb-definition-refresher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.interval + 1.0)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
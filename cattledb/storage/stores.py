@@ -3,20 +3,27 @@
 
 import logging
 import time
+import calendar
 import struct
 import json
+import threading
+
+from array import array
 
 from blinker import signal
-from collections import namedtuple, defaultdict
+from collections import namedtuple, defaultdict, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from google.cloud import bigtable
 from google.cloud.bigtable.row_filters import CellsColumnLimitFilter
 from google.cloud.bigtable.column_family import MaxVersionsGCRule
 
-from ..core.helper import (from_ts, daily_timestamps, get_metric_name_lookup, get_metric_ids,
-                           get_metric_names, monthly_timestamps, get_event_name_lookup, get_metric_id_lookup)
+from ..core.helper import (from_ts, daily_timestamps, monthly_timestamps,
+                           ts_monthly_left, ts_daily_left, ts_daily_right, ts_hourly_left)
 from .models import (TimeSeries, EventList, MetaDataItem, SerializableDict,
                      ReaderActivityItem, DeviceActivityItem, RowUpsert, EventSeriesType)
 from ..grpcserver.cdb_pb2 import FloatTimeSeries, FloatTimeSeriesList
+from .cache import LRUCache
+from .buffers import TimeSeriesWriteBuffer, ActivityAggregator
 
 
 logger = logging.getLogger(__name__)
@@ -124,6 +131,11 @@ class ConfigStore(object):
     def __init__(self, connection_object):
         self.connection_object = connection_object
 
+        # optional per process cache of the raw config values, ttl in seconds
+        self.cache_ttl = connection_object.get_engine_option("config_cache_ttl")
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+
     def table(self):
         return self.connection_object.get_table(self.TABLENAME)
 
@@ -131,6 +143,10 @@ class ConfigStore(object):
     def get_table_definitions(cls):
         return {cls.TABLENAME: [cls.COLUMN_FAMILY]}
 
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache = {}
+
     def put(self, key, value):
         if self.connection_object.read_only:
             raise RuntimeError("Cannot execute put config in readonly mode")
@@ -142,14 +158,26 @@ class ConfigStore(object):
         data = {cn: json.dumps(value).encode("ascii")}
         dt = self.table()
         dt.upsert_rows([RowUpsert(row_key, data)])
+        if self.cache_ttl:
+            with self._cache_lock:
+                self._cache[key] = (time.time() + self.cache_ttl, data[cn])
 
         logger.info("PUT CONFIG KEY: {}".format(key))
         return True
 
-    def get(self, key):
+    def get(self, key, cached=True):
         cn = "{}:value".format(self.COLUMN_FAMILY)
+        if self.cache_ttl and cached:
+            with self._cache_lock:
+                expires, raw_value = self._cache.get(key, (0, None))
+            if expires > time.time():
+                # decoded per call, callers may change the returned value
+                return json.loads(raw_value)
         row = self.table().read_row(key)  # , column_families=[self.COLUMN_FAMILY])
         raw_value = row[cn]
+        if self.cache_ttl:
+            with self._cache_lock:
+                self._cache[key] = (time.time() + self.cache_ttl, raw_value)
         logger.info("GET CONFIG KEY: {}".format(key))
         return json.loads(raw_value)
 
@@ -159,10 +187,42 @@ class ActivityStore(object):
     TABLEOPTIONS = {}
     STOREID = "activity"
     MAX_GET_SIZE = 90*24*60*60
+    BULK_INCR_WORKERS = 16
     # row: org/bs/total#reversets#reader colfam: seen:, data: hourminute_device, (device1, device2, rssi, readout_ts?)
 
     def __init__(self, connection_object):
         self.connection_object = connection_object
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+        # optional in memory aggregation of increments, size is the number of cells
+        self.aggregator = None
+        activity_buffer_size = connection_object.get_engine_option("activity_buffer_size")
+        if activity_buffer_size:
+            activity_buffer_age = connection_object.get_engine_option("activity_buffer_age") or 10.0
+            self.aggregator = ActivityAggregator(self, max_cells=activity_buffer_size, max_age=activity_buffer_age,
+                                                 background=connection_object.threaded_engines)
+
+    def executor(self):
+        # shared pool, the workers take an engine per job
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.BULK_INCR_WORKERS,
+                                                    thread_name_prefix="cdb-activity")
+            return self._executor
+
+    def flush(self):
+        if self.aggregator is not None:
+            return self.aggregator.flush()
+        return 0
+
+    def close(self):
+        if self.aggregator is not None:
+            self.aggregator.close()
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
 
     def table(self):
         return self.connection_object.get_table(self.TABLENAME)
@@ -221,6 +281,9 @@ class ActivityStore(object):
 
         row_keys = self.get_insert_keys(reader_id, timestamp, parent_ids)
         column = "c:{}.{}".format(self.get_hour_key(timestamp), device_id)
+        if self.aggregator is not None:
+            # returns the buffered increments instead of the counter values
+            return self.aggregator.add(row_keys, column, value)
 
         timer = time.time()
         res = []
@@ -237,6 +300,88 @@ class ActivityStore(object):
         # print("INCR ACTIVITY: {}, {} incrs in {}".format(device_id, len(res), timer))
         return res
 
+    def incr_activity_bulk(self, items):
+        """Increments the activity for many sightings.
+        items are dicts with the arguments of incr_activity. All counters of
+        one row are incremented with one call, rows are written in parallel
+        if the engine supports threading.
+        Returns a dict with the new counter values per row key and column.
+        """
+        if self.connection_object.read_only:
+            raise RuntimeError("Cannot execute incr_activity_bulk in readonly mode")
+
+        rows = defaultdict(lambda: defaultdict(int))
+        for i in items:
+            timestamp = i["timestamp"]
+            act_limit = bool((time.time() - 30*365*24*60*60) < timestamp < (time.time() + 3*24*60*60))
+            self.connection_object.assert_limits(act_limit, "timestamp out of activity window -30y +30d")
+
+            column = "c:{}.{}".format(self.get_hour_key(timestamp), i["device_id"])
+            for r in self.get_insert_keys(i["reader_id"], timestamp, i.get("parent_ids")):
+                rows[r][column] += i.get("value", 1)
+
+        return self._incr_rows(rows)
+
+    def _incr_rows(self, rows, done=None):
+        # rows: {row_key: {column: value}}
+        # with done given, the written rows are collected there, all rows are
+        # tried and the first error is raised after that
+        timer = time.time()
+        res = {}
+        error = None
+        if not self.connection_object.threaded_engines or len(rows) < 2:
+            table = self.table()
+            results = []
+            for r, column_values in rows.items():
+                try:
+                    results.append((r, table.increment_counters(r, dict(column_values)), None))
+                except Exception as e:
+                    if done is None:
+                        raise
+                    results.append((r, None, e))
+        else:
+            def incr(row_key, column_values):
+                try:
+                    return self.table().increment_counters(row_key, column_values)
+                finally:
+                    # the worker gives its engine back to the pool
+                    self.connection_object.release_engine()
+
+            executor = self.executor()
+            futures = {executor.submit(incr, r, dict(column_values)): r
+                       for r, column_values in rows.items()}
+            results = []
+            try:
+                for f in as_completed(futures):
+                    try:
+                        results.append((futures[f], f.result(), None))
+                    except Exception as e:
+                        if done is None:
+                            raise
+                        results.append((futures[f], None, e))
+            finally:
+                for f in futures:
+                    f.cancel()
+
+        for r, values, e in results:
+            if e is None:
+                res[r] = values
+            else:
+                error = error or e
+        if done is not None:
+            done.update(res)
+
+        timer = time.time() - timer
+        # emit signal
+        row_keys = list(res.keys())
+        signal_payload = {"count": len(row_keys), "row_keys": row_keys, "timer": timer, "method": "BULK"}
+        sig = signal('activity.incr')
+        sig.send(self, info=signal_payload)
+        logger.debug("INCR ACTIVITY BULK: {} rows in {}".format(len(row_keys), timer), extra=signal_payload)
+        if error is not None:
+            raise error
+        return res
+
     def get_total_activity_for_day(self, day_ts):
         return self.get_activity_for_day("t", day_ts)
 
@@ -336,28 +481,92 @@ class TimeSeriesStore(object):
     TABLEOPTIONS = {}
     STOREID = "timeseries"
     MAX_GET_SIZE = 400 * 24 * 60 * 60  # A bit more than a year
+    BLOCK_COLUMN = "b"  # column of block encoded metrics
+    MULTI_GET_WORKERS = 16
+    # rows are cached once their day is over for this long
+    ROW_CACHE_MIN_AGE = 24 * 60 * 60
+    # rollup qualifiers, hourly and daily buckets of a day are kept in its row
+    ROLLUP_HOURLY = "h"
+    ROLLUP_DAILY = "d"
+    ROLLUP_SPANS = {"hourly": 60 * 60, "daily": 24 * 60 * 60}
+    ROLLUP_FUNCTIONS = ("mean", "count", "sum", "min", "max", "amp")
+    KEY_LOCKS = 64
+    _rollup_item = struct.Struct(">iqdddq")
+    _float = struct.Struct("f")
 
     def __init__(self, connection_object):
         self.connection_object = connection_object
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(self.KEY_LOCKS)]
+
+        # optional cache for historical rows, size is the number of points
+        self.row_cache = None
+        self._row_cache_epoch = 0
+        row_cache_size = connection_object.get_engine_option("row_cache_size")
+        if row_cache_size:
+            self.row_cache = LRUCache(row_cache_size)
+
+        # optional write behind buffer, size is the number of points
+        self.write_buffer = None
+        write_buffer_size = connection_object.get_engine_option("write_buffer_size")
+        if write_buffer_size:
+            write_buffer_age = connection_object.get_engine_option("write_buffer_age") or 1.0
+            self.write_buffer = TimeSeriesWriteBuffer(self, max_points=write_buffer_size, max_age=write_buffer_age,
+                                                      background=connection_object.threaded_engines)
+
+    def executor(self):
+        # shared pool, the workers take an engine per job
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.MULTI_GET_WORKERS,
+                                                    thread_name_prefix="cdb-timeseries")
+            return self._executor
+
+    def flush(self):
+        if self.write_buffer is not None:
+            return self.write_buffer.flush()
+        return 0
+
+    def close(self):
+        res = 0
+        if self.write_buffer is not None:
+            res = self.write_buffer.close()
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+        return res
 
     def table(self):
         return self.connection_object.get_table(self.TABLENAME)
 
+    def _key_lock(self, key):
+        # Held for the read, merge and write of blocks and rollups of a key.
+        # This keeps concurrent writers of one process apart, not writers in
+        # other processes, recompute_rollups repairs the rollups of a day.
+        return self._key_locks[hash(key) % self.KEY_LOCKS]
+
+    def last_value_store(self):
+        # optional, see LastValueStore
+        return self.connection_object.stores.get(LastValueStore.STOREID)
+
+    # lookups are cached by the connection until the definitions change
     @property
     def METRIC_NAME_LOOKUP(self):
-        return get_metric_name_lookup(self.connection_object.metric_definitions)
+        return self.connection_object.metric_lookup.by_name
 
     @property
     def METRIC_NAMES(self):
-        return get_metric_names(self.connection_object.metric_definitions)
+        return self.connection_object.metric_lookup.names
 
     @property
     def METRIC_IDS(self):
-        return get_metric_ids(self.connection_object.metric_definitions)
+        return self.connection_object.metric_lookup.ids
 
     @property
     def METRIC_ID_LOOKUP(self):
-        return get_metric_id_lookup(self.connection_object.metric_definitions)
+        return self.connection_object.metric_lookup.by_id
 
     @classmethod
     def get_table_definitions(cls):
@@ -381,9 +590,21 @@ class TimeSeriesStore(object):
         row_key = "{}#{}".format(base_key, reverse_day_ts)
         return row_key
 
+    @classmethod
+    def split_row_key(cls, row_key):
+        # (base_key, day_ts) of a row key
+        base_key, reverse_day_ts = row_key.rsplit("#", 1)
+        if len(reverse_day_ts) != 8:
+            raise ValueError("invalid row key {}".format(row_key))
+        y = 5000 - int(reverse_day_ts[0:4])
+        m = 50 - int(reverse_day_ts[4:6])
+        d = 50 - int(reverse_day_ts[6:8])
+        return base_key, calendar.timegm((y, m, d, 0, 0, 0))
+
     def get_metric_object(self, metric_name):
-        if metric_name in self.METRIC_NAMES:
-            return self.METRIC_NAME_LOOKUP[metric_name]
+        m = self.METRIC_NAME_LOOKUP.get(metric_name)
+        if m is not None:
+            return m
         raise KeyError("metric {} not known".format(metric_name))
 
     def insert_timeseries(self, ts):
@@ -392,32 +613,265 @@ class TimeSeriesStore(object):
 
         assert bool(ts)
         metric_object = self.get_metric_object(ts.metric)
-        row_keys = []
         key = ts.key
         timer = time.time()
 
-        row_keys = []
+        if not metric_object.block_encoding and not metric_object.rollups:
+            upserts = self._point_upserts(key, metric_object, ts)
+            if self.write_buffer is not None:
+                # the flush writes the last values of buffered points
+                return self.write_buffer.add(upserts, metric_object.id, len(ts))
+            row_keys = self._write_upserts(upserts, [metric_object.id])
+        else:
+            # blocks and rollups are read, merged and written, this can not be buffered
+            with self._key_lock(key):
+                if metric_object.block_encoding:
+                    upserts = self._block_upserts(key, metric_object, ts)
+                else:
+                    upserts = self._point_upserts(key, metric_object, ts)
+                if metric_object.rollups:
+                    upserts = self._rollup_upserts(key, metric_object, ts, upserts)
+                row_keys = self._write_upserts(upserts, [metric_object.id])
+        # the last value is written once the points are stored
+        last_value_store = self.last_value_store()
+        if last_value_store is not None:
+            last_value_store.update(ts, metric_object.id)
+
+        timer = time.time() - timer
+        # emit signal
+        signal_payload = {"count": len(row_keys), "row_keys": row_keys, "timer": timer, "method": "PUT"}
+        sig = signal('timeseries.put')
+        sig.send(self, info=signal_payload)
+        logger.debug("INSERT: {}.{}, {} points in {}".format(key, metric_object.name, len(ts), timer), extra=signal_payload)
+        # print("INSERT: {}.{}, {} points in {}".format(key, metric, len(ts), timer))
+        return len(ts)
+
+    def _point_upserts(self, key, metric_object, ts):
         upserts = []
         for day, bucket in ts.daily_storage_buckets():
-            row_key = self.get_row_key(key, day)
-            row_keys.append(row_key)
             data = {}
             for timestamp, val in bucket:
                 cn = "{}:{}".format(metric_object.id, timestamp)
                 data[cn] = val
-            upserts.append(RowUpsert(row_key, data))
+            upserts.append(RowUpsert(self.get_row_key(key, day), data))
+        return upserts
 
+    def _write_upserts(self, upserts, metric_ids):
+        row_keys = [u.row_key for u in upserts]
         dt = self.table()
         dt.upsert_rows(upserts)
+        self._invalidate_rows(row_keys, metric_ids)
+        return row_keys
+
+    def _update_last_values(self, upserts):
+        # newest point cell per key and metric of written point upserts
+        last_value_store = self.last_value_store()
+        if last_value_store is None:
+            return 0
+        newest = defaultdict(dict)
+        for u in upserts:
+            key, _ = self.split_row_key(u.row_key)
+            for column, value in u.cells.items():
+                m, ts = column.split(":")
+                ts = int(ts)
+                item = newest[key].get(m)
+                if item is None or ts > item[0]:
+                    newest[key][m] = (ts, value)
+        return sum(last_value_store.put_items(key, items) for key, items in newest.items())
+
+    def _block_upserts(self, key, metric_object, ts):
+        # one block per day, new points are merged into the existing blocks
+        column = "{}:{}".format(metric_object.id, self.BLOCK_COLUMN)
+        days = list(ts.daily_columns())
+        row_keys = [self.get_row_key(key, day) for day, _, _, _ in days]
+
+        existing = {}
+        gen = self.table().row_generator(row_keys=row_keys, column_families=[metric_object.id])
+        for row_key, data_dict in gen:
+            if column in data_dict:
+                existing[row_key] = data_dict[column]
+
+        upserts = []
+        for row_key, (day, timestamps, offsets, values) in zip(row_keys, days):
+            block = TimeSeries(key, metric_object.name)
+            if row_key in existing:
+                block.insert_storage_block(existing[row_key])
+            block.insert_columns(timestamps, offsets, values)
+            upserts.append(RowUpsert(row_key, {column: block.to_storage_block()}))
+        return upserts
+
+    def _rollup_upserts(self, key, metric_object, ts, upserts):
+        # adds the rollup cells to the upserts, they live in the same day rows
+        family = metric_object.rollup_id
+        days = OrderedDict()
+        for p in ts.all(raw=True):
+            days.setdefault(ts_daily_left(p.ts), []).append(p)
+        row_keys = [self.get_row_key(key, day) for day in days]
+        existing = dict(self.table().row_generator(row_keys=row_keys, column_families=[family]))
+
+        cells = OrderedDict((u.row_key, dict(u.cells)) for u in upserts)
+        for day, points in days.items():
+            row_key = self.get_row_key(key, day)
+            stored = existing.get(row_key, {})
+            daily = stored.get("{}:{}{}".format(family, self.ROLLUP_DAILY, day))
+            if daily is not None and points[0].ts > self._rollup_item.unpack(daily)[5]:
+                # appended points are merged into the stored buckets
+                buckets = self._rollup_buckets(points, family, stored=stored)
+            else:
+                # first write of the day or points in between, the day is aggregated again
+                buckets = self._rollup_buckets(self._read_day(key, metric_object, day, points), family)
+            cells.setdefault(row_key, {}).update(buckets)
+        return [RowUpsert(row_key, c) for row_key, c in cells.items()]
+
+    def _read_day(self, key, metric_object, day, points=None):
+        # raw points of one day, points are put on top
+        series = TimeSeries(key, metric_object.name)
+        gen = self.table().row_generator(row_keys=[self.get_row_key(key, day)], column_families=[metric_object.id])
+        for row_key, data_dict in gen:
+            items = []
+            blocks = []
+            for k, value in data_dict.items():
+                s = k.split(":")
+                if len(s) != 2:
+                    continue
+                if s[1] == self.BLOCK_COLUMN:
+                    blocks.append(value)
+                    continue
+                items.append((int(s[1]), value))
+            series.insert_storage_items(items)
+            for block in blocks:
+                series.insert_storage_block(block)
+        if points:
+            series.insert_columns([p.ts for p in points], [p.ts_offset for p in points],
+                                  [p.value for p in points])
+        return list(series.all(raw=True))
+
+    def _rollup_buckets(self, points, family, stored=None):
+        # hourly and daily offset, count, sum, min, max and last ts
+        buckets = OrderedDict()
+        for p in points:
+            # values are stored as float
+            value = self._float.unpack(self._float.pack(p.value))[0]
+            for prefix, left in ((self.ROLLUP_HOURLY, ts_hourly_left), (self.ROLLUP_DAILY, ts_daily_left)):
+                column = "{}:{}{}".format(family, prefix, left(p.ts))
+                b = buckets.get(column)
+                if b is None:
+                    raw = stored.get(column) if stored else None
+                    if raw is not None:
+                        b = list(self._rollup_item.unpack(raw))
+                    else:
+                        b = [p.ts_offset, 0, 0.0, value, value, p.ts]
+                    buckets[column] = b
+                b[1] += 1
+                b[2] += value
+                b[3] = min(b[3], value)
+                b[4] = max(b[4], value)
+                b[5] = max(b[5], p.ts)
+        return {column: self._rollup_item.pack(*b) for column, b in buckets.items()}
+
+    def recompute_rollups(self, key, metric, from_ts, to_ts):
+        """Rebuilds the rollups of all days between from_ts and to_ts from the raw points.
+        Needed for data that was written before rollups were enabled or by
+        several processes at the same time.
+        """
+        if self.connection_object.read_only:
+            raise RuntimeError("Cannot execute recompute_rollups command in readonly mode")
+
+        assert from_ts <= to_ts
+        key = key.lower()
+        metric_object = self.get_metric_object(metric)
+        if not metric_object.rollups:
+            raise ValueError("metric {} has no rollups".format(metric_object.name))
+
+        table = self.table()
+        count = 0
+        for day in daily_timestamps(from_ts, to_ts):
+            row_key = self.get_row_key(key, day)
+            with self._key_lock(key):
+                points = self._read_day(key, metric_object, day)
+                table.delete_row(row_key, column_families=[metric_object.rollup_id])
+                if points:
+                    table.upsert_rows([RowUpsert(row_key, self._rollup_buckets(points, metric_object.rollup_id))])
+                    count += 1
+        logger.info("RECOMPUTE ROLLUPS: {}.{}, {} days".format(key, metric_object.name, count))
+        return count
+
+    def get_aggregated_timeseries(self, key, metric, from_ts, to_ts, aggregation_span="hourly",
+                                  aggregation_type="mean"):
+        """Aggregated values of one metric in utc buckets, see BaseTimeseries.aggregation.
+        For metrics with rollups the hourly and daily buckets that are completely
+        inside the range are read from the rollups. Buckets at the edges, other
+        spans and aggregation types are computed from the raw points.
+        """
+        assert from_ts <= to_ts
+        if aggregation_type == "all":
+            raise ValueError("aggregation type all is not supported")
+        timer = time.time()
+        key = key.lower()
+        metric_object = self.get_metric_object(metric)
+
+        points = []
+        raw_ranges = [(from_ts, to_ts)]
+        size = self.ROLLUP_SPANS.get(aggregation_span)
+        if metric_object.rollups and size is not None and aggregation_type in self.ROLLUP_FUNCTIONS:
+            first = from_ts + (-from_ts % size)
+            last = to_ts - (to_ts + 1) % size
+            if first <= last:
+                points = self._read_rollups(key, metric_object, aggregation_span, aggregation_type, first, last)
+                raw_ranges = [(from_ts, first - 1), (last + 1, to_ts)]
+        rollup_count = len(points)
+
+        for start, end in raw_ranges:
+            if start > end:
+                continue
+            raw = self.get_timeseries(key, [metric], start, end)[0]
+            for p in raw.aggregation(aggregation_span, aggregation_type, raw=True):
+                points.append((p.ts, p.ts_offset, float(p.value)))
+        points.sort()
+
+        series = TimeSeries(key, metric_object.name)
+        series.insert_columns([p[0] for p in points], [p[1] for p in points], [p[2] for p in points])
 
         timer = time.time() - timer
         # emit signal
-        signal_payload = {"count": len(row_keys), "row_keys": row_keys, "timer": timer, "method": "PUT"}
-        sig = signal('timeseries.put')
+        signal_payload = {"count": rollup_count, "timer": timer, "method": "ROLLUP"}
+        sig = signal('timeseries.get')
         sig.send(self, info=signal_payload)
-        logger.debug("INSERT: {}.{}, {} points in {}".format(key, metric_object.name, len(ts), timer), extra=signal_payload)
-        # print("INSERT: {}.{}, {} points in {}".format(key, metric, len(ts), timer))
-        return len(ts)
+        logger.debug("ROLLUP: {}.{}, {} points ({} from rollups) in {}".format(key, metric, len(series),
+                                                                               rollup_count, timer),
+                     extra=signal_payload)
+        return series
+
+    def _read_rollups(self, key, metric_object, aggregation_span, aggregation_type, first, last):
+        prefix = self.ROLLUP_HOURLY if aggregation_span == "hourly" else self.ROLLUP_DAILY
+        gen = self.table().row_generator(start_key=self.get_row_key(key, last),
+                                         end_key=self.get_row_key(key, first),
+                                         column_families=[metric_object.rollup_id],
+                                         column_range=(prefix, prefix + "~"))
+        points = []
+        for row_key, data_dict in gen:
+            for k, value in data_dict.items():
+                s = k.split(":")
+                if len(s) != 2 or not s[1].startswith(prefix):
+                    continue
+                bucket = int(s[1][1:])
+                if not first <= bucket <= last:
+                    continue
+                offset, count, total, min_value, max_value, _ = self._rollup_item.unpack(value)
+                if aggregation_type == "mean":
+                    value = total / count
+                elif aggregation_type == "count":
+                    value = float(count)
+                elif aggregation_type == "sum":
+                    value = total
+                elif aggregation_type == "min":
+                    value = min_value
+                elif aggregation_type == "max":
+                    value = max_value
+                else:
+                    value = max_value - min_value
+                points.append((bucket, offset, value))
+        return points
 
     def insert(self, key, metric, data):
         ts = TimeSeries(key, metric, data)
@@ -442,25 +896,41 @@ class TimeSeriesStore(object):
 
         metric_objects = [self.get_metric_object(m) for m in metrics]
 
-        row_keys = [self.get_row_key(key, ts) for ts in daily_timestamps(from_ts, to_ts)]
+        days = list(daily_timestamps(from_ts, to_ts))
+        row_keys = [self.get_row_key(key, ts) for ts in days]
         first_key = self.get_row_key(key, to_ts)
         last_key = self.get_row_key(key, from_ts)
         columns = ["{}".format(m.id) for m in metric_objects]
 
         timeseries = {m.id: TimeSeries(key, m.name) for m in metric_objects}
-        #res = self.table().read_rows(row_keys=row_keys, column_families=columns)
-        #gen = self.table().row_generator(row_keys=row_keys, column_families=columns)
-        gen = self.table().row_generator(start_key=first_key, end_key=last_key, column_families=columns)
+        cached = 0
+        to_cache = []
+        if self.row_cache is not None:
+            epoch = self._row_cache_epoch
+            missing, to_cache = self._read_row_cache(key, metric_objects, days, timeseries)
+            cached = len(days) * len(metric_objects) - len(missing)
+            read_keys = sorted(set(row_key for row_key, _ in missing))
+            missing_columns = set(metric_id for _, metric_id in missing)
+            read_columns = [c for c in columns if c in missing_columns]
+            # rows that go to the cache are read completely
+            column_range = None if to_cache else self._column_range(metric_objects, from_ts, to_ts)
+            if read_keys:
+                gen = self.table().row_generator(row_keys=read_keys, column_families=read_columns,
+                                                 column_range=column_range)
+            else:
+                gen = iter([])
+        else:
+            #res = self.table().read_rows(row_keys=row_keys, column_families=columns)
+            #gen = self.table().row_generator(row_keys=row_keys, column_families=columns)
+            column_range = self._column_range(metric_objects, from_ts, to_ts)
+            gen = self.table().row_generator(start_key=first_key, end_key=last_key, column_families=columns,
+                                             column_range=column_range)
 
-        for row_key, data_dict in gen:
-            for k in reversed(data_dict):
-                s = k.split(":")
-                if len(s) != 2:
-                    continue
-                m = s[0]
-                if m in timeseries.keys():
-                    ts = int(s[1])
-                    timeseries[m].insert_storage_item(ts, data_dict[k])
+        self._insert_rows(gen, timeseries)
+
+        # skip filling the cache if there were writes in the meantime
+        if to_cache and epoch == self._row_cache_epoch:
+            self._fill_row_cache(key, timeseries, to_cache)
 
         out = []
         size = 0
@@ -472,20 +942,180 @@ class TimeSeriesStore(object):
 
         timer = time.time() - timer
         # emit signal
-        signal_payload = {"count": len(row_keys), "row_keys": row_keys, "timer": timer, "method": "GET"}
+        signal_payload = {"count": len(row_keys), "row_keys": row_keys, "timer": timer, "method": "GET",
+                          "cached": cached}
         sig = signal('timeseries.get')
         sig.send(self, info=signal_payload)
         logger.debug("GET: {}.{}, {} points in {}".format(key, metrics, size, timer), extra=signal_payload)
         # print("GET: {}.{}, {} points in {}".format(key, metrics, size, timer))
         return out
 
+    def _insert_rows(self, rows, timeseries):
+        # adds the point and block cells of the rows to the timeseries by metric id
+        items = defaultdict(list)
+        blocks = defaultdict(list)
+        for row_key, data_dict in rows:
+            for k in reversed(data_dict):
+                s = k.split(":")
+                if len(s) != 2:
+                    continue
+                m = s[0]
+                if m in timeseries:
+                    if s[1] == self.BLOCK_COLUMN:
+                        blocks[m].append(data_dict[k])
+                        continue
+                    ts = int(s[1])
+                    items[m].append((ts, data_dict[k]))
+        for m, metric_items in items.items():
+            timeseries[m].insert_storage_items(metric_items)
+        # blocks win over single point cells
+        for m, metric_blocks in blocks.items():
+            for block in metric_blocks:
+                timeseries[m].insert_storage_block(block)
+
+    @classmethod
+    def _column_range(cls, metric_objects, from_ts, to_ts):
+        # Qualifier range for the point cells, this only cuts the boundary rows.
+        # Qualifiers are compared as strings, so both ends need the same length.
+        # Block encoded metrics store the whole day in one cell.
+        if from_ts < 0 or len(str(from_ts)) != len(str(to_ts)):
+            return None
+        if any(m.block_encoding for m in metric_objects):
+            return None
+        return (str(from_ts), str(to_ts))
+
+    def _read_row_cache(self, key, metric_objects, days, timeseries):
+        # Fills timeseries from the cache, returns the (row_key, metric_id) pairs
+        # that have to be read and the ones of them that can be cached.
+        max_day = time.time() - self.ROW_CACHE_MIN_AGE - 24 * 60 * 60
+        missing = []
+        to_cache = []
+        for m in metric_objects:
+            for day in days:
+                row_key = self.get_row_key(key, day)
+                if m.delete_possible or day > max_day:
+                    missing.append((row_key, m.id))
+                    continue
+                columns = self.row_cache.get((row_key, m.id))
+                if columns is not None:
+                    timeseries[m.id].insert_columns(*columns)
+                    continue
+                missing.append((row_key, m.id))
+                to_cache.append((row_key, m.id))
+        return missing, to_cache
+
+    def _fill_row_cache(self, key, timeseries, to_cache):
+        row_columns = {}
+        for m in set(metric_id for _, metric_id in to_cache):
+            for day, timestamps, offsets, values in timeseries[m].daily_columns():
+                row_columns[(self.get_row_key(key, day), m)] = (timestamps, offsets, values)
+        for cache_key in to_cache:
+            timestamps, offsets, values = row_columns.get(cache_key, ([], [], []))
+            columns = (array("q", timestamps), array("i", offsets), array("d", values))
+            self.row_cache.put(cache_key, columns, size=max(1, len(timestamps)))
+
+    def _invalidate_rows(self, row_keys, metric_ids):
+        if self.row_cache is None:
+            return
+        self._row_cache_epoch += 1
+        for row_key in row_keys:
+            for metric_id in metric_ids:
+                self.row_cache.invalidate((row_key, metric_id))
+
+    def get_timeseries_multi(self, keys, metrics, from_ts, to_ts):
+        """Generator yielding (key, [TimeSeries]) for every key as soon as it is read.
+        Keys are fetched in parallel if the engine supports threading.
+        """
+        timer = time.time()
+        keys = list(keys)
+        done = 0
+        try:
+            if not self.connection_object.threaded_engines:
+                for key in keys:
+                    res = self.get_timeseries(key, metrics, from_ts, to_ts)
+                    done += 1
+                    yield (key, res)
+            else:
+                def get(key):
+                    try:
+                        return self.get_timeseries(key, metrics, from_ts, to_ts)
+                    finally:
+                        # the worker gives its engine back to the pool
+                        self.connection_object.release_engine()
+
+                executor = self.executor()
+                futures = {executor.submit(get, key): key for key in keys}
+                try:
+                    for f in as_completed(futures):
+                        res = f.result()
+                        done += 1
+                        yield (futures[f], res)
+                finally:
+                    for f in futures:
+                        f.cancel()
+        finally:
+            # fetches stopped by the consumer or an error are counted as well
+            timer = time.time() - timer
+            # emit signal
+            signal_payload = {"count": len(keys), "done": done, "timer": timer, "method": "MULTI"}
+            sig = signal('timeseries.multi')
+            sig.send(self, info=signal_payload)
+            logger.debug("MULTI: {}/{} keys, {} in {}".format(done, len(keys), metrics, timer),
+                         extra=signal_payload)
+
     def get_single_timeseries(self, key, metric, from_ts, to_ts):
         return self.get_timeseries(key, [metric], from_ts, to_ts)[0]
 
+    def iter_timeseries(self, key, metrics, from_ts, to_ts):
+        """Generator yielding the timeseries day by day, newest day first.
+        All days are read with one range scan and every row is yielded as it
+        arrives. Days without any data are skipped, there is no size limit.
+        """
+        assert from_ts <= to_ts
+        assert len(metrics) > 0
+        timer = time.time()
+        key = key.lower()
+
+        metric_objects = [self.get_metric_object(m) for m in metrics]
+        columns = ["{}".format(m.id) for m in metric_objects]
+        gen = self.table().row_generator(start_key=self.get_row_key(key, to_ts),
+                                         end_key=self.get_row_key(key, from_ts), column_families=columns,
+                                         column_range=self._column_range(metric_objects, from_ts, to_ts))
+        count = 0
+        size = 0
+        for row in gen:
+            timeseries = {m.id: TimeSeries(key, m.name) for m in metric_objects}
+            self._insert_rows([row], timeseries)
+            out = []
+            for m in metric_objects:
+                t = timeseries[m.id]
+                t.trim(from_ts, to_ts)
+                out.append(t)
+            if any(bool(ts) for ts in out):
+                count += 1
+                size += sum(len(ts) for ts in out)
+                yield out
+
+        timer = time.time() - timer
+        # emit signal
+        signal_payload = {"count": count, "timer": timer, "method": "ITER"}
+        sig = signal('timeseries.get')
+        sig.send(self, info=signal_payload)
+        logger.debug("ITER: {}.{}, {} points in {}".format(key, metrics, size, timer), extra=signal_payload)
+
     def get_last_value(self, key, metric, min_ts=None, max_ts=None):
         """searches for the newest value for a given metric.
         min_ts gives the minimum to search.
         """
+        return self.get_last_values(key, [metric], min_ts=min_ts, max_ts=max_ts)[0]
+
+    def get_last_values(self, key, metrics, min_ts=None, max_ts=None):
+        """searches for the newest value of every metric.
+        With a LastValueStore and without limits this is a single row read.
+        Otherwise the newest row with any of the pending metrics is read, metrics
+        found there are done and the scan goes on after that row for the rest.
+        Only the newest cell of each metric is decoded.
+        """
         if max_ts is not None:
             start_search_row = self.get_row_key(key, max_ts)
         else:
@@ -496,40 +1126,91 @@ class TimeSeriesStore(object):
         else:
             end_search_row = "{}+".format(key)
 
-        metric_object = self.get_metric_object(metric)
-        columns = [metric_object.id]
+        metric_objects = [self.get_metric_object(m) for m in metrics]
+        timeseries = OrderedDict((m.id, TimeSeries(key, m.name)) for m in metric_objects)
+        pending = list(timeseries.keys())
 
         timer = time.time()
-        row_keys = []
-
-        series = TimeSeries(key, metric_object.name)
-        # Start scanning
-        row = self.table().get_first_row(start_search_row, column_families=columns, end_key=end_search_row)
-        if row is not None:
-            row_key, data_dict = row
-            row_keys.append(row_key)
-
-            # Append to Timeseries
-            for k, value in data_dict.items():
-                s = k.split(":")
-                if len(s) != 2:
-                    continue
-                m = s[0]
-                if m != metric_object.id:
-                    raise ValueError("wrong metric in database {} != {}".format(m, metric_object.id))
-                ts = int(s[1])
-                series.insert_storage_item(ts, value)
-
-        series.trim_count_newest(1)
+        last_value_store = None
+        if min_ts is None and max_ts is None:
+            last_value_store = self.last_value_store()
+        if last_value_store is not None:
+            for m, item in last_value_store.get_items(key, pending).items():
+                if item is not None:
+                    timeseries[m].insert_storage_items([item])
+                pending.remove(m)
+        scanned = list(pending)
+        row_keys = self._scan_last_values(timeseries, pending, start_search_row, end_search_row)
+
+        for t in timeseries.values():
+            t.trim_count_newest(1)
+
+        if last_value_store is not None and scanned and not self.connection_object.read_only:
+            # metrics written before the store existed
+            last_value_store.put_items(key, {m: self._last_item(timeseries[m]) for m in scanned})
 
         timer = time.time() - timer
         # emit signal
-        signal_payload = {"count": len(row_keys), "row_keys": row_keys, "timer": timer, "method": "SCAN"}
+        method = "SCAN" if scanned else "GET"
+        signal_payload = {"count": len(row_keys), "row_keys": row_keys, "timer": timer, "method": method}
         sig = signal('timeseries.last')
         sig.send(self, info=signal_payload)
-        logger.debug("SCAN: {}.{}, {} points in {}".format(key, metric, 1, timer), extra=signal_payload)
-        # print("SCAN: {}.{}, {} points in {}".format(key, metric, 1, timer))
-        return series
+        logger.debug("{}: {}.{}, {} rows in {}".format(method, key, metrics, len(row_keys), timer),
+                     extra=signal_payload)
+        return [timeseries[m.id] for m in metric_objects]
+
+    def _scan_last_values(self, timeseries, pending, start_search_row, end_search_row):
+        row_keys = []
+        table = self.table()
+        while pending:
+            row = table.get_first_row(start_search_row, column_families=pending, end_key=end_search_row)
+            if row is None:
+                break
+            row_key, data_dict = row
+            row_keys.append(row_key)
+            self._insert_last_values(data_dict, timeseries)
+            pending = [m for m in pending if len(timeseries[m]) == 0]
+            # continue after this row
+            start_search_row = row_key + "\x00"
+        return row_keys
+
+    def _repair_last_values(self, last_value_store, key, metric_objects, from_ts, to_ts):
+        # rescan the metrics whose stored newest point was deleted
+        items = last_value_store.get_items(key, [m.id for m in metric_objects])
+        timeseries = OrderedDict((m.id, TimeSeries(key, m.name)) for m in metric_objects
+                                 if items.get(m.id) is not None and from_ts <= items[m.id][0] <= to_ts)
+        if not timeseries:
+            return
+        self._scan_last_values(timeseries, list(timeseries.keys()), "{}#".format(key), "{}+".format(key))
+        last_value_store.put_items(key, {m: self._last_item(t) for m, t in timeseries.items()}, force=True)
+
+    @classmethod
+    def _last_item(cls, ts):
+        if ts.empty():
+            return None
+        return ts._storage_item_at(len(ts) - 1)
+
+    def _insert_last_values(self, data_dict, timeseries):
+        newest = {}
+        blocks = {}
+        for k, value in data_dict.items():
+            s = k.split(":")
+            if len(s) != 2:
+                continue
+            m = s[0]
+            if m not in timeseries:
+                raise ValueError("wrong metric in database {}".format(m))
+            if s[1] == self.BLOCK_COLUMN:
+                blocks[m] = value
+                continue
+            ts = int(s[1])
+            if m not in newest or ts > newest[m][0]:
+                newest[m] = (ts, value)
+        for m, item in newest.items():
+            timeseries[m].insert_storage_items([item])
+        # blocks win over single point cells
+        for m, block in blocks.items():
+            timeseries[m].insert_storage_block(block)
 
     def get_full_timeseries(self, key):
         return self.get_all_metrics(key, from_ts=None, to_ts=None)
@@ -556,21 +1237,34 @@ class TimeSeriesStore(object):
                                              column_families=None)
         
 
-        timeseries = defaultdict(lambda: TimeSeries(key, "_unknown"))
+        # reverse lookup
+        _all_ids = self.METRIC_ID_LOOKUP
+        items = defaultdict(list)
+        blocks = defaultdict(list)
         for row_key, data_dict in row_gen:
             for k in reversed(data_dict):
                 s = k.split(":")
                 if len(s) != 2:
                     continue
                 metric_id = s[0]
-                timestamp = int(s[1])
-                # reverse lookup
-                _all_ids = self.METRIC_ID_LOOKUP
+                if s[1][:1] in (self.ROLLUP_HOURLY, self.ROLLUP_DAILY):
+                    continue
                 if metric_id in _all_ids:
                     metric_name = _all_ids[metric_id].name
                 else:
                     metric_name = metric_id
-                timeseries[metric_name].insert_storage_item(timestamp, data_dict[k])
+                if s[1] == self.BLOCK_COLUMN:
+                    blocks[metric_name].append(data_dict[k])
+                    continue
+                timestamp = int(s[1])
+                items[metric_name].append((timestamp, data_dict[k]))
+
+        timeseries = defaultdict(lambda: TimeSeries(key, "_unknown"))
+        for metric_name, metric_items in items.items():
+            timeseries[metric_name].insert_storage_items(metric_items)
+        for metric_name, metric_blocks in blocks.items():
+            for block in metric_blocks:
+                timeseries[metric_name].insert_storage_block(block)
 
         size = 0
         for name, ts in timeseries.items():
@@ -593,10 +1287,7 @@ class TimeSeriesStore(object):
         logger.debug("FULL: {}, {} points in {}".format(key, size, timer), extra=signal_payload)
         return list(timeseries.values())
 
-    def get_last_values(self, key, metrics):
-        return [self.get_last_value(key, m) for m in metrics]
-
-    def delete_timeseries(self, key, metrics, from_ts, to_ts):
+    def delete_timeseries(self, key, metrics, from_ts, to_ts, keep_rollups=False):
         if self.connection_object.read_only:
             raise RuntimeError("Cannot execute delete_timeseries command in readonly mode")
 
@@ -613,10 +1304,21 @@ class TimeSeriesStore(object):
             if not m.delete_possible:
                 raise RuntimeError("Delete not possible on metric {}".format(m.name))
             columns.append("{}".format(m.id))
+            if m.rollups and not keep_rollups:
+                columns.append(m.rollup_id)
 
+        # buffered points would be written again by the next flush
+        if self.write_buffer is not None:
+            self.write_buffer.discard(row_keys, columns)
         table = self.table()
         for row_key in row_keys:
             table.delete_row(row_key, column_families=columns)
+        self._invalidate_rows(row_keys, columns)
+
+        last_value_store = self.last_value_store()
+        if last_value_store is not None:
+            self._repair_last_values(last_value_store, key, metric_objects,
+                                     ts_daily_left(from_ts), ts_daily_right(to_ts))
 
         timer = time.time() - timer
         count = len(row_keys)
@@ -628,6 +1330,89 @@ class TimeSeriesStore(object):
         # print("DELETE: {}.{}, {} days in {}".format(key, metrics, count, timer))
         return count
 
+
+class LastValueStore(object):
+    """Newest point per key and metric, maintained on insert.
+    One row per key, one cell per metric id with the timestamp and the
+    storage item of the newest point. An empty cell means the metric has no
+    data. Buffered inserts are written here when they are flushed.
+    The compare and write of a row holds a lock per row key, this makes
+    concurrent writers of one process safe, not writers in other processes.
+    """
+    TABLENAME = "lastvalues"
+    TABLEOPTIONS = {}
+    STOREID = "lastvalues"
+    COLUMN_FAMILY = "v"
+    ROW_LOCKS = 64
+    _item = struct.Struct(">q")
+
+    def __init__(self, connection_object):
+        self.connection_object = connection_object
+        self._row_locks = [threading.Lock() for _ in range(self.ROW_LOCKS)]
+
+    def _row_lock(self, key):
+        return self._row_locks[hash(key) % self.ROW_LOCKS]
+
+    def table(self):
+        return self.connection_object.get_table(self.TABLENAME)
+
+    @classmethod
+    def get_table_definitions(cls):
+        return {cls.TABLENAME: [cls.COLUMN_FAMILY]}
+
+    @classmethod
+    def get_row_key(cls, key):
+        return key
+
+    def get_items(self, key, metric_ids):
+        """Returns a dict metric_id -> (ts, storage bytes), None if the metric has no data.
+        Metrics that were never written are missing.
+        """
+        try:
+            data_dict = self.table().read_row(self.get_row_key(key), column_families=[self.COLUMN_FAMILY])
+        except KeyError:
+            return {}
+        items = {}
+        for m in metric_ids:
+            value = data_dict.get("{}:{}".format(self.COLUMN_FAMILY, m))
+            if value is None:
+                continue
+            if len(value) == 0:
+                items[m] = None
+            else:
+                items[m] = (self._item.unpack(value[:8])[0], value[8:])
+        return items
+
+    def put_items(self, key, items, force=False):
+        """Writes metric_id -> (ts, storage bytes) or None.
+        Without force only items newer than the stored ones and missing cells
+        are written. Returns the number of written cells.
+        """
+        if self.connection_object.read_only:
+            raise RuntimeError("Cannot execute put_items in readonly mode")
+
+        with self._row_lock(key):
+            if not force:
+                current = self.get_items(key, list(items.keys()))
+                items = {m: item for m, item in items.items()
+                         if m not in current or (item is not None and (current[m] is None or item[0] > current[m][0]))}
+            if not items:
+                return 0
+
+            data = {}
+            for m, item in items.items():
+                cn = "{}:{}".format(self.COLUMN_FAMILY, m)
+                data[cn] = b"" if item is None else self._item.pack(item[0]) + item[1]
+            self.table().upsert_rows([RowUpsert(self.get_row_key(key), data)])
+            return len(data)
+
+    def update(self, ts, metric_id):
+        # newest point of an inserted timeseries
+        if ts.empty():
+            return 0
+        return self.put_items(ts.key, {metric_id: ts._storage_item_at(len(ts) - 1)})
+
+
 class EventStore(object):
     """
     Event Store.
@@ -659,10 +1444,9 @@ class EventStore(object):
         return {cls.TABLENAME: ["e"]}
 
     def get_type_for_name(self, name):
-        for ev_def in self.EVENTS:
-            if ((ev_def.name[-1] == "*" and name.startswith(ev_def.name[:-1]))
-                or ev_def.name == name):
-                return EventSeriesType(ev_def.type.value)
+        ev_def = self.connection_object.event_lookup.match(name)
+        if ev_def is not None:
+            return EventSeriesType(ev_def.type.value)
         return self.DEFAULT_SERIES_TYPE
 
     @classmethod
@@ -796,6 +1580,24 @@ class EventStore(object):
         # print("GET EVENTS: {}.{}, {} points in {}".format(key, name, len(events), timer))
         return events
 
+    def iter_events(self, key, name, from_ts, to_ts):
+        """Generator yielding the events row by row (daily or monthly).
+        Rows without any events are skipped. The size limit applies per row only.
+        """
+        assert from_ts <= to_ts
+        t = self.get_type_for_name(name)
+        if t == EventSeriesType.DAILY:
+            it = ((ts, ts + 24*60*60 - 1) for ts in daily_timestamps(from_ts, to_ts))
+        elif t == EventSeriesType.MONTHLY:
+            it = ((ts, ts_monthly_left(ts + 32*24*60*60) - 1) for ts in monthly_timestamps(from_ts, to_ts))
+        else:
+            raise ValueError("invalid EventSeriesType")
+
+        for start, end in it:
+            events = self.get_events(key, name, max(from_ts, start), min(to_ts, end))
+            if len(events) > 0:
+                yield events
+
     def get_last_event(self, key, name):
         return self.get_last_events(key, name, count=1)
 
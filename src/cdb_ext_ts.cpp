@@ -1,6 +1,10 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
+#include <pybind11/numpy.h>
 #include <vector>
+#include <algorithm>
+#include <cmath>
+#include <cstring>
 #include <ctime>
 
 #include "data_item.hpp"
@@ -52,15 +56,371 @@ namespace pybind11 { namespace detail {
 }}
 
 
-typedef std::deque<data_item> data_deque;
 typedef std::tuple<std::string, double> iso_item;
 typedef std::tuple<int64_t, int32_t, double> c_data_item;
 
 
+// Read a column from a python object. Buffers with a matching item type
+// are copied directly, everything else is iterated and converted.
+template <typename T>
+static std::vector<T> load_column(const py::handle &obj) {
+    std::vector<T> out;
+    if (PyObject_CheckBuffer(obj.ptr())) {
+        py::buffer_info info = py::reinterpret_borrow<py::buffer>(obj).request();
+        if (info.ndim == 1 && py::detail::compare_buffer_info<T>::compare(info)) {
+            out.resize(info.shape[0]);
+            const char *ptr = static_cast<const char *>(info.ptr);
+            for (py::ssize_t i = 0; i < info.shape[0]; i++) {
+                std::memcpy(&out[i], ptr + i * info.strides[0], sizeof(T));
+            }
+            return out;
+        }
+    }
+    if (py::isinstance<py::sequence>(obj))
+        out.reserve(py::len(obj));
+    for (auto item : obj) {
+        out.push_back(item.cast<T>());
+    }
+    return out;
+}
+
+
+// Keeps the owning timeseries alive while a numpy view on one of its
+// columns exists and counts the open exports.
+struct export_guard {
+    size_t *counter;
+    PyObject *owner;
+};
+
+
+// Block encoding (format 3), one cell holds many points:
+//   header:  format byte, uint32 point count (little endian)
+//   first:   ts (64 bit), offset (32 bit), value (64 bit)
+//   others:  delta of delta timestamp, offset changed flag, xor value
+// all fields after the header are a msb first bit stream.
+const uint8_t BLOCK_FORMAT = 3;
+
+
+class bit_writer {
+    public:
+        void write(const uint64_t &value, unsigned nbits) {
+            while (nbits > 0) {
+                if (_used == 0)
+                    _buf.push_back(0);
+                const unsigned free = 8 - _used;
+                const unsigned take = std::min(nbits, free);
+                const uint8_t bits = (value >> (nbits - take)) & ((1u << take) - 1);
+                _buf.back() |= bits << (free - take);
+                _used = (_used + take) % 8;
+                nbits -= take;
+            }
+        }
+
+        std::string &data() { return _buf; }
+
+    private:
+        std::string _buf;
+        unsigned _used = 0;
+};
+
+
+class bit_reader {
+    public:
+        bit_reader(const std::string &data, size_t start) : _data(data), _pos(start * 8) { }
+
+        uint64_t read(unsigned nbits) {
+            uint64_t value = 0;
+            while (nbits > 0) {
+                if (_pos >= _data.size() * 8)
+                    throw py::value_error("block is truncated");
+                const unsigned avail = 8 - _pos % 8;
+                const unsigned take = std::min(nbits, avail);
+                const uint8_t byte = static_cast<uint8_t>(_data[_pos / 8]);
+                value = (value << take) | ((byte >> (avail - take)) & ((1u << take) - 1));
+                _pos += take;
+                nbits -= take;
+            }
+            return value;
+        }
+
+    private:
+        const std::string &_data;
+        size_t _pos;
+};
+
+
+static inline uint64_t double_bits(const double &v) {
+    uint64_t bits;
+    std::memcpy(&bits, &v, sizeof(bits));
+    return bits;
+}
+
+
+static inline double bits_double(const uint64_t &bits) {
+    double v;
+    std::memcpy(&v, &bits, sizeof(v));
+    return v;
+}
+
+
+static inline unsigned leading_zeros(uint64_t x) {
+#if defined(__GNUC__) || defined(__clang__)
+    return __builtin_clzll(x);
+#else
+    unsigned n = 0;
+    while (!(x & (1ULL << 63))) { x <<= 1; n++; }
+    return n;
+#endif
+}
+
+
+static inline unsigned trailing_zeros(uint64_t x) {
+#if defined(__GNUC__) || defined(__clang__)
+    return __builtin_ctzll(x);
+#else
+    unsigned n = 0;
+    while (!(x & 1ULL)) { x >>= 1; n++; }
+    return n;
+#endif
+}
+
+
+static std::string encode_block(const int64_t *ts, const int32_t *offsets, const double *values, const size_t &n) {
+    std::string out;
+    out.push_back(static_cast<char>(BLOCK_FORMAT));
+    const uint32_t count = static_cast<uint32_t>(n);
+    for (int k = 0; k < 4; k++)
+        out.push_back(static_cast<char>((count >> (8 * k)) & 0xff));
+    if (n == 0)
+        return out;
+
+    bit_writer w;
+    w.write(static_cast<uint64_t>(ts[0]), 64);
+    w.write(static_cast<uint32_t>(offsets[0]), 32);
+    uint64_t prev_bits = double_bits(values[0]);
+    w.write(prev_bits, 64);
+
+    int64_t prev_delta = 0;
+    int prev_lead = -1;
+    int prev_trail = 0;
+    for (size_t i = 1; i < n; i++) {
+        const int64_t delta = static_cast<int64_t>(static_cast<uint64_t>(ts[i]) - static_cast<uint64_t>(ts[i - 1]));
+        const int64_t dod = static_cast<int64_t>(static_cast<uint64_t>(delta) - static_cast<uint64_t>(prev_delta));
+        prev_delta = delta;
+        if (dod == 0) {
+            w.write(0, 1);
+        } else if (dod >= -63 && dod <= 64) {
+            w.write(0x2, 2);
+            w.write(dod + 63, 7);
+        } else if (dod >= -255 && dod <= 256) {
+            w.write(0x6, 3);
+            w.write(dod + 255, 9);
+        } else if (dod >= -2047 && dod <= 2048) {
+            w.write(0xe, 4);
+            w.write(dod + 2047, 12);
+        } else {
+            w.write(0xf, 4);
+            w.write(static_cast<uint64_t>(dod), 64);
+        }
+
+        if (offsets[i] == offsets[i - 1]) {
+            w.write(0, 1);
+        } else {
+            w.write(1, 1);
+            w.write(static_cast<uint32_t>(offsets[i]), 32);
+        }
+
+        const uint64_t bits = double_bits(values[i]);
+        const uint64_t x = bits ^ prev_bits;
+        prev_bits = bits;
+        if (x == 0) {
+            w.write(0, 1);
+            continue;
+        }
+        const int lead = std::min(leading_zeros(x), 31u);
+        const int trail = trailing_zeros(x);
+        if (prev_lead >= 0 && lead >= prev_lead && trail >= prev_trail) {
+            w.write(0x2, 2);
+            w.write(x >> prev_trail, 64 - prev_lead - prev_trail);
+        } else {
+            const int length = 64 - lead - trail;
+            w.write(0x3, 2);
+            w.write(lead, 5);
+            w.write(length & 0x3f, 6);
+            w.write(x >> trail, length);
+            prev_lead = lead;
+            prev_trail = trail;
+        }
+    }
+    out += w.data();
+    return out;
+}
+
+
+static void decode_block(const std::string &data, std::vector<int64_t> &ts,
+                         std::vector<int32_t> &offsets, std::vector<double> &values) {
+    if (data.size() < 5)
+        throw py::value_error("block is truncated");
+    if (static_cast<uint8_t>(data[0]) != BLOCK_FORMAT)
+        throw py::value_error("unknown block format: " + std::to_string(static_cast<uint8_t>(data[0])));
+    uint32_t count = 0;
+    for (int k = 0; k < 4; k++)
+        count |= static_cast<uint32_t>(static_cast<uint8_t>(data[1 + k])) << (8 * k);
+    ts.reserve(count);
+    offsets.reserve(count);
+    values.reserve(count);
+    if (count == 0)
+        return;
+
+    bit_reader r(data, 5);
+    int64_t t = static_cast<int64_t>(r.read(64));
+    int32_t offset = static_cast<int32_t>(static_cast<uint32_t>(r.read(32)));
+    uint64_t bits = r.read(64);
+    ts.push_back(t);
+    offsets.push_back(offset);
+    values.push_back(bits_double(bits));
+
+    int64_t delta = 0;
+    int lead = 0;
+    int trail = 0;
+    for (uint32_t i = 1; i < count; i++) {
+        int64_t dod;
+        if (r.read(1) == 0)
+            dod = 0;
+        else if (r.read(1) == 0)
+            dod = static_cast<int64_t>(r.read(7)) - 63;
+        else if (r.read(1) == 0)
+            dod = static_cast<int64_t>(r.read(9)) - 255;
+        else if (r.read(1) == 0)
+            dod = static_cast<int64_t>(r.read(12)) - 2047;
+        else
+            dod = static_cast<int64_t>(r.read(64));
+        delta = static_cast<int64_t>(static_cast<uint64_t>(delta) + static_cast<uint64_t>(dod));
+        t = static_cast<int64_t>(static_cast<uint64_t>(t) + static_cast<uint64_t>(delta));
+
+        if (r.read(1) == 1)
+            offset = static_cast<int32_t>(static_cast<uint32_t>(r.read(32)));
+
+        if (r.read(1) == 1) {
+            if (r.read(1) == 1) {
+                lead = static_cast<int>(r.read(5));
+                int length = static_cast<int>(r.read(6));
+                if (length == 0)
+                    length = 64;
+                trail = 64 - lead - length;
+                if (trail < 0)
+                    throw py::value_error("invalid block data");
+            }
+            bits ^= r.read(64 - lead - trail) << trail;
+        }
+        ts.push_back(t);
+        offsets.push_back(offset);
+        values.push_back(bits_double(bits));
+    }
+}
+
+
+enum class agg_function { sum, count, min, max, amp, mean, stdev, median };
+
+
+static agg_function parse_agg_function(const std::string &function) {
+    if (function == "sum") return agg_function::sum;
+    if (function == "count") return agg_function::count;
+    if (function == "min") return agg_function::min;
+    if (function == "max") return agg_function::max;
+    if (function == "amp") return agg_function::amp;
+    if (function == "mean") return agg_function::mean;
+    if (function == "stdev") return agg_function::stdev;
+    if (function == "median") return agg_function::median;
+    throw py::value_error("Invalid aggregation function: " + function);
+}
+
+
+static int64_t agg_group_width(const std::string &group) {
+    if (group == "hourly") return 60 * 60;
+    if (group == "daily") return 24 * 60 * 60;
+    if (group == "10min") return 10 * 60;
+    throw py::value_error("Invalid aggregation group: " + group);
+}
+
+
+static bool agg_local(const std::string &tz_mode) {
+    if (tz_mode == "utc") return false;
+    if (tz_mode == "local") return true;
+    throw py::value_error("Invalid tz_mode: " + tz_mode);
+}
+
+
+// Start of the bucket containing ts (floor, also for negative timestamps)
+static inline int64_t bucket_left(const int64_t &ts, const int64_t &width) {
+    int64_t r = ts % width;
+    if (r < 0)
+        r += width;
+    return ts - r;
+}
+
+
+static double agg_sum(const double *v, const size_t &n) {
+    double s = 0.0;
+    for (size_t i = 0; i < n; i++)
+        s += v[i];
+    return s;
+}
+
+
+// Sample standard deviation, 0 for less than two values
+static double agg_stdev(const double *v, const size_t &n) {
+    if (n < 2)
+        return 0.0;
+    const double m = agg_sum(v, n) / n;
+    double ss = 0.0;
+    for (size_t i = 0; i < n; i++)
+        ss += (v[i] - m) * (v[i] - m);
+    return std::sqrt(ss / (n - 1));
+}
+
+
+static double agg_median(const double *v, const size_t &n, std::vector<double> &scratch) {
+    scratch.assign(v, v + n);
+    const size_t mid = n / 2;
+    std::nth_element(scratch.begin(), scratch.begin() + mid, scratch.end());
+    const double upper = scratch[mid];
+    if (n % 2 == 1)
+        return upper;
+    const double lower = *std::max_element(scratch.begin(), scratch.begin() + mid);
+    return (lower + upper) / 2;
+}
+
+
+static double agg_reduce(const agg_function &f, const double *v, const size_t &n, std::vector<double> &scratch) {
+    switch (f) {
+        case agg_function::sum:
+            return agg_sum(v, n);
+        case agg_function::count:
+            return static_cast<double>(n);
+        case agg_function::min:
+            return *std::min_element(v, v + n);
+        case agg_function::max:
+            return *std::max_element(v, v + n);
+        case agg_function::amp: {
+            auto mm = std::minmax_element(v, v + n);
+            return *mm.second - *mm.first;
+        }
+        case agg_function::mean:
+            return n == 1 ? v[0] : agg_sum(v, n) / n;
+        case agg_function::stdev:
+            return agg_stdev(v, n);
+        case agg_function::median:
+            return agg_median(v, n, scratch);
+    }
+    return 0.0;
+}
+
+
 class timeseries {
     public:
         timeseries(const std::string &key, const std::string &metric) :
-            key(key), metric(metric), _min_ts(0), _max_ts(0) { }
+            key(key), metric(metric), _exports(0) { }
 
         void setKey(const std::string &key_) { key = key_; }
 
@@ -68,33 +428,37 @@ class timeseries {
 
         const std::string my_repr() const { return "<timeseries '" + key + "." + metric + "'>"; }
 
-        const size_t my_len() const { return _data.size(); }
+        const size_t my_len() const { return _ts.size(); }
 
         bool remove_ts(const int64_t &ts) {
-            auto idx = lower_bound(_data.begin(), _data.end(), ts, data_compare_left);
-            int64_t ts_from_it = (*idx).ts;
-            if (ts_from_it == ts) {
-                _data.erase(idx);
+            check_exports();
+            auto idx = bisect_left(ts);
+            if (idx < _ts.size() && _ts[idx] == ts) {
+                erase_range(idx, idx + 1);
                 return true;
             }
             throw pybind11::key_error("timestamp: " + std::to_string(ts));
         }
 
         bool remove(const size_t &i) {
-            _data.erase(_data.begin() + i);
+            check_exports();
+            if (i >= _ts.size())
+                throw pybind11::index_error("index: " + std::to_string(i));
+            erase_range(i, i + 1);
             return true;
         }
 
         void trim_idx(const size_t &start_idx, const size_t &end_idx) {
-            if (start_idx >= _data.size())
+            check_exports();
+            if (start_idx >= _ts.size())
             {
-                _data.clear();
+                clear();
                 return;
             }
-            if (start_idx >= 1 && start_idx < _data.size())
-                _data.erase(_data.begin(), _data.begin() + start_idx);
-            if (end_idx < (_data.size() - 1))
-                _data.erase(_data.begin() + end_idx + 1, _data.end());
+            if (end_idx < (_ts.size() - 1))
+                erase_range(end_idx + 1, _ts.size());
+            if (start_idx >= 1)
+                erase_range(0, start_idx);
         }
 
         void trim_ts(const int64_t &start_ts, const int64_t &end_ts) {
@@ -103,87 +467,68 @@ class timeseries {
             if (idx2 > 0) {
                 trim_idx(idx1, idx2-1);
             } else {
-                _data.clear();
+                check_exports();
+                clear();
             }
         }
 
         const iso_item iso_at(const size_t &i) const {
-            data_item d = _data.at(i);
+            data_item d = item(i);
             auto arr = d.iso_format();
             std::string str(begin(arr), end(arr)-1);
             return std::make_tuple(str, d.value);
         }
 
         const py::bytes bytes_at(const size_t &i) const {
-            data_item d = _data.at(i);
+            data_item d = item(i);
             auto arr = d.to_bytes();
             std::string str(begin(arr), end(arr));
             return str;
         }
 
         const c_data_item at(const size_t &i) const {
-            data_item d = _data.at(i);
-            return std::make_tuple(d.ts, d.ts_offset, d.value);
+            return std::make_tuple(_ts.at(i), _offsets.at(i), _values.at(i));
         }
 
         const c_data_item at_ts(const int64_t &ts) {
-            auto idx = lower_bound(_data.begin(), _data.end(), ts, data_compare_left);
-            int64_t ts_from_it = (*idx).ts;
-            if (ts_from_it == ts) {
-                data_item d = *idx;
-                return std::make_tuple(d.ts, d.ts_offset, d.value);
+            auto idx = bisect_left(ts);
+            if (idx < _ts.size() && _ts[idx] == ts) {
+                return std::make_tuple(_ts[idx], _offsets[idx], _values[idx]);
             }
             throw pybind11::key_error("timestamp: " + std::to_string(ts));
         }
 
-        // const data_item &at(const size_t &i) const {
-        //     return _data.at(i);
-        // }
-
-        // const data_item &at_ts(const int64_t &ts) {
-        //     auto idx = lower_bound(_data.begin(), _data.end(), ts, data_compare_left);
-        //     int64_t ts_from_it = (*idx).ts;
-        //     if (ts_from_it == ts) {
-        //         return *idx;
-        //     }
-        //     throw pybind11::key_error("timestamp: " + std::to_string(ts));
-        // }
-
         const size_t nearest_index_of_ts(const int64_t &ts) {
-            auto idx = lower_bound(_data.begin(), _data.end(), ts, data_compare_left);
-            if (idx == _data.begin()) {
-                return idx - _data.begin();
+            auto idx = bisect_left(ts);
+            if (idx == 0) {
+                return idx;
             }
-            if (idx == _data.end()) {
-                return --idx - _data.begin();
+            if (idx == _ts.size()) {
+                return idx - 1;
             }
-            int64_t t2 = (*idx).ts;
-            int64_t t1 = (*--idx).ts;
+            int64_t t2 = _ts[idx];
+            int64_t t1 = _ts[idx - 1];
             if (abs(ts - t1) <= abs(ts - t2))
-                return idx - _data.begin();
-            return ++idx - _data.begin();
+                return idx - 1;
+            return idx;
         }
 
         const size_t index_of_ts(const int64_t &ts) {
-            auto idx = lower_bound(_data.begin(), _data.end(), ts, data_compare_left);
-            int64_t ts_from_it = (*idx).ts;
-            if (ts_from_it == ts) {
-                return idx - _data.begin();
+            auto idx = bisect_left(ts);
+            if (idx < _ts.size() && _ts[idx] == ts) {
+                return idx;
             }
             throw pybind11::key_error("timestamp: " + std::to_string(ts));
         }
 
-        static bool data_compare_left(const data_item& obj, int64_t ts) { return obj.ts < ts; }
-        static bool data_compare_right(int64_t ts, const data_item& obj) { return ts < obj.ts; }
-
         const size_t bisect_left(const int64_t &ts) const {
-            auto idx = lower_bound(_data.begin(), _data.end(), ts, data_compare_left);
-            return idx - _data.begin();
+            auto idx = lower_bound(_ts.begin(), _ts.end(), ts);
+            return idx - _ts.begin();
         }
 
         const size_t bisect_right(const int64_t &ts) const {
-            auto idx = upper_bound(_data.begin(), _data.end(), ts, data_compare_right);
-            return idx - _data.begin();
+            auto idx = upper_bound(_ts.begin(), _ts.end(), ts);
+            return idx - _ts.begin();
         }
 
         bool insert_iso(const std::string &iso_ts, const double &value) {
@@ -192,54 +537,287 @@ class timeseries {
         }
 
         bool insert(const int64_t &ts, const int32_t &ts_offset, const double &value) {
-            data_item d = {ts, ts_offset, value};
-            // Empty
-            if (_data.size() == 0) {
-                _data.push_back(d);
-                _max_ts = ts;
-                _min_ts = ts;
-                return true;
-            }
-
-            // Insert Back
-            if (ts > _max_ts) {
-                _data.push_back(d);
-                _max_ts = ts;
-                return true;
-            }
-
-            // Insert Front
-            if (ts < _min_ts) {
-                _data.push_front(d);
-                _min_ts = ts;
+            check_exports();
+            // Insert Back (also covers the empty case)
+            if (_ts.empty() || ts > _ts.back()) {
+                _ts.push_back(ts);
+                _offsets.push_back(ts_offset);
+                _values.push_back(value);
                 return true;
             }
 
-            // Insert Mid
-            auto idx = lower_bound(_data.begin(), _data.end(), ts, data_compare_left);
-            data_item &item = _data.at(idx - _data.begin());
+            // Insert Mid / Front
+            auto idx = bisect_left(ts);
             // Replace
-            if (item.ts == ts) {
-                item.ts_offset = ts_offset;
-                item.value = value;
+            if (_ts[idx] == ts) {
+                _offsets[idx] = ts_offset;
+                _values[idx] = value;
                 return false;
             }
 
-            _data.insert(idx, d);
+            _ts.insert(_ts.begin() + idx, ts);
+            _offsets.insert(_offsets.begin() + idx, ts_offset);
+            _values.insert(_values.begin() + idx, value);
             return true;
         }
 
-        const int64_t &get_min_ts() const { return _min_ts; }
-        const int64_t &get_max_ts() const { return _max_ts; }
+        // Bulk insert, sorts and merges the batch in one pass.
+        // Duplicate timestamps: the last value wins (batch over existing,
+        // later batch items over earlier ones).
+        // Returns the number of new timestamps.
+        size_t insert_many(const py::object &ts_obj, const py::object &offset_obj, const py::object &value_obj) {
+            check_exports();
+            auto ts = load_column<int64_t>(ts_obj);
+            auto offsets = load_column<int32_t>(offset_obj);
+            auto values = load_column<double>(value_obj);
+            if (ts.size() != offsets.size() || ts.size() != values.size())
+                throw py::value_error("insert_many: columns have different lengths");
+            return merge_columns(ts, offsets, values);
+        }
+
+        const int64_t get_min_ts() const { return _ts.empty() ? 0 : _ts.front(); }
+        const int64_t get_max_ts() const { return _ts.empty() ? 0 : _ts.back(); }
+
+        // Copy all columns into python lists in one pass
+        py::tuple to_lists() const {
+            py::list ts(_ts.size());
+            py::list offsets(_ts.size());
+            py::list values(_ts.size());
+            for (size_t i = 0; i < _ts.size(); i++) {
+                ts[i] = py::int_(_ts[i]);
+                offsets[i] = py::int_(_offsets[i]);
+                values[i] = py::float_(_values[i]);
+            }
+            return py::make_tuple(ts, offsets, values);
+        }
+
+        // Zero-copy, read only numpy views on the columns.
+        // While a view exists the series cannot be modified.
+        template <typename T>
+        py::array export_column(const std::vector<T> &column, py::object owner) {
+            _exports++;
+            auto *guard = new export_guard{&_exports, owner.inc_ref().ptr()};
+            py::capsule base(guard, [](void *p) {
+                auto *g = static_cast<export_guard *>(p);
+                (*g->counter)--;
+                Py_DECREF(g->owner);
+                delete g;
+            });
+            py::array arr(py::dtype::of<T>(), {column.size()}, {sizeof(T)}, column.data(), base);
+            arr.attr("setflags")(py::arg("write") = false);
+            return arr;
+        }
+
+        const size_t export_count() const { return _exports; }
+
+        // Encode all points as a compressed block (format 3)
+        py::bytes to_block() const {
+            return py::bytes(encode_block(_ts.data(), _offsets.data(), _values.data(), _ts.size()));
+        }
+
+        // Decode a block and merge it into the series, the block wins on
+        // duplicate timestamps. Returns the number of new timestamps.
+        size_t insert_block(const py::bytes &block) {
+            check_exports();
+            std::vector<int64_t> ts;
+            std::vector<int32_t> offsets;
+            std::vector<double> values;
+            decode_block(block, ts, offsets, values);
+            return merge_columns(ts, offsets, values);
+        }
+
+        // Aggregate into hourly, daily or 10min buckets in one pass.
+        // Returns a new series with one point per bucket.
+        timeseries aggregate(const std::string &group, const std::string &function,
+                             const std::string &tz_mode) const {
+            const auto f = parse_agg_function(function);
+            timeseries out(key, metric);
+            std::vector<double> scratch;
+            for_each_bucket(group, tz_mode, [&](const int64_t &ts, const int32_t &offset,
+                                                const size_t &first, const size_t &last) {
+                out._ts.push_back(ts);
+                out._offsets.push_back(offset);
+                out._values.push_back(agg_reduce(f, _values.data() + first, last - first, scratch));
+            });
+            return out;
+        }
+
+        // All aggregations at once, returns (timestamps, offsets, values)
+        // with (count, sum, min, max, mean, stdev, median) tuples as values.
+        py::tuple aggregate_all(const std::string &group, const std::string &tz_mode) const {
+            std::vector<int64_t> bucket_ts;
+            std::vector<int32_t> bucket_offsets;
+            std::vector<std::pair<size_t, size_t>> ranges;
+            for_each_bucket(group, tz_mode, [&](const int64_t &ts, const int32_t &offset,
+                                                const size_t &first, const size_t &last) {
+                bucket_ts.push_back(ts);
+                bucket_offsets.push_back(offset);
+                ranges.emplace_back(first, last);
+            });
+
+            py::list ts(ranges.size());
+            py::list offsets(ranges.size());
+            py::list values(ranges.size());
+            std::vector<double> scratch;
+            for (size_t i = 0; i < ranges.size(); i++) {
+                const double *v = _values.data() + ranges[i].first;
+                const size_t n = ranges[i].second - ranges[i].first;
+                ts[i] = py::int_(bucket_ts[i]);
+                offsets[i] = py::int_(bucket_offsets[i]);
+                if (n <= 1) {
+                    values[i] = py::make_tuple(n, 0, 0, 0, 0, 0, 0);
+                    continue;
+                }
+                const double sum = agg_sum(v, n);
+                auto mm = std::minmax_element(v, v + n);
+                values[i] = py::make_tuple(n, sum, *mm.first, *mm.second, sum / n,
+                                           agg_stdev(v, n), agg_median(v, n, scratch));
+            }
+            return py::make_tuple(ts, offsets, values);
+        }
 
     public:
         std::string key;
         std::string metric;
 
+        std::vector<int64_t> _ts;
+        std::vector<int32_t> _offsets;
+        std::vector<double> _values;
+
     private:
-        data_deque _data;
-        int64_t _min_ts;
-        int64_t _max_ts;
+        data_item item(const size_t &i) const {
+            return {_ts.at(i), _offsets.at(i), _values.at(i)};
+        }
+
+        void check_exports() const {
+            if (_exports > 0)
+                throw py::buffer_error("Existing exports of data: timeseries cannot be modified");
+        }
+
+        void erase_range(const size_t &first, const size_t &last) {
+            _ts.erase(_ts.begin() + first, _ts.begin() + last);
+            _offsets.erase(_offsets.begin() + first, _offsets.begin() + last);
+            _values.erase(_values.begin() + first, _values.begin() + last);
+        }
+
+        void clear() {
+            _ts.clear();
+            _offsets.clear();
+            _values.clear();
+        }
+
+        // Sorts and merges a batch into the columns, see insert_many
+        size_t merge_columns(const std::vector<int64_t> &ts, const std::vector<int32_t> &offsets,
+                             const std::vector<double> &values) {
+            if (ts.empty())
+                return 0;
+
+            std::vector<size_t> order(ts.size());
+            for (size_t i = 0; i < order.size(); i++)
+                order[i] = i;
+            if (!std::is_sorted(ts.begin(), ts.end())) {
+                std::stable_sort(order.begin(), order.end(),
+                                 [&ts](size_t a, size_t b) { return ts[a] < ts[b]; });
+            }
+
+            // sorted batch without duplicates
+            std::vector<int64_t> b_ts;
+            std::vector<int32_t> b_offsets;
+            std::vector<double> b_values;
+            b_ts.reserve(ts.size());
+            b_offsets.reserve(ts.size());
+            b_values.reserve(ts.size());
+            for (auto idx : order) {
+                if (!b_ts.empty() && b_ts.back() == ts[idx]) {
+                    b_offsets.back() = offsets[idx];
+                    b_values.back() = values[idx];
+                    continue;
+                }
+                b_ts.push_back(ts[idx]);
+                b_offsets.push_back(offsets[idx]);
+                b_values.push_back(values[idx]);
+            }
+
+            // Append
+            if (_ts.empty() || b_ts.front() > _ts.back()) {
+                _ts.insert(_ts.end(), b_ts.begin(), b_ts.end());
+                _offsets.insert(_offsets.end(), b_offsets.begin(), b_offsets.end());
+                _values.insert(_values.end(), b_values.begin(), b_values.end());
+                return b_ts.size();
+            }
+
+            // Merge, everything before the first batch timestamp stays in place
+            const size_t first = bisect_left(b_ts.front());
+            const size_t n = _ts.size();
+            std::vector<int64_t> m_ts;
+            std::vector<int32_t> m_offsets;
+            std::vector<double> m_values;
+            m_ts.reserve(n - first + b_ts.size());
+            m_offsets.reserve(n - first + b_ts.size());
+            m_values.reserve(n - first + b_ts.size());
+
+            size_t i = first;
+            size_t j = 0;
+            size_t added = 0;
+            while (i < n || j < b_ts.size()) {
+                if (j == b_ts.size() || (i < n && _ts[i] < b_ts[j])) {
+                    m_ts.push_back(_ts[i]);
+                    m_offsets.push_back(_offsets[i]);
+                    m_values.push_back(_values[i]);
+                    i++;
+                    continue;
+                }
+                if (i == n || b_ts[j] < _ts[i]) {
+                    added++;
+                } else {
+                    // Replace
+                    i++;
+                }
+                m_ts.push_back(b_ts[j]);
+                m_offsets.push_back(b_offsets[j]);
+                m_values.push_back(b_values[j]);
+                j++;
+            }
+
+            erase_range(first, n);
+            _ts.insert(_ts.end(), m_ts.begin(), m_ts.end());
+            _offsets.insert(_offsets.end(), m_offsets.begin(), m_offsets.end());
+            _values.insert(_values.end(), m_values.begin(), m_values.end());
+            return added;
+        }
+
+        // Calls f(bucket_ts, offset, first, last) for every bucket, the
+        // grouping follows the python generators in cattledb.core.models:
+        // local buckets use ts + offset, 10min buckets are always utc aligned.
+        template <typename F>
+        void for_each_bucket(const std::string &group, const std::string &tz_mode, F &&f) const {
+            const int64_t width = agg_group_width(group);
+            const bool local = agg_local(tz_mode);
+            const bool local_groups = local && group != "10min";
+            const size_t n = _ts.size();
+            size_t i = 0;
+            while (i < n) {
+                size_t j = i + 1;
+                if (local_groups) {
+                    const int64_t upper = bucket_left(_ts[i] + _offsets[i], width) + width - 1;
+                    while (j < n && _ts[j] + _offsets[j] <= upper)
+                        j++;
+                } else {
+                    const int64_t upper = bucket_left(_ts[i], width) + width - 1;
+                    while (j < n && _ts[j] <= upper)
+                        j++;
+                }
+                int64_t bucket_ts;
+                if (local)
+                    bucket_ts = bucket_left(_ts[i] + _offsets[i], width) - _offsets[i];
+                else
+                    bucket_ts = bucket_left(_ts[i], width);
+                f(bucket_ts, _offsets[i], i, j);
+                i = j;
+            }
+        }
+
+        size_t _exports;
 };
 
 
@@ -252,6 +830,7 @@ PYBIND11_MODULE(cdb_ext_ts, m) {
         .def_readwrite("metric", &timeseries::metric)
         .def("insert", &timeseries::insert)
         .def("insert_iso", &timeseries::insert_iso)
+        .def("insert_many", &timeseries::insert_many)
         .def("at", &timeseries::at)
         .def("at_ts", &timeseries::at_ts)
         .def("index_of_ts", &timeseries::index_of_ts)
@@ -266,9 +845,44 @@ PYBIND11_MODULE(cdb_ext_ts, m) {
         .def("get_max_ts", &timeseries::get_max_ts)
         .def("remove_ts", &timeseries::remove_ts)
         .def("remove", &timeseries::remove)
+        .def("to_lists", &timeseries::to_lists)
+        .def("ts_array", [](py::object self) {
+            auto &t = self.cast<timeseries &>();
+            return t.export_column(t._ts, self);
+        })
+        .def("offset_array", [](py::object self) {
+            auto &t = self.cast<timeseries &>();
+            return t.export_column(t._offsets, self);
+        })
+        .def("value_array", [](py::object self) {
+            auto &t = self.cast<timeseries &>();
+            return t.export_column(t._values, self);
+        })
+        .def("export_count", &timeseries::export_count)
+        .def("to_block", &timeseries::to_block)
+        .def("insert_block", &timeseries::insert_block)
+        .def("aggregate", &timeseries::aggregate)
+        .def("aggregate_all", &timeseries::aggregate_all)
         .def("__len__", &timeseries::my_len)
         .def("__repr__", &timeseries::my_repr);
 
+    m.attr("BLOCK_FORMAT") = BLOCK_FORMAT;
+    m.def("encode_block", [](const py::object &ts_obj, const py::object &offset_obj, const py::object &value_obj) {
+        auto ts = load_column<int64_t>(ts_obj);
+        auto offsets = load_column<int32_t>(offset_obj);
+        auto values = load_column<double>(value_obj);
+        if (ts.size() != offsets.size() || ts.size() != values.size())
+            throw py::value_error("encode_block: columns have different lengths");
+        return py::bytes(encode_block(ts.data(), offsets.data(), values.data(), ts.size()));
+    });
+    m.def("decode_block", [](const py::bytes &block) {
+        std::vector<int64_t> ts;
+        std::vector<int32_t> offsets;
+        std::vector<double> values;
+        decode_block(block, ts, offsets, values);
+        return py::make_tuple(py::cast(ts), py::cast(offsets), py::cast(values));
+    });
+
 #ifdef VERSION_INFO
     m.attr("__version__") = VERSION_INFO;
 #else
@@ -1,10 +1,20 @@
 #!/usr/bin/python
 # coding: utf-8
 
+import os
+import tempfile
+
 from cattledb.storage.connection import Connection
 from cattledb.settings import testing as test_config
 
 
+# CDB_TEST_ENGINE runs the tests on another engine than the bigtable emulator
+_test_engine = os.environ.get("CDB_TEST_ENGINE")
+if _test_engine and _test_engine != "bigtable":
+    test_config.ENGINE = _test_engine
+    test_config.ENGINE_OPTIONS = {"data_dir": tempfile.mkdtemp(prefix="cdbtest"), "assert_limits": True}
+
+
 def get_unit_test_config():
     return test_config
 
@@ -7,6 +7,7 @@ import logging
 import pendulum
 import os
 import datetime
+import mock
 
 
 from cattledb.storage.connection import Connection
@@ -61,3 +62,34 @@ class ActivityStorageTest(unittest.TestCase):
         self.assertEqual(res[1].day_hour, "2018020512")
         self.assertEqual(res[2].device_id, "dev2")
         self.assertEqual(res[2].day_hour, "2018020513")
+
+    def test_bulk(self):
+        db = get_test_connection()
+        db.database_init(silent=True)
+
+        from blinker import signal
+        incr_func = mock.MagicMock(spec={})
+        signal("activity.incr").connect(incr_func)
+
+        t1 = pendulum.datetime(2018, 3, 5, 12, 0, tz='UTC').int_timestamp
+        t2 = pendulum.datetime(2018, 3, 5, 13, 0, tz='UTC').int_timestamp
+        db.activity.incr_activity("bulkreader1", "dev1", t1, parent_ids=["bulkparent1"])
+        items = [
+            {"reader_id": "bulkreader1", "device_id": "dev1", "timestamp": t1, "parent_ids": ["bulkparent1"]},
+            {"reader_id": "bulkreader1", "device_id": "dev1", "timestamp": t1 + 60, "parent_ids": ["bulkparent1"]},
+            {"reader_id": "bulkreader1", "device_id": "dev2", "timestamp": t2, "parent_ids": ["bulkparent1"], "value": 5},
+            {"reader_id": "bulkreader2", "device_id": "dev1", "timestamp": t1}
+        ]
+        res = db.activity.incr_activity_bulk(items)
+        self.assertEqual(len(res), 3)
+        self.assertEqual(res["t#29824745#bulkreader1"], {"c:12.dev1": 3, "c:13.dev2": 5})
+        self.assertEqual(res["bulkparent1#29824745#bulkreader1"], {"c:12.dev1": 3, "c:13.dev2": 5})
+        self.assertEqual(res["t#29824745#bulkreader2"], {"c:12.dev1": 1})
+        info = incr_func.call_args_list[-1][1]["info"]
+        self.assertEqual(info["method"], "BULK")
+        self.assertEqual(info["count"], 3)
+        signal("activity.incr").disconnect(incr_func)
+
+        res = db.activity.get_activity_for_reader("bulkreader1", t1, t2)
+        self.assertEqual([(r.day_hour, r.device_id, r.counter) for r in res],
+                         [("2018030512", "dev1", 3), ("2018030513", "dev2", 5)])
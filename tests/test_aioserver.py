@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# coding: utf-8
+
+import unittest
+import asyncio
+import time
+import grpc
+import pendulum
+
+from cattledb.grpcserver import _create_aio_server
+from cattledb.grpcserver import cdb_pb2, cdb_pb2_grpc
+from cattledb.storage.models import TimeSeries
+from .helper import get_unit_test_config, get_test_metrics
+
+
+class AioServerTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.server, self.channel = self.loop.run_until_complete(self.start())
+        self.db = self.server.db
+        self.db.add_metric_definitions(get_test_metrics())
+        self.db.database_init(silent=True)
+        self.stub = cdb_pb2_grpc.TimeSeriesStub(self.channel)
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.stop())
+        self.server.executor.shutdown()
+        self.loop.close()
+
+    async def start(self):
+        server = _create_aio_server(get_unit_test_config())
+        port = server.add_insecure_port("127.0.0.1:0")
+        await server.start()
+        channel = grpc.aio.insecure_channel("127.0.0.1:{}".format(port))
+        return server, channel
+
+    async def stop(self):
+        await self.channel.close()
+        await self.server.stop(None)
+
+    def series(self, key, metric, t, count):
+        return TimeSeries(key, metric, values=[(t + i * 600, float(i)) for i in range(count)]).to_proto()
+
+    def test_timeseries(self):
+        t = int(time.time()) - 10 * 24 * 60 * 60
+        t = t - t % (24 * 60 * 60)
+        from_dt = pendulum.from_timestamp(t).isoformat()
+        to_dt = pendulum.from_timestamp(t + 3 * 24 * 60 * 60 - 1).isoformat()
+        self.db.timeseries.delete_timeseries("aiokey", ["ph", "temp"], t - 24 * 60 * 60, t + 4 * 24 * 60 * 60)
+
+        async def work():
+            # unary
+            res = await self.stub.put(self.series("aiokey", "ph", t, 10))
+            self.assertEqual(res.counter, 10)
+
+            # client stream, three days of data
+            res = await self.stub.putStream(iter([self.series("aiokey", "ph", t + 10 * 600, 200),
+                                                  self.series("aiokey", "temp", t, 300)]))
+            self.assertEqual(res.code, 200)
+            self.assertEqual(res.counter, 500)
+
+            res = await self.stub.lastValues(cdb_pb2.LastValuesRequest(key="aiokey", metrics=["ph"]))
+            self.assertEqual(res.data[0].values[0], 199.0)
+
+            # server stream, one message per day
+            req = cdb_pb2.MultiTimeSeriesRequest(key="aiokey", metrics=["ph", "temp"],
+                                                 from_datetime=from_dt, to_datetime=to_dt)
+            days = [msg async for msg in self.stub.getStream(req)]
+            self.assertEqual(len(days), 3)
+            self.assertEqual(sum(len(s.timestamps) for d in days for s in d.data), 510)
+
+            # status codes set in the worker reach the client
+            with self.assertRaises(grpc.aio.AioRpcError) as cm:
+                await self.stub.get(cdb_pb2.TimeSeriesRequest(key="aiokey", metric="ph",
+                                                              from_datetime="nodate", to_datetime="nodate"))
+            self.assertEqual(cm.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)
+            self.assertIn("iso-timestamp", cm.exception.details())
+
+            bad = cdb_pb2.FloatTimeSeries(key="aiokey", metric="ph")
+            with self.assertRaises(grpc.aio.AioRpcError) as cm:
+                await self.stub.putStream(iter([self.series("aiokey", "ph", t, 5), bad]))
+            self.assertEqual(cm.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)
+
+        self.loop.run_until_complete(work())
@@ -0,0 +1,9 @@
+#!/usr/bin/python
+# coding: utf-8
+
+from cattledb.core._timeseries import ArrayTSList
+from . import test_pytimeseries
+
+
+class ArrayFallbackTest(test_pytimeseries.PyFallbackTest):
+    TSLIST = ArrayTSList
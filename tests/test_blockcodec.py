@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# coding: utf-8
+
+import unittest
+import random
+import math
+
+from cattledb.core._blockcodec import encode_block, decode_block, BLOCK_FORMAT
+from cattledb.core._timeseries import c_ext, FloatTSList, ArrayTSList
+
+
+def random_columns(n):
+    timestamps = sorted(random.sample(range(-10**12, 10**12), n))
+    offsets = [random.choice([0, 3600, 7200, -18000, -2**31, 2**31-1]) for _ in range(n)]
+    values = [random.choice([random.random(), -0.0, 0.0, 1.5, 1e308, float("inf"), 5e-324])
+              for _ in range(n)]
+    return timestamps, offsets, values
+
+
+class BlockCodecTest(unittest.TestCase):
+    def test_roundtrip(self):
+        for n in [0, 1, 2, 3, 50]:
+            for _ in range(20):
+                columns = random_columns(n)
+                block = encode_block(*columns)
+                self.assertEqual(block[0], BLOCK_FORMAT)
+                self.assertEqual(decode_block(block), columns)
+
+    def test_regular(self):
+        start = 1600000000
+        timestamps = [start + i * 60 for i in range(1440)]
+        offsets = [3600] * 720 + [7200] * 720
+        values = [round(20 + math.sin(i / 100.0), 1) for i in range(1440)]
+        block = encode_block(timestamps, offsets, values)
+        self.assertEqual(decode_block(block), (timestamps, offsets, values))
+        # 9 bytes per point plus the column name for single cells
+        self.assertLess(len(block), 1440 * 4)
+
+        block = encode_block(timestamps, offsets, [1.0] * 1440)
+        self.assertLess(len(block), 600)
+
+    def test_nan(self):
+        block = encode_block([1, 2], [0, 0], [float("nan"), 1.0])
+        timestamps, offsets, values = decode_block(block)
+        self.assertTrue(math.isnan(values[0]))
+        self.assertEqual(values[1], 1.0)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            encode_block([1, 2], [0], [1.0, 2.0])
+        block = encode_block([1, 2, 3], [0, 0, 0], [1.0, 2.0, 3.0])
+        with self.assertRaises(ValueError):
+            decode_block(block[:3])
+        with self.assertRaises(ValueError):
+            decode_block(block[:8])
+        with self.assertRaises(ValueError):
+            decode_block(b"\x01" + block[1:])
+
+    def test_container(self):
+        t = ArrayTSList("a", "b")
+        t.insert_many([10, 20, 30], [0, 0, 0], [1.0, 2.0, 3.0])
+        block = t.to_block()
+        t2 = ArrayTSList("a", "b")
+        t2.insert_many([5, 20], [0, 0], [0.5, 9.0])
+        self.assertEqual(t2.insert_block(block), 2)
+        self.assertEqual(t2.to_lists(), ([5, 10, 20, 30], [0, 0, 0, 0], [0.5, 1.0, 2.0, 3.0]))
+
+    @unittest.skipIf(not c_ext, "c extension not available")
+    def test_c_ext(self):
+        import cdb_ext_ts
+        self.assertEqual(cdb_ext_ts.BLOCK_FORMAT, BLOCK_FORMAT)
+        for n in [0, 1, 2, 50]:
+            for _ in range(20):
+                columns = random_columns(n)
+                block = encode_block(*columns)
+                self.assertEqual(cdb_ext_ts.encode_block(*columns), block)
+                self.assertEqual(cdb_ext_ts.decode_block(block), columns)
+
+        with self.assertRaises(ValueError):
+            cdb_ext_ts.decode_block(block[:8])
+        with self.assertRaises(ValueError):
+            cdb_ext_ts.decode_block(b"\x01" + block[1:])
+
+        t = FloatTSList("a", "b")
+        t.insert_many([5, 20], [0, 0], [0.5, 9.0])
+        self.assertEqual(t.insert_block(encode_block([10, 20, 30], [0, 0, 0], [1.0, 2.0, 3.0])), 2)
+        self.assertEqual(t.to_lists(), ([5, 10, 20, 30], [0, 0, 0, 0], [0.5, 1.0, 2.0, 3.0]))
+        self.assertEqual(t.to_block(), encode_block(*t.to_lists()))
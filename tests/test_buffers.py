@@ -0,0 +1,250 @@
+#!/usr/bin/python
+# coding: utf-8
+
+import unittest
+import threading
+import time
+import mock
+
+from blinker import signal
+
+from cattledb.storage.connection import Connection
+from cattledb.storage.buffers import TimeSeriesWriteBuffer, ActivityAggregator
+from cattledb.storage.models import RowUpsert
+from cattledb.storage.stores import LastValueStore
+from .helper import get_unit_test_config, get_test_metrics
+
+
+class _RecordingStore(object):
+    def __init__(self):
+        self.writes = []
+        self.connection_object = mock.MagicMock()
+
+    def _write_upserts(self, upserts, metric_ids):
+        self.writes.append((threading.current_thread(), upserts, metric_ids))
+        return [u.row_key for u in upserts]
+
+    def _update_last_values(self, upserts):
+        return 0
+
+
+class WriteBufferTest(unittest.TestCase):
+    def test_coalesce(self):
+        conf = get_unit_test_config()
+        engine_options = dict(conf.ENGINE_OPTIONS, write_buffer_size=1000)
+        db = Connection(engine=conf.ENGINE, engine_options=engine_options,
+                        metric_definitions=get_test_metrics())
+        db.database_init(silent=True)
+        # size triggered flushes in the adding thread, also with threaded engines
+        db.timeseries.write_buffer.background = False
+
+        put_func = mock.MagicMock(spec={})
+        signal("timeseries.put").connect(put_func)
+
+        start = 1546300800
+        for i in range(10):
+            # two points per insert, one in each of two day rows
+            db.timeseries.insert("buf1", "ph", [(start + i * 60, 1.0), (start + 24 * 60 * 60 + i * 60, 2.0)])
+            db.timeseries.insert("buf1", "temp", [(start + i * 60, 3.0)])
+        self.assertEqual(len(put_func.call_args_list), 0)
+        self.assertEqual(db.info()["write_buffer"]["points"], 30)
+        ph, temp = db.timeseries.get_timeseries("buf1", ["ph", "temp"], start, start + 2 * 24 * 60 * 60)
+        self.assertEqual(len(ph), 0)
+
+        self.assertEqual(db.flush(), 30)
+        self.assertEqual(len(put_func.call_args_list), 1)
+        info = put_func.call_args_list[0][1]["info"]
+        self.assertEqual(info["method"], "FLUSH")
+        self.assertEqual(info["count"], 2)
+        self.assertEqual(info["batch"], 20)
+        self.assertEqual(info["points"], 30)
+
+        ph, temp = db.timeseries.get_timeseries("buf1", ["ph", "temp"], start, start + 2 * 24 * 60 * 60)
+        self.assertEqual(len(ph), 20)
+        self.assertEqual(len(temp), 10)
+        self.assertEqual(db.flush(), 0)
+
+        # size triggered flush
+        for i in range(6):
+            db.timeseries.insert("buf2", "ph", [(start + i * 600 + j, 1.0) for j in range(200)])
+        self.assertEqual(len(put_func.call_args_list), 2)
+        self.assertEqual(put_func.call_args_list[1][1]["info"]["points"], 1000)
+        db.disconnect()
+        self.assertEqual(len(put_func.call_args_list), 3)
+        self.assertEqual(len(db.timeseries.get_single_timeseries("buf2", "ph", start, start + 24 * 60 * 60)), 1200)
+        signal("timeseries.put").disconnect(put_func)
+
+    def test_delete(self):
+        conf = get_unit_test_config()
+        engine_options = dict(conf.ENGINE_OPTIONS, write_buffer_size=1000, write_buffer_age=60)
+        db = Connection(engine=conf.ENGINE, engine_options=engine_options,
+                        metric_definitions=get_test_metrics())
+        db.database_init(silent=True)
+        start = 1546300800
+        db.timeseries.delete_timeseries("bufdel", ["ph", "temp"], start, start + 24 * 60 * 60)
+
+        db.timeseries.insert("bufdel", "ph", [(start + 60, 1.0)])
+        db.timeseries.insert("bufdel", "temp", [(start + 60, 2.0)])
+        self.assertEqual(db.timeseries.delete_timeseries("bufdel", ["ph"], start, start + 60), 1)
+        self.assertEqual(db.info()["write_buffer"]["points"], 1)
+        self.assertEqual(db.flush(), 1)
+        ph, temp = db.timeseries.get_timeseries("bufdel", ["ph", "temp"], start, start + 24 * 60 * 60)
+        self.assertEqual(len(ph), 0)
+        self.assertEqual(len(temp), 1)
+        db.disconnect()
+
+    def test_last_values(self):
+        conf = get_unit_test_config()
+        engine_options = dict(conf.ENGINE_OPTIONS, write_buffer_size=1000, write_buffer_age=60)
+        db = Connection(engine=conf.ENGINE, engine_options=engine_options,
+                        metric_definitions=get_test_metrics())
+        store = LastValueStore(db)
+        db.register_store(store)
+        db.database_init(silent=True)
+        start = 1546300800
+        db.timeseries.delete_timeseries("buflast", ["ph"], start, start + 2 * 24 * 60 * 60)
+        store.put_items("buflast", {"ph": None}, force=True)
+
+        # buffered points are not last values before they are stored
+        db.timeseries.insert("buflast", "ph", [(start + 60, 1.0), (start + 24 * 60 * 60, 2.0)])
+        self.assertIsNone(store.get_items("buflast", ["ph"])["ph"])
+        with mock.patch.object(db.timeseries, "_write_upserts", side_effect=ValueError("failed")):
+            with self.assertRaises(ValueError):
+                db.flush()
+        self.assertIsNone(store.get_items("buflast", ["ph"])["ph"])
+        self.assertEqual(db.flush(), 2)
+        self.assertEqual(store.get_items("buflast", ["ph"])["ph"][0], start + 24 * 60 * 60)
+        ph = db.timeseries.get_last_value("buflast", "ph")
+        self.assertEqual((ph[0].ts, ph[0].value), (start + 24 * 60 * 60, 2.0))
+        db.disconnect()
+
+    def test_background(self):
+        store = _RecordingStore()
+        buf = TimeSeriesWriteBuffer(store, max_points=100, max_age=0.05, max_pending=200)
+        buf.add([RowUpsert("a#1", {"ph:1": b"1"})], "ph", 1)
+        buf.add([RowUpsert("a#1", {"ph:2": b"2"}), RowUpsert("a#2", {"ph:3": b"3"})], "ph", 2)
+        for _ in range(100):
+            if store.writes:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(store.writes), 1)
+        thread, upserts, metric_ids = store.writes[0]
+        self.assertNotEqual(thread, threading.current_thread())
+        self.assertEqual(sorted(u.row_key for u in upserts), ["a#1", "a#2"])
+        self.assertEqual(len(buf), 0)
+        for _ in range(100):
+            if store.connection_object.release_engine.called:
+                break
+            time.sleep(0.01)
+        self.assertTrue(store.connection_object.release_engine.called)
+
+        # backpressure, the caller flushes
+        buf.max_age = 60
+        buf.add([RowUpsert("a#3", {"ph:{}".format(i): b"1" for i in range(250)})], "ph", 250)
+        self.assertEqual(len(store.writes), 2)
+        self.assertEqual(store.writes[1][0], threading.current_thread())
+
+        buf.add([RowUpsert("a#4", {"ph:1": b"1"})], "ph", 1)
+        self.assertEqual(buf.close(), 1)
+        with self.assertRaises(RuntimeError):
+            buf.add([RowUpsert("a#4", {"ph:1": b"1"})], "ph", 1)
+
+    def test_failed_flush(self):
+        store = _RecordingStore()
+        buf = TimeSeriesWriteBuffer(store, max_points=100, background=False)
+        buf.add([RowUpsert("a#1", {"ph:1": b"1", "ph:2": b"2"})], "ph", 2)
+        with mock.patch.object(store, "_write_upserts", side_effect=ValueError("failed")):
+            with self.assertRaises(ValueError):
+                buf.flush()
+        self.assertEqual(len(buf), 2)
+        buf.add([RowUpsert("a#1", {"ph:2": b"3"})], "ph", 1)
+        self.assertEqual(buf.flush(), 3)
+        self.assertEqual(store.writes[0][1][0].cells, {"ph:1": b"1", "ph:2": b"3"})
+
+    def test_max_pending(self):
+        store = _RecordingStore()
+        buf = TimeSeriesWriteBuffer(store, max_points=100, max_pending=20, background=False)
+        with mock.patch.object(store, "_write_upserts", side_effect=ValueError("failed")):
+            buf.add([RowUpsert("a#1", {"ph:{}".format(i): b"1" for i in range(10)})], "ph", 10)
+            # the add that fills the buffer flushes
+            with self.assertRaises(ValueError):
+                buf.add([RowUpsert("a#2", {"ph:{}".format(i): b"1" for i in range(10)})], "ph", 10)
+            # the full buffer is not extended while the backend is down
+            for _ in range(3):
+                with self.assertRaises(ValueError):
+                    buf.add([RowUpsert("a#3", {"ph:1": b"1"})], "ph", 1)
+            self.assertEqual(len(buf), 20)
+            self.assertEqual(buf.info()["rows"], 2)
+        buf.add([RowUpsert("a#3", {"ph:1": b"1"})], "ph", 1)
+        self.assertEqual(len(store.writes), 1)
+        self.assertEqual(len(buf), 1)
+
+
+class ActivityAggregatorTest(unittest.TestCase):
+    def test_aggregate(self):
+        conf = get_unit_test_config()
+        engine_options = dict(conf.ENGINE_OPTIONS, activity_buffer_size=100)
+        db = Connection(engine=conf.ENGINE, engine_options=engine_options)
+        db.database_init(silent=True)
+
+        incr_func = mock.MagicMock(spec={})
+        signal("activity.incr").connect(incr_func)
+
+        t = 1546300800 + 12 * 60 * 60
+        for i in range(50):
+            res = db.activity.incr_activity("aggreader1", "dev{}".format(i % 2), t + i, parent_ids=["aggparent1"])
+            self.assertEqual(res, [1, 1])
+        self.assertEqual(len(incr_func.call_args_list), 0)
+        self.assertEqual(db.info()["activity_buffer"]["cells"], 4)
+        self.assertEqual(db.activity.get_activity_for_reader("aggreader1", t, t + 60), [])
+
+        db.flush()
+        self.assertEqual(len(incr_func.call_args_list), 1)
+        self.assertEqual(incr_func.call_args_list[0][1]["info"]["count"], 2)
+        res = db.activity.get_activity_for_reader("aggreader1", t, t + 60)
+        self.assertEqual([(r.device_id, r.counter) for r in res], [("dev0", 25), ("dev1", 25)])
+
+        db.activity.incr_activity("aggreader1", "dev0", t, value=5)
+        db.disconnect()
+        res = db.activity.get_activity_for_reader("aggreader1", t, t + 60)
+        self.assertEqual([(r.device_id, r.counter) for r in res], [("dev0", 30), ("dev1", 25)])
+        signal("activity.incr").disconnect(incr_func)
+
+    def test_failed_rows(self):
+        class _Store(object):
+            def __init__(self):
+                self.rows = []
+                self.down = False
+
+            def _incr_rows(self, rows, done=None):
+                if self.down:
+                    raise RuntimeError("no table")
+                for r, column_values in rows.items():
+                    if r != "bad":
+                        self.rows.append((r, column_values))
+                        done[r] = column_values
+                if "bad" in rows:
+                    raise ValueError("failed")
+
+        store = _Store()
+        agg = ActivityAggregator(store, max_cells=3, background=False)
+        agg.add(["good", "bad"], "c:01.dev1", 1)
+        self.assertEqual(len(store.rows), 0)
+        agg.add(["good", "bad"], "c:01.dev1", 2)
+        with self.assertRaises(ValueError):
+            agg.add(["good"], "c:02.dev1", 1)
+        self.assertEqual(store.rows, [("good", {"c:01.dev1": 3, "c:02.dev1": 1})])
+        self.assertEqual(len(agg), 1)
+        agg.add(["bad"], "c:01.dev1", 1)
+        self.assertEqual(agg.info()["cells"], 1)
+        with self.assertRaises(ValueError):
+            agg.flush()
+        self.assertEqual(agg._rows, {"bad": {"c:01.dev1": 4}})
+
+        # nothing is lost if the call fails before any row is written
+        store.down = True
+        agg.add(["good"], "c:03.dev1", 1)
+        with self.assertRaises(RuntimeError):
+            agg.flush()
+        self.assertEqual(agg._rows, {"bad": {"c:01.dev1": 4}, "good": {"c:03.dev1": 1}})
+        self.assertEqual(agg.info()["cells"], 2)
@@ -0,0 +1,36 @@
+#!/usr/bin/python
+# coding: utf-8
+
+import unittest
+
+from cattledb.storage.cache import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_lru(self):
+        c = LRUCache(10)
+        c.put("a", 1, size=4)
+        c.put("b", 2, size=4)
+        self.assertEqual(c.get("a"), 1)
+        # b is the least recently used entry
+        c.put("c", 3, size=4)
+        self.assertNotIn("b", c)
+        self.assertEqual(c.get("b"), None)
+        self.assertEqual(c.size, 8)
+        self.assertEqual(c.info()["hits"], 1)
+        self.assertEqual(c.info()["misses"], 1)
+
+        # replace
+        c.put("a", 5, size=1)
+        self.assertEqual(c.size, 5)
+        self.assertEqual(c.get("a"), 5)
+
+        self.assertFalse(c.put("d", 4, size=11))
+        self.assertTrue(c.invalidate("c"))
+        self.assertFalse(c.invalidate("c"))
+        self.assertEqual(len(c), 1)
+        self.assertEqual(c.size, 1)
+
+        c.clear()
+        self.assertEqual(len(c), 0)
+        self.assertEqual(c.size, 0)
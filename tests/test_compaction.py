@@ -0,0 +1,65 @@
+#!/usr/bin/python
+# coding: utf-8
+
+import unittest
+import time
+
+from cattledb.storage.connection import Connection
+from cattledb.storage.compaction import Compactor
+from cattledb.core.models import MetricDefinition, MetricType
+from .helper import get_unit_test_config, get_test_metrics
+
+
+class CompactionTest(unittest.TestCase):
+    def test_retention(self):
+        conf = get_unit_test_config()
+        metrics = get_test_metrics() + [
+            MetricDefinition("cmprollup", "cmr", MetricType.FLOATSERIES, True, rollups=True,
+                             raw_retention=10, rollup_retention=30),
+            MetricDefinition("cmpraw", "cmw", MetricType.FLOATSERIES, True, raw_retention=10)
+        ]
+        db = Connection(engine=conf.ENGINE, engine_options=conf.ENGINE_OPTIONS, metric_definitions=metrics)
+        db.database_init(silent=True)
+
+        day = 24 * 60 * 60
+        now = int(time.time())
+        today = now - now % day
+        for age in [40, 20, 1]:
+            start = today - age * day
+            for key in ["cmp1", "cmp2"]:
+                db.timeseries.insert(key, "cmprollup", [(start + i * 600, float(i)) for i in range(144)])
+                db.timeseries.insert(key, "cmpraw", [(start + i * 600, float(i)) for i in range(144)])
+                db.timeseries.insert(key, "ph", [(start, 7.0)])
+
+        compactor = Compactor(db, checkpoint_interval=2)
+        compactor.reset_checkpoint()
+        res = compactor.run(limit=3, now=now)
+        self.assertFalse(res["finished"])
+        self.assertEqual(res["rows"], 3)
+        self.assertIsNotNone(compactor.get_checkpoint())
+        while not res["finished"]:
+            res = compactor.run(now=now)
+        self.assertIsNone(compactor.get_checkpoint())
+
+        for key in ["cmp1", "cmp2"]:
+            raw, other, ph = db.timeseries.get_timeseries(key, ["cmprollup", "cmpraw", "ph"],
+                                                          today - 40 * day, today)
+            self.assertEqual(len(raw), 144)
+            # no rollups, the raw retention is ignored
+            self.assertEqual(len(other), 3 * 144)
+            self.assertEqual(len(ph), 3)
+            agg = db.timeseries.get_aggregated_timeseries(key, "cmprollup", today - 40 * day, today - 1,
+                                                          "daily", "count")
+            self.assertEqual([(p.ts, p.value) for p in agg.all(raw=True)],
+                             [(today - 20 * day, 144.0), (today - day, 144.0)])
+            agg = db.timeseries.get_aggregated_timeseries(key, "cmprollup", today - 20 * day, today - 19 * day - 1,
+                                                          "hourly", "mean")
+            self.assertEqual(len(agg), 24)
+            self.assertAlmostEqual(agg[0].value, 2.5)
+
+        # nothing left to do
+        compactor.reset_checkpoint()
+        res = compactor.run(now=now)
+        self.assertTrue(res["finished"])
+        self.assertEqual(res["raw_deleted"], 0)
+        self.assertEqual(res["rollups_deleted"], 0)
@@ -7,11 +7,16 @@ import logging
 import pendulum
 import os
 import datetime
+import threading
+import time
 
 
 from cattledb.storage.connection import Connection
+from cattledb.directclient import CDBClient
 from cattledb.storage.models import RowUpsert
-from .helper import get_unit_test_config, get_test_connection
+from cattledb.core.models import MetricDefinition, EventDefinition, MetricType
+from cattledb.storage.models import EventSeriesType
+from .helper import get_unit_test_config, get_test_connection, get_test_metrics, get_test_events
 
 
 class ConnectionTest(unittest.TestCase):
@@ -98,3 +103,146 @@ class ConnectionTest(unittest.TestCase):
 
         res = table.read_rows(start_key="abc#2", end_key="abc#3#2", column_families=["i"])
         self.assertEqual(len(res), 3)
+
+    def test_lookups(self):
+        conf = get_unit_test_config()
+        db = Connection(engine=conf.ENGINE, engine_options=conf.ENGINE_OPTIONS,
+                        metric_definitions=get_test_metrics(), event_definitions=get_test_events())
+        db.database_init(silent=True)
+
+        version = db.definitions_version
+        lookup = db.metric_lookup
+        self.assertIs(db.metric_lookup, lookup)
+        self.assertEqual(lookup.by_name["temp"].id, "tmp")
+        self.assertEqual(lookup.by_id["tmp"].name, "temp")
+
+        # unchanged definitions keep the lookups
+        db.load_metric_definitions()
+        db.add_metric_definitions(get_test_metrics()[:2])
+        self.assertEqual(db.definitions_version, version)
+        self.assertIs(db.metric_lookup, lookup)
+
+        db.add_metric_definitions([MetricDefinition("lookupm", "lkm", MetricType.FLOATSERIES, False)])
+        self.assertEqual(db.definitions_version, version + 1)
+        self.assertIsNot(db.metric_lookup, lookup)
+        self.assertEqual(db.timeseries.get_metric_object("lookupm").id, "lkm")
+
+        self.assertEqual(db.events.get_type_for_name("test_daily"), EventSeriesType.DAILY)
+        self.assertEqual(db.events.get_type_for_name("test_monthly"), EventSeriesType.MONTHLY)
+        self.assertEqual(db.events.get_type_for_name("test_monthly_abc"), EventSeriesType.MONTHLY)
+        self.assertEqual(db.events.get_type_for_name("test_daily_abc"), EventSeriesType.DAILY)
+        self.assertEqual(db.events.get_type_for_name("test.monthly_abc"), EventSeriesType.DAILY)
+        db.add_event_definitions([EventDefinition("test_daily_*", EventSeriesType.MONTHLY)])
+        self.assertEqual(db.definitions_version, version + 2)
+        self.assertEqual(db.events.get_type_for_name("test_daily_abc"), EventSeriesType.MONTHLY)
+
+    def test_release_engine(self):
+        conf = get_unit_test_config()
+        client = CDBClient.from_config(conf)
+        db = client.db
+        db.add_metric_definitions(get_test_metrics())
+        client.service_init()
+        if db.engine_pool is None:
+            self.skipTest("engine is not threaded")
+        self.assertEqual(db.engine_pool.info()["leases"], 0)
+
+        engine = db.get_engine()
+        self.assertIs(db.get_engine(), engine)
+        self.assertEqual(db.engine_pool.info()["leases"], 1)
+        db.release_engine()
+        db.release_engine()
+        self.assertEqual(db.engine_pool.info()["leases"], 0)
+        # the free engine is used again
+        self.assertIs(db.get_engine(), engine)
+        db.release_engine()
+
+        # client calls give the engine of the calling thread back
+        leases = []
+
+        def work():
+            client.put_timeseries("release1", "ph", [(600, 1.0)])
+            client.get_last_values("release1", ["ph"])
+            leases.append(getattr(db.thread_local, "lease", None))
+            list(client.get_timeseries_multi(["release1"], ["ph"], 0, 600))
+            leases.append(getattr(db.thread_local, "lease", None))
+
+        t = threading.Thread(target=work)
+        t.start()
+        t.join()
+        work()
+        self.assertEqual(leases, [None] * 4)
+        db.disconnect()
+
+    def test_release_workers(self):
+        conf = get_unit_test_config()
+        db = Connection(engine=conf.ENGINE, engine_options=dict(conf.ENGINE_OPTIONS, engine_pool_size=4),
+                        metric_definitions=get_test_metrics())
+        db.database_init(silent=True)
+        if db.engine_pool is None:
+            self.skipTest("engine is not threaded")
+        db.release_engine()
+
+        # the store workers give their engines back after every job
+        keys = ["worker{}".format(i) for i in range(40)]
+        for key in keys:
+            db.timeseries.insert(key, "ph", [(600, 1.0)])
+        res = dict(db.timeseries.get_timeseries_multi(keys, ["ph"], 0, 600))
+        self.assertEqual(len(res), 40)
+        db.release_engine()
+        info = db.engine_pool.info()
+        self.assertEqual(info["in_use"], 0)
+        self.assertEqual(info["leases"], 0)
+
+        t = int(time.time())
+        db.activity.incr_activity_bulk([{"reader_id": "worker{}".format(i), "device_id": "dev1", "timestamp": t}
+                                        for i in range(20)])
+        db.release_engine()
+        info = db.engine_pool.info()
+        self.assertEqual(info["in_use"], 0)
+        self.assertEqual(info["leases"], 0)
+        db.disconnect()
+
+    def test_refresher(self):
+        conf = get_unit_test_config()
+        options = dict(conf.ENGINE_OPTIONS, config_cache_ttl=60, definitions_refresh_interval=60)
+        db = Connection(engine=conf.ENGINE, engine_options=options,
+                        metric_definitions=get_test_metrics(), event_definitions=get_test_events())
+        db.database_init(silent=True)
+        db.store_metric_definitions()
+
+        service = Connection(engine=conf.ENGINE, engine_options=options)
+        service.service_init()
+        self.assertTrue(service.refresher.running)
+        refresher = service.refresher
+        # the definitions loaded by service_init are not loaded again
+        self.assertFalse(refresher.check())
+        self.assertEqual(refresher.reloads, 0)
+
+        # the poll is not served from the config cache
+        service.read_config("last_change")
+        db.new_metric_definition(MetricDefinition("refreshm", "rfm", MetricType.FLOATSERIES, False))
+        version = service.definitions_version
+        self.assertTrue(refresher.check())
+        self.assertEqual(service.definitions_version, version + 1)
+        self.assertEqual(service.timeseries.get_metric_object("refreshm").id, "rfm")
+        self.assertFalse(refresher.check())
+
+        db.new_event_definition(EventDefinition("refresh_*", EventSeriesType.MONTHLY))
+        self.assertTrue(refresher.check())
+        self.assertEqual(service.events.get_type_for_name("refresh_abc"), EventSeriesType.MONTHLY)
+
+        # deleted definitions are gone after a reload
+        db.write_config("metrics", [m.to_dict() for m in get_test_metrics()])
+        db._write_last_change()
+        self.assertTrue(refresher.check())
+        with self.assertRaises(KeyError):
+            service.timeseries.get_metric_object("refreshm")
+        self.assertEqual(service.timeseries.get_metric_object("ph").id, "ph")
+
+        service.disconnect()
+        self.assertIsNone(service.refresher)
+        self.assertFalse(refresher.running)
+
+        # restore the stored definitions for the other tests
+        db.write_config("metrics", [m.to_dict() for m in get_test_metrics()])
+        db.write_config("events", [e.to_dict() for e in get_test_events()])
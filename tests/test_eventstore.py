@@ -130,4 +130,25 @@ class EventStorageTest(unittest.TestCase):
         self.assertEqual(len(res), 3)
         self.assertEqual(len(my_get_func.call_args_list), 4)
         self.assertEqual(my_get_func.call_args_list[3][1]["info"]["count"], 1)
-        self.assertEqual(my_get_func.call_args_list[3][1]["info"]["row_keys"][0], "device1#m_test_monthly_2#298548")
\ No newline at end of file
+        self.assertEqual(my_get_func.call_args_list[3][1]["info"]["row_keys"][0], "device1#m_test_monthly_2#298548")
+
+    def test_iter_events(self):
+        conf = get_unit_test_config()
+        db = Connection(engine=conf.ENGINE, engine_options=conf.ENGINE_OPTIONS, event_definitions=get_test_events())
+        db.database_init(silent=True)
+
+        for d in [5, 6, 8]:
+            db.events.insert_event("device2", "test_daily", pendulum.datetime(2015, 2, d, 12, 0, tz='UTC').int_timestamp, {"d": str(d)})
+        for m in [1, 2, 2, 4]:
+            db.events.insert_event("device2", "test_monthly", pendulum.datetime(2015, m, 21, 12, 0, tz='UTC').int_timestamp, {"m": str(m)})
+
+        res = list(db.events.iter_events("device2", "test_daily", pendulum.datetime(2015, 2, 5, 13, 0, tz='UTC').int_timestamp,
+                                         pendulum.datetime(2015, 2, 10, 0, 0, tz='UTC').int_timestamp))
+        self.assertEqual([len(r) for r in res], [1, 1])
+        self.assertEqual(res[0][0].value["d"], "6")
+        self.assertEqual(res[1][0].value["d"], "8")
+
+        res = list(db.events.iter_events("device2", "test_monthly", pendulum.datetime(2015, 1, 1, 0, 0, tz='UTC').int_timestamp,
+                                         pendulum.datetime(2015, 5, 1, 0, 0, tz='UTC').int_timestamp))
+        self.assertEqual([len(r) for r in res], [1, 1, 1])
+        self.assertEqual([r[0].value["m"] for r in res], ["1", "2", "4"])
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+# coding: utf-8
+
+import unittest
+import grpc
+import pendulum
+
+from cattledb.grpcserver import _create_server
+from cattledb.grpcclient import CDBClient
+from .helper import get_unit_test_config, get_test_metrics, get_test_events
+
+
+class GrpcServerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = _create_server(get_unit_test_config())
+        port = self.server.add_insecure_port("127.0.0.1:0")
+        self.server.start()
+        self.db = self.server.db
+        self.db.add_metric_definitions(get_test_metrics())
+        self.db.add_event_definitions(get_test_events())
+        self.db.database_init(silent=True)
+        self.client = CDBClient("127.0.0.1:{}".format(port))
+
+    def tearDown(self):
+        self.client.channel.close()
+        self.server.stop(None)
+
+    def test_timeseries_stream(self):
+        start = pendulum.datetime(2019, 3, 1, tz="UTC")
+        t = start.int_timestamp
+        self.db.timeseries.delete_timeseries("stream1", ["ph", "temp"], t - 24 * 60 * 60, t + 4 * 24 * 60 * 60)
+
+        data = [{"key": "stream1", "metric": "ph", "data": [(t + i * 600, 7.0) for i in range(300)]},
+                {"key": "stream1", "metric": "temp", "data": [(t + 2 * 24 * 60 * 60, 20.0)]}]
+        self.assertEqual(self.client.put_timeseries_stream(data), 301)
+
+        res = list(self.client.stream_timeseries("stream1", ["ph", "temp"], start, start.add(days=3)))
+        self.assertEqual(len(res), 3)
+        # newest day first, metrics without data are left out of the message
+        self.assertEqual([[(ts.metric, len(ts)) for ts in day] for day in res],
+                         [[("ph", 12), ("temp", 1)], [("ph", 144)], [("ph", 144)]])
+        self.assertEqual(res[2][0][0].ts, t)
+
+        # nothing is written if one message is invalid
+        data = [{"key": "stream1", "metric": "ph", "data": [(t + 3 * 24 * 60 * 60, 1.0)]},
+                {"key": "stream1", "metric": "ph", "data": []}]
+        with self.assertRaises(grpc.RpcError) as cm:
+            self.client.put_timeseries_stream(data)
+        self.assertEqual(cm.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)
+        res = list(self.client.stream_timeseries("stream1", ["ph"], start.add(days=3), start.add(days=4)))
+        self.assertEqual(res, [])
+
+    def test_events_stream(self):
+        start = pendulum.datetime(2019, 3, 1, tz="UTC")
+        t = start.int_timestamp
+        self.db.events.delete_event_days("stream1", "test_daily", t - 24 * 60 * 60, t + 4 * 24 * 60 * 60)
+
+        data = [{"key": "stream1", "name": "test_daily", "events": [(t + 3600, {"a": 1}), (t + 7200, {"a": 2})]},
+                {"key": "stream1", "name": "test_daily", "events": [(t + 2 * 24 * 60 * 60, {"a": 3})]}]
+        self.assertEqual(self.client.put_events_stream(data), 3)
+
+        res = list(self.client.stream_events("stream1", "test_daily", start, start.add(days=3)))
+        self.assertEqual([len(ev) for ev in res], [2, 1])
+        self.assertEqual(res[0][0].value, {"a": 1})
+
+        data = [{"key": "stream1", "name": "test_daily", "events": [(t + 3 * 24 * 60 * 60, {"a": 4})]},
+                {"key": "stream1", "name": "test_daily", "events": []}]
+        with self.assertRaises(grpc.RpcError) as cm:
+            self.client.put_events_stream(data)
+        self.assertEqual(cm.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)
+        res = list(self.client.stream_events("stream1", "test_daily", start.add(days=3), start.add(days=4)))
+        self.assertEqual(res, [])
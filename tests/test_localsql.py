@@ -7,6 +7,11 @@ import logging
 import pendulum
 import os
 import datetime
+import tempfile
+import sqlite3
+import json
+import base64
+import threading
 
 
 from cattledb.storage.connection import Connection
@@ -87,9 +92,124 @@ class LocalSQLTest(unittest.TestCase):
         res = table.read_rows(start_key="abc#2", end_key="abc#3#2", column_families=["i"])
         self.assertEqual(len(res), 3)
 
+    def test_column_range(self):
+        db = Connection(engine="localsql", engine_options={"data_dir": "."})
+        db.database_init(silent=True)
+        table = db.metadata.table()
+        table.upsert_rows([RowUpsert("rng#1", {"p:100": b"1", "p:200": b"2", "p:300": b"3"}),
+                           RowUpsert("rng#2", {"p:100": b"4", "i:200": b"5"})])
+
+        res = table.read_rows(start_key="rng#", end_key="rng#3", column_families=["p", "i"],
+                              column_range=("150", "300"))
+        self.assertEqual(len(res), 2)
+        self.assertEqual(dict(res[0][1]), {"p:200": b"2", "p:300": b"3"})
+        self.assertEqual(dict(res[1][1]), {"i:200": b"5"})
+
+        # rows without cells in the range are skipped
+        res = table.read_rows(row_keys=["rng#1", "rng#2"], column_families=["p"], column_range=("100", "150"))
+        self.assertEqual([r[0] for r in res], ["rng#1", "rng#2"])
+        res = table.read_rows(row_keys=["rng#1", "rng#2"], column_families=["p"], column_range=("250", "300"))
+        self.assertEqual([r[0] for r in res], ["rng#1"])
+
+        with self.assertRaises(ValueError):
+            table.read_rows(row_keys=["rng#1"], column_range=("100", "200"))
+
+    def test_row_keys(self):
+        db = Connection(engine="localsql", engine_options={"data_dir": "."})
+        db.database_init(silent=True)
+        table = db.metadata.table()
+        table.ROW_KEYS_CHUNK = 7
+        table.upsert_rows([RowUpsert("key#{:04d}".format(i), {"p:v": str(i).encode("ascii")}) for i in range(0, 40, 2)])
+
+        # unsorted keys with duplicates over many chunks, missing rows are skipped
+        keys = ["key#{:04d}".format(i) for i in reversed(range(40))] + ["key#0002", "key#9999"]
+        res = table.read_rows(row_keys=keys, column_families=["p"])
+        self.assertEqual([r[0] for r in res], ["key#{:04d}".format(i) for i in range(0, 40, 2)])
+        self.assertEqual(res[3][1]["p:v"], b"6")
+        self.assertEqual(table.read_rows(row_keys=[]), [])
+        self.assertEqual(table.read_rows(row_keys=["key#0001"]), [])
+
     def test_schema(self):
         db = Connection(engine="localsql", engine_options={"data_dir": "."})
         db.database_init(silent=True)
 
         res = db.read_database_structure()
         assert len(res) == 5
+
+    def test_cells(self):
+        db = Connection(engine="localsql", engine_options={"data_dir": "."})
+        db.database_init(silent=True)
+        table = db.metadata.table()
+        self.assertEqual(table.con.execute("PRAGMA journal_mode;").fetchone()[0], "wal")
+
+        table.upsert_rows([RowUpsert("cell#1", {"p:a": b"1", "p:b": b"2", "i:a": b"3"})])
+        table.upsert_rows([RowUpsert("cell#1", {"p:b": b"4"})])
+        self.assertEqual(dict(table.read_row("cell#1")), {"p:a": b"1", "p:b": b"4", "i:a": b"3"})
+        table.delete_row("cell#1", column_families=["p"])
+        self.assertEqual(dict(table.read_row("cell#1")), {"i:a": b"3"})
+        with self.assertRaises(KeyError):
+            table.read_row("cell#1", column_families=["p"])
+        self.assertEqual(table.increment_counters("cell#1", {"i:x": 2, "i:y": 3}), {"i:x": 2, "i:y": 3})
+        self.assertEqual(table.increment_counter("cell#1", "i:x", 5), 7)
+        table.delete_row("cell#1")
+        with self.assertRaises(KeyError):
+            table.read_row("cell#1")
+
+    def test_migration(self):
+        data_dir = tempfile.mkdtemp(prefix="cdbmigrate")
+        db = Connection(engine="localsql", engine_options={"data_dir": data_dir})
+        full_name = db.get_engine().get_full_table_name("metadata")
+
+        # table of the old layout, one json column per family
+        con = sqlite3.connect(os.path.join(data_dir, "cattle.db"))
+        con.execute("CREATE TABLE {} (k TEXT PRIMARY KEY, row_meta TEXT, p BLOB, i BLOB)".format(full_name))
+        cells = {"foo": base64.b64encode(b"bar").decode("ascii"), "x": base64.b64encode(b"y").decode("ascii")}
+        con.execute("INSERT INTO {} (k, p) VALUES (?, ?)".format(full_name), ("old#1", json.dumps(cells)))
+        con.execute("INSERT INTO {} (k, p, i) VALUES (?, ?, ?)".format(full_name),
+                    ("old#2", None, json.dumps({"z": base64.b64encode(b"1").decode("ascii")})))
+        con.commit()
+        con.close()
+
+        db.database_init(silent=True)
+        table = db.metadata.table()
+        self.assertEqual(dict(table.read_row("old#1")), {"p:foo": b"bar", "p:x": b"y"})
+        self.assertEqual(dict(table.read_row("old#2")), {"i:z": b"1"})
+        self.assertIn("i", table.get_column_families())
+        self.assertIn("p", table.get_column_families())
+        db.disconnect()
+
+    def test_threads(self):
+        for options in [{"data_dir": tempfile.mkdtemp(prefix="cdbthreads")},
+                        {"data_dir": tempfile.mkdtemp(prefix="cdbthreads"), "in_memory": True}]:
+            db = Connection(engine="localsql", engine_options=options)
+            self.assertTrue(db.threaded_engines)
+            db.database_init(silent=True)
+            db.metadata.table().upsert_rows([RowUpsert("thr#{}".format(i), {"p:v": b"1"}) for i in range(20)])
+
+            errors = []
+            engines = set()
+
+            def work(n):
+                try:
+                    table = db.metadata.table()
+                    engines.add(id(db.get_engine()))
+                    for i in range(20):
+                        self.assertEqual(len(table.read_rows(start_key="thr#", end_key="thr#~")), 20)
+                        table.increment_counter("counter", "i:c", 1)
+                        table.write_cell("thr#{}".format(n), "i:{}".format(i), b"x")
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(errors, [])
+            self.assertGreater(len(engines), 1)
+
+            # written by other threads, visible for this thread
+            table = db.metadata.table()
+            self.assertEqual(table.increment_counter("counter", "i:c", 0), 80)
+            self.assertEqual(len(table.read_row("thr#3", column_families=["i"])), 20)
+            db.disconnect()
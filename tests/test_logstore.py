@@ -0,0 +1,139 @@
+#!/usr/bin/python
+# coding: utf-8
+
+import unittest
+import os
+import subprocess
+import sys
+import tempfile
+
+from cattledb.storage.connection import Connection
+from cattledb.storage.models import RowUpsert
+from cattledb.storage.engines.logstore import LogStoreEngine
+
+
+class LogStoreTest(unittest.TestCase):
+    def get_engine(self, data_dir, **options):
+        options["data_dir"] = data_dir
+        eng = LogStoreEngine(options, admin=True)
+        eng.setup_table("metadata", silent=True)
+        return eng
+
+    def test_rows(self):
+        data_dir = tempfile.mkdtemp(prefix="cdblogstore")
+        db = Connection(engine="logstore", engine_options={"data_dir": data_dir})
+        db.database_init(silent=True)
+        self.assertIn("p", db.metadata.table().get_column_families())
+        table = db.metadata.table()
+
+        table.upsert_rows([RowUpsert("abc#1#1", {"p:k": b"11"}),
+                           RowUpsert("abc#2#1", {"p:k": b"21", "i:k": b"21"}),
+                           RowUpsert("abc#2#2", {"p:k": b"22", "i:k": b"22"}),
+                           RowUpsert("abc#3#1", {"p:k": b"31", "p:a": b"30"}),
+                           RowUpsert("abd#1#1", {"p:k": b"41"})])
+
+        self.assertEqual(list(table.read_row("abc#3#1").keys()), ["p:a", "p:k"])
+        res = table.read_rows(row_keys=["abc#3#1", "abc#2#1", "abc#9"], column_families=["i"])
+        self.assertEqual([r[0] for r in res], ["abc#2#1"])
+        res = table.read_rows(start_key="abc#2", end_key="abc#3#1")
+        self.assertEqual([r[0] for r in res], ["abc#2#1", "abc#2#2", "abc#3#1"])
+        res = table.read_rows(start_key="abc#", check_prefix="abc#", column_families=["p"],
+                              column_range=("k", "k"))
+        self.assertEqual([list(r[1].keys()) for r in res], [["p:k"]] * 4)
+        self.assertEqual(table.get_first_row("abc#", column_families=["i"])[0], "abc#2#1")
+        self.assertIsNone(table.get_first_row("abc#3", column_families=["i"]))
+        self.assertEqual(list(table.row_key_generator(start_key="abc#3")), ["abc#3#1", "abd#1#1"])
+
+        table.delete_row("abc#2#1", column_families=["i"])
+        self.assertEqual(dict(table.read_row("abc#2#1")), {"p:k": b"21"})
+        table.delete_row("abc#2#1")
+        with self.assertRaises(KeyError):
+            table.read_row("abc#2#1")
+
+        self.assertEqual(table.increment_counters("cnt", {"p:a": 2, "p:b": 3}), {"p:a": 2, "p:b": 3})
+        self.assertEqual(table.increment_counter("cnt", "p:a", 5), 7)
+        db.disconnect()
+
+    def test_segments(self):
+        data_dir = tempfile.mkdtemp(prefix="cdblogstore")
+        eng = self.get_engine(data_dir, logstore_memtable_cells=50, logstore_max_segments=100)
+        table = eng.get_table("metadata")
+        for i in range(200):
+            table.write_cell("seg#{:03d}".format(i % 40), "p:{:03d}".format(i), b"x")
+        table.delete_row("seg#001")
+        table.delete_row("seg#002", column_families=["p"])
+        table.write_cell("seg#002", "i:a", b"y")
+        table.flush()
+        self.assertEqual(table.info()["segments"], 5)
+
+        def check():
+            keys = list(table.row_key_generator())
+            self.assertEqual(len(keys), 39)
+            self.assertNotIn("seg#001", keys)
+            self.assertEqual(dict(table.read_row("seg#002")), {"i:a": b"y"})
+            self.assertEqual(len(table.read_row("seg#003")), 5)
+
+        check()
+        # newest segments only, tombstones are kept
+        merged = table.state.compact()
+        self.assertGreaterEqual(merged, 2)
+        self.assertEqual(table.info()["segments"], 6 - merged)
+        check()
+        table.write_cell("seg#001", "p:new", b"z")
+        table.flush()
+        self.assertEqual(table.compact(), 7 - merged)
+        self.assertEqual(table.info()["segments"], 1)
+        self.assertEqual(dict(table.read_row("seg#001")), {"p:new": b"z"})
+        eng.disconnect()
+
+        # segments and the log are loaded again
+        eng = self.get_engine(data_dir)
+        table = eng.get_table("metadata")
+        table.write_cell("seg#003", "p:999", b"w")
+        eng.disconnect()
+        eng = self.get_engine(data_dir)
+        table = eng.get_table("metadata")
+        self.assertEqual(len(table.read_row("seg#003")), 6)
+        self.assertEqual(dict(table.read_row("seg#001")), {"p:new": b"z"})
+        eng.disconnect()
+
+    def test_recovery(self):
+        data_dir = tempfile.mkdtemp(prefix="cdblogstore")
+        eng = self.get_engine(data_dir)
+        table = eng.get_table("metadata")
+        table.write_cell("rec#1", "p:a", b"1")
+        table.write_cell("rec#1", "p:b", b"2")
+        eng.disconnect()
+
+        # incomplete last write
+        path = os.path.join(data_dir, "logstore", eng.get_full_table_name("metadata"))
+        log = [os.path.join(path, f) for f in os.listdir(path) if f.endswith(".wal")][0]
+        with open(log, "r+b") as f:
+            f.truncate(os.path.getsize(log) - 1)
+
+        eng = self.get_engine(data_dir)
+        table = eng.get_table("metadata")
+        self.assertEqual(dict(table.read_row("rec#1")), {"p:a": b"1"})
+        table.write_cell("rec#1", "p:c", b"3")
+        eng.disconnect()
+        eng = self.get_engine(data_dir)
+        self.assertEqual(dict(eng.get_table("metadata").read_row("rec#1")), {"p:a": b"1", "p:c": b"3"})
+        eng.disconnect()
+
+    def test_lock(self):
+        data_dir = tempfile.mkdtemp(prefix="cdblogstore")
+        eng = self.get_engine(data_dir)
+        other = LogStoreEngine({"data_dir": data_dir})
+        other.connect()
+        other.disconnect()
+
+        # a second process fails fast
+        code = ("from cattledb.storage.engines.logstore import LogStoreEngine\n"
+                "LogStoreEngine({{'data_dir': {!r}}}).connect()".format(data_dir))
+        res = subprocess.run([sys.executable, "-c", code], stderr=subprocess.PIPE)
+        self.assertNotEqual(res.returncode, 0)
+        self.assertIn(b"used by another process", res.stderr)
+
+        eng.disconnect()
+        res = subprocess.run([sys.executable, "-c", code], stderr=subprocess.PIPE)
+        self.assertEqual(res.returncode, 0)
@@ -0,0 +1,83 @@
+#!/usr/bin/python
+# coding: utf-8
+
+import unittest
+import threading
+import mock
+
+from cattledb.storage.connection import Connection
+from cattledb.storage.models import RowUpsert
+from cattledb.storage.engines.memory import MemoryEngine, MemoryTable
+
+
+class MemoryEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.db = Connection(engine="memory", engine_options={"memory_name": "unittest"})
+        self.db.database_init(silent=True)
+
+    def tearDown(self):
+        self.db.disconnect()
+        MemoryEngine.drop_database("unittest")
+
+    def test_rows(self):
+        table = self.db.metadata.table()
+        self.assertIn("p", table.get_column_families())
+        table.upsert_rows([RowUpsert("abc#1", {"p:k": b"1"}),
+                           RowUpsert("abc#10", {"p:k": b"10", "i:k": b"10"}),
+                           RowUpsert("abc#2", {"p:b": b"2", "p:a": b"2"}),
+                           RowUpsert("abd#1", {"p:k": b"4"})])
+
+        # lexicographic order of keys, families and qualifiers
+        self.assertEqual([r[0] for r in table.read_rows(start_key="abc#", end_key="abd#1")],
+                         ["abc#1", "abc#10", "abc#2", "abd#1"])
+        self.assertEqual(list(table.read_row("abc#2").keys()), ["p:a", "p:b"])
+        self.assertEqual([r[0] for r in table.read_rows(row_keys=["abc#2", "abc#10", "abc#3"], column_families=["i"])],
+                         ["abc#10"])
+        res = table.read_rows(start_key="abc#", end_key="abd#", column_families=["p"], column_range=("b", "k"))
+        self.assertEqual([list(r[1].keys()) for r in res], [["p:k"], ["p:k"], ["p:b"]])
+        self.assertEqual(table.get_first_row("abc#", column_families=["i"])[0], "abc#10")
+        self.assertIsNone(table.get_first_row("abc#2", column_families=["i"]))
+        self.assertEqual(table.get_first_row("")[0], "abc#1")
+        self.assertEqual(list(table.row_key_generator(start_key="abc#2", end_key="abd#1")), ["abc#2", "abd#1"])
+        # upserts without cells leave no row, like in the other engines
+        table.upsert_rows([RowUpsert("abc#3", {})])
+        table.upsert_row("abc#4", {})
+        self.assertEqual(list(table.row_key_generator(start_key="abc#2", end_key="abd#1")), ["abc#2", "abd#1"])
+
+        # the prefix scan never reads rows behind the prefix
+        with mock.patch.object(MemoryTable, "_read", autospec=True, side_effect=MemoryTable._read) as m:
+            res = table.read_rows(start_key="abc#1", check_prefix="abc#1")
+            self.assertEqual([r[0] for r in res], ["abc#1", "abc#10"])
+            self.assertEqual(m.call_count, 2)
+
+        table.delete_row("abc#10", column_families=["p"])
+        self.assertEqual(dict(table.read_row("abc#10")), {"i:k": b"10"})
+        table.delete_row("abc#10", column_families=["i"])
+        self.assertNotIn("abc#10", list(table.row_key_generator()))
+        table.delete_row("abc#1")
+        with self.assertRaises(KeyError):
+            table.read_row("abc#1")
+
+    def test_counters(self):
+        table = self.db.metadata.table()
+
+        def work():
+            for _ in range(500):
+                table.increment_counters("cnt", {"p:a": 1, "p:b": 2})
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(table.increment_counter("cnt", "p:a", 0), 2000)
+        self.assertEqual(table.increment_counter("cnt", "p:b", 1), 4001)
+
+    def test_shared(self):
+        self.db.metadata.table().write_cell("shared", "p:a", b"1")
+        other = Connection(engine="memory", engine_options={"memory_name": "unittest"})
+        self.assertEqual(dict(other.metadata.table().read_row("shared")), {"p:a": b"1"})
+        MemoryEngine.drop_database("unittest")
+        other = Connection(engine="memory", engine_options={"memory_name": "unittest"})
+        with self.assertRaises(KeyError):
+            other.metadata.table().read_row("shared")
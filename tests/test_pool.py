@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# coding: utf-8
+
+import unittest
+import threading
+import time
+
+from cattledb.storage.pool import EnginePool
+
+
+class _Engine(object):
+    def __init__(self):
+        self.connected = True
+
+    def disconnect(self):
+        self.connected = False
+
+
+class EnginePoolTest(unittest.TestCase):
+    def test_checkout(self):
+        pool = EnginePool(_Engine, max_size=2, max_idle=None)
+        l1 = pool.checkout()
+        l2 = pool.checkout()
+        self.assertIsNot(l1.engine, l2.engine)
+        # shared after max_size
+        l3 = pool.checkout()
+        self.assertIn(l3.engine, [l1.engine, l2.engine])
+        info = pool.info()
+        self.assertEqual(info["size"], 2)
+        self.assertEqual(info["leases"], 3)
+        self.assertEqual(info["shared"], 1)
+
+        # released engines are reused
+        engine = l1.engine
+        l1.release()
+        l1.release()
+        l3.release()
+        self.assertEqual(pool.info()["leases"], 1)
+        l4 = pool.checkout()
+        self.assertIn(l4.engine, [engine, l3.engine])
+        self.assertEqual(pool.info()["created"], 2)
+
+        pool.close()
+        self.assertFalse(l4.valid)
+        self.assertFalse(engine.connected)
+
+    def test_thread_end(self):
+        pool = EnginePool(_Engine, max_size=4, max_idle=None)
+        local = threading.local()
+        engines = []
+
+        def work():
+            local.lease = pool.checkout()
+            engines.append(local.lease.engine)
+
+        for _ in range(3):
+            t = threading.Thread(target=work)
+            t.start()
+            t.join()
+        self.assertEqual(pool.info()["created"], 1)
+        self.assertEqual(pool.info()["leases"], 0)
+        self.assertIs(engines[0], engines[2])
+
+    def test_idle(self):
+        pool = EnginePool(_Engine, max_size=4, max_idle=0.05)
+        l1 = pool.checkout()
+        l2 = pool.checkout()
+        e1 = l1.engine
+        l1.release()
+        time.sleep(0.1)
+        l2.release()
+        # e1 is idle for too long, e2 was just used
+        self.assertFalse(e1.connected)
+        info = pool.info()
+        self.assertEqual(info["size"], 1)
+        self.assertEqual(info["evicted"], 1)
+        self.assertIs(pool.checkout().engine, l2.engine)
+
+    def test_create_unlocked(self):
+        started = threading.Event()
+        go_on = threading.Event()
+        calls = []
+
+        def factory():
+            calls.append(1)
+            if len(calls) == 1:
+                started.set()
+                go_on.wait(5)
+            return _Engine()
+
+        pool = EnginePool(factory, max_size=2, max_idle=None)
+        leases = []
+        t = threading.Thread(target=lambda: leases.append(pool.checkout()))
+        t.start()
+        started.wait(5)
+        # the pool is usable while the first engine is created
+        self.assertEqual(pool.info()["size"], 0)
+        l2 = pool.checkout()
+        self.assertEqual(pool.info()["size"], 1)
+        go_on.set()
+        t.join()
+        self.assertIsNot(leases[0].engine, l2.engine)
+        self.assertEqual(pool.info()["created"], 2)
+        self.assertEqual(pool.info()["leases"], 2)
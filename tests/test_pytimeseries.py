@@ -11,12 +11,15 @@ from cattledb.core._timeseries import PyTSList
 
 
 class PyFallbackTest(unittest.TestCase):
+    """Container tests, run for the other containers by subclasses with their TSLIST."""
+    TSLIST = PyTSList
+
     @classmethod
     def setUpClass(cls):
         logging.basicConfig(level=logging.INFO)
 
     def test_base(self):
-        t1 = PyTSList("hellö", "world")
+        t1 = self.TSLIST("hellö", "world")
 
         end = pendulum.now("Europe/Vienna")
         start = end.subtract(minutes=199)
@@ -40,7 +43,7 @@ class PyFallbackTest(unittest.TestCase):
         assert t1.iso_at_index(len(t1)-1)[0] == end.replace(microsecond=0).isoformat()
 
     def test_timezone(self):
-        t1 = PyTSList("abc", "def")
+        t1 = self.TSLIST("abc", "def")
         dt = pendulum.now("Europe/Vienna").replace(microsecond=0)
         iso_str = dt.isoformat()
         t1.insert_iso(iso_str, 0.1)
@@ -49,7 +52,7 @@ class PyFallbackTest(unittest.TestCase):
         assert t1.iso_at_index(0)[0] == iso_str
 
     def test_canada(self):
-        t1 = PyTSList("abc", "def")
+        t1 = self.TSLIST("abc", "def")
         dt = pendulum.datetime(2019, 2, 12, 8, 15, 32, tz='America/Toronto').replace(microsecond=0)
         iso_str = dt.isoformat()
         t1.insert_iso(iso_str, 0.1)
@@ -58,7 +61,7 @@ class PyFallbackTest(unittest.TestCase):
         assert t1.iso_at_index(0)[0] == "2019-02-12T08:15:32-05:00"
 
     def test_vienna(self):
-        t1 = PyTSList("abc", "def")
+        t1 = self.TSLIST("abc", "def")
         dt = pendulum.datetime(2008, 3, 3, 12, 0, 0, tz='Europe/Vienna')
         iso_str = dt.isoformat()
         t1.insert_iso(iso_str, 0.1)
@@ -67,7 +70,7 @@ class PyFallbackTest(unittest.TestCase):
         assert t1.iso_at_index(0)[0] == "2008-03-03T12:00:00+01:00"
 
     def test_trim(self):
-        t1 = PyTSList("a", "b")
+        t1 = self.TSLIST("a", "b")
 
         end = pendulum.now("Europe/Vienna")
         start = end.subtract(minutes=199)
@@ -89,9 +92,11 @@ class PyFallbackTest(unittest.TestCase):
         assert len(t1) == 10
         t1.trim_index(0, 0)
         assert len(t1) == 1
+        t1.trim_index(1, 1)
+        assert len(t1) == 0
 
     def test_trim_exact(self):
-        t1 = PyTSList("a", "b")
+        t1 = self.TSLIST("a", "b")
 
         t1.insert(100, 0, 2.2)
         t1.insert(200, 0, 2.2)
@@ -115,7 +120,7 @@ class PyFallbackTest(unittest.TestCase):
         assert len(t1) == 0
 
         # test right
-        t2 = PyTSList("a", "b")
+        t2 = self.TSLIST("a", "b")
         ts = pendulum.now("utc").int_timestamp
         t2.insert_datetime(ts, float(2.2))
         self.assertEqual(len(t2), 1)
@@ -125,7 +130,7 @@ class PyFallbackTest(unittest.TestCase):
         self.assertEqual(len(t2), 0)
 
         # test left
-        t3 = PyTSList("a", "b")
+        t3 = self.TSLIST("a", "b")
         ts = pendulum.now("utc").int_timestamp
         t3.insert_datetime(ts, float(2.2))
         self.assertEqual(len(t3), 1)
@@ -135,7 +140,7 @@ class PyFallbackTest(unittest.TestCase):
         self.assertEqual(len(t3), 0)
 
     def test_index(self):
-        t = PyTSList("a", "b")
+        t = self.TSLIST("a", "b")
 
         end = pendulum.now("America/Toronto")
         start = end.subtract(minutes=199)
@@ -144,7 +149,6 @@ class PyFallbackTest(unittest.TestCase):
         for dt, val in data:
             t.insert_datetime(dt, val)
 
-        print(t.at_index(199))
         assert t.index_of_ts(end) == 199
         assert t.index_of_ts(end.subtract(minutes=3)) == 196
 
@@ -161,3 +165,62 @@ class PyFallbackTest(unittest.TestCase):
 
         prev_ts = t.nearest_index_of_ts(end.subtract(seconds=40))
         assert prev_ts == 198
+
+    def test_columns(self):
+        t = self.TSLIST("a", "b")
+        for i in [5, 3, 9, 1]:
+            t.insert(i, 3600, i * 1.5)
+
+        ts, offsets, values = t.to_lists()
+        self.assertEqual(ts, [1, 3, 5, 9])
+        self.assertEqual(offsets, [3600] * 4)
+        self.assertEqual(values, [1.5, 4.5, 7.5, 13.5])
+
+    def test_insert_many(self):
+        t = self.TSLIST("a", "b")
+        t.insert(4, 0, 0.0)
+        t.insert(8, 0, 0.0)
+
+        # unsorted with a duplicate, last one wins
+        added = t.insert_many([9, 2, 4, 2, 6], [1, 1, 1, 2, 1], [9.0, 2.0, 4.0, 2.5, 6.0])
+        self.assertEqual(added, 3)
+        self.assertEqual(t.to_lists(), ([2, 4, 6, 8, 9], [2, 1, 1, 0, 1], [2.5, 4.0, 6.0, 0.0, 9.0]))
+
+        # append
+        self.assertEqual(t.insert_many(range(10, 20), [0] * 10, [1.0] * 10), 10)
+        self.assertEqual(len(t), 15)
+        self.assertEqual(t.insert_many([], [], []), 0)
+        # duplicates in an appended batch
+        self.assertEqual(t.insert_many([30, 30], [0, 0], [1.0, 2.0]), 1)
+        self.assertEqual(t.at_index(len(t) - 1), (30, 0, 2.0))
+
+        with self.assertRaises(ValueError):
+            t.insert_many([1, 2], [0], [1.0, 2.0])
+
+    def test_insert_many_random(self):
+        t = self.TSLIST("a", "b")
+        ref = {}
+        for _ in range(20):
+            n = random.randint(0, 50)
+            ts = [random.randint(0, 500) for _ in range(n)]
+            offsets = [random.randint(-10, 10) for _ in range(n)]
+            values = [random.random() for _ in range(n)]
+            new = len(set(ts) - set(ref))
+            for x in zip(ts, offsets, values):
+                ref[x[0]] = x[1:]
+            self.assertEqual(t.insert_many(ts, offsets, values), new)
+        ts, offsets, values = t.to_lists()
+        self.assertEqual(ts, sorted(ref))
+        self.assertEqual(list(zip(offsets, values)), [ref[x] for x in ts])
+
+    def test_remove(self):
+        t = self.TSLIST("a", "b")
+        t.insert_many([1, 2, 3], [0, 0, 0], [1.0, 2.0, 3.0])
+        t.remove_ts(2)
+        self.assertEqual(t.to_lists()[0], [1, 3])
+        with self.assertRaises(KeyError):
+            t.remove_ts(2)
+        t.remove_index(0)
+        self.assertEqual(t.to_lists(), ([3], [0], [3.0]))
+        with self.assertRaises(IndexError):
+            t.remove_index(5)
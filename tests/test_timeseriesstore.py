@@ -9,9 +9,12 @@ import os
 import datetime
 import mock
 import time
+import threading
 
 from cattledb.storage.connection import Connection
+from cattledb.storage.stores import LastValueStore
 from cattledb.storage.models import TimeSeries, FastDictTimeseries
+from cattledb.core.models import MetricDefinition, MetricType
 from .helper import get_unit_test_config, get_test_metrics
 
 
@@ -259,6 +262,350 @@ class TimeSeriesStorageTest(unittest.TestCase):
         self.assertEqual(len(get_timeseries("dev1", "act", delete_start, delete_end - 1)), 0)
         self.assertEqual(len(get_timeseries("dev1", "act", delete_end, to_ts)), 144*2)
 
+    def test_multi(self):
+        conf = get_unit_test_config()
+        db = Connection(engine=conf.ENGINE, engine_options=conf.ENGINE_OPTIONS,
+                        metric_definitions=get_test_metrics())
+        db.database_init(silent=True)
+
+        start = 1546300800
+        keys = ["multi{}".format(i) for i in range(20)]
+        for i, key in enumerate(keys):
+            db.timeseries.insert(key, "act", [(start + j * 600, float(i)) for j in range((i + 1) * 10)])
+            db.timeseries.insert(key, "temp", [(start, float(i))])
+
+        res = dict(db.timeseries.get_timeseries_multi(keys + ["unknown"], ["act", "temp"],
+                                                      start, start + 7 * 24 * 60 * 60))
+        self.assertEqual(len(res), 21)
+        for i, key in enumerate(keys):
+            act, temp = res[key]
+            self.assertEqual(act.key, key)
+            self.assertEqual(len(act), (i + 1) * 10)
+            self.assertEqual(temp[0].value, float(i))
+        self.assertEqual(len(res["unknown"][0]), 0)
+
+        with self.assertRaises(KeyError):
+            list(db.timeseries.get_timeseries_multi(keys, ["notametric"], start, start + 600))
+
+        # a fetch stopped by the consumer is counted
+        from blinker import signal
+        multi_func = mock.MagicMock(spec={})
+        signal("timeseries.multi").connect(multi_func)
+        gen = db.timeseries.get_timeseries_multi(keys, ["act"], start, start + 600)
+        for key, series in gen:
+            break
+        gen.close()
+        signal("timeseries.multi").disconnect(multi_func)
+        self.assertEqual(len(multi_func.call_args_list), 1)
+        info = multi_func.call_args_list[0][1]["info"]
+        self.assertEqual(info["count"], 20)
+        self.assertEqual(info["done"], 1)
+
+    def test_iter_timeseries(self):
+        conf = get_unit_test_config()
+        db = Connection(engine=conf.ENGINE, engine_options=conf.ENGINE_OPTIONS,
+                        metric_definitions=get_test_metrics())
+        db.database_init(silent=True)
+
+        start = 1546300800
+        db.timeseries.insert("iter1", "act", [(start + i * 3600, float(i)) for i in range(48)])
+        db.timeseries.insert("iter1", "temp", [(start + 4 * 24 * 60 * 60, 1.0)])
+
+        # one range scan, newest day first
+        table_cls = type(db.timeseries.table())
+        with mock.patch.object(table_cls, "row_generator", autospec=True,
+                               side_effect=table_cls.row_generator) as gen:
+            res = list(db.timeseries.iter_timeseries("iter1", ["act", "temp"], start + 3600, start + 7 * 24 * 60 * 60))
+        self.assertEqual(gen.call_count, 1)
+        self.assertEqual(len(res), 3)
+        self.assertEqual([len(act) for act, _ in res], [0, 24, 23])
+        self.assertEqual([len(temp) for _, temp in res], [1, 0, 0])
+        self.assertEqual(res[2][0][0].ts, start + 3600)
+        self.assertEqual(res[1][0][0].ts, start + 24 * 60 * 60)
+
+    def test_column_range(self):
+        conf = get_unit_test_config()
+        db = Connection(engine=conf.ENGINE, engine_options=conf.ENGINE_OPTIONS,
+                        metric_definitions=get_test_metrics())
+        db.database_init(silent=True)
+
+        start = 1546300800
+        db.timeseries.insert("range1", "act", [(start + i * 600, float(i)) for i in range(3 * 144)])
+        table_cls = type(db.timeseries.table())
+        with mock.patch.object(table_cls, "row_generator", autospec=True,
+                               side_effect=table_cls.row_generator) as gen:
+            act = db.timeseries.get_single_timeseries("range1", "act", start + 3600, start + 2 * 24 * 60 * 60 + 3600)
+        self.assertEqual(gen.call_args[1]["column_range"], (str(start + 3600), str(start + 2 * 24 * 60 * 60 + 3600)))
+        self.assertEqual(len(act), 2 * 144 + 1)
+        self.assertEqual(act[0].ts, start + 3600)
+        self.assertEqual(act[len(act) - 1].ts, start + 2 * 24 * 60 * 60 + 3600)
+
+    def test_last_values(self):
+        conf = get_unit_test_config()
+        db = Connection(engine=conf.ENGINE, engine_options=conf.ENGINE_OPTIONS,
+                        metric_definitions=get_test_metrics())
+        db.database_init(silent=True)
+
+        start = 1546300800
+        day = 24 * 60 * 60
+        db.timeseries.insert("last1", "act", [(start + 2 * day + i * 600, float(i)) for i in range(10)])
+        db.timeseries.insert("last1", "temp", [(start + i * 600, float(i)) for i in range(20)])
+        db.timeseries.insert("last1", "ph", [(start + day, 7.0)])
+
+        from blinker import signal
+        last_func = mock.MagicMock(spec={})
+        signal("timeseries.last").connect(last_func)
+        act, temp, ph, hum = db.timeseries.get_last_values("last1", ["act", "temp", "ph", "hum"])
+        signal("timeseries.last").disconnect(last_func)
+        self.assertEqual(last_func.call_count, 1)
+        self.assertEqual(last_func.call_args[1]["info"]["count"], 3)
+
+        self.assertEqual((act[0].ts, act[0].value), (start + 2 * day + 9 * 600, 9.0))
+        self.assertEqual((temp[0].ts, temp[0].value), (start + 19 * 600, 19.0))
+        self.assertEqual((ph[0].ts, ph[0].value), (start + day, 7.0))
+        self.assertEqual(len(hum), 0)
+
+        temp = db.timeseries.get_last_value("last1", "temp", max_ts=start + 2 * day)
+        self.assertEqual(temp[0].ts, start + 19 * 600)
+        act = db.timeseries.get_last_value("last1", "act", max_ts=start + day)
+        self.assertEqual(len(act), 0)
+        act = db.timeseries.get_last_value("last1", "act", min_ts=start + 2 * day)
+        self.assertEqual(len(act), 1)
+
+    def test_last_value_store(self):
+        from blinker import signal
+        conf = get_unit_test_config()
+        db = Connection(engine=conf.ENGINE, engine_options=conf.ENGINE_OPTIONS,
+                        metric_definitions=get_test_metrics())
+        db.database_init(silent=True)
+
+        start = 1546300800
+        day = 24 * 60 * 60
+        db.timeseries.insert("lvs1", "act", [(start + i * 600, float(i)) for i in range(10)])
+        db.timeseries.insert("lvs1", "temp", [(start + day, 5.0)])
+
+        # registered after the first inserts
+        store = LastValueStore(db)
+        db.register_store(store)
+        db.create_tables(silent=True)
+        self.assertEqual(store.get_items("lvs1", ["act", "tmp"]), {})
+
+        last_func = mock.MagicMock(spec={})
+        signal("timeseries.last").connect(last_func)
+        act, temp, hum = db.timeseries.get_last_values("lvs1", ["act", "temp", "hum"])
+        self.assertEqual(last_func.call_args[1]["info"]["method"], "SCAN")
+        self.assertEqual((act[0].ts, act[0].value), (start + 9 * 600, 9.0))
+        self.assertEqual(len(hum), 0)
+        items = store.get_items("lvs1", ["act", "tmp", "hum"])
+        self.assertEqual(items["act"][0], start + 9 * 600)
+        self.assertEqual(items["tmp"][0], start + day)
+        self.assertIsNone(items["hum"])
+
+        act, temp, hum = db.timeseries.get_last_values("lvs1", ["act", "temp", "hum"])
+        self.assertEqual(last_func.call_args[1]["info"]["method"], "GET")
+        self.assertEqual(last_func.call_args[1]["info"]["count"], 0)
+        self.assertEqual((temp[0].ts, temp[0].value), (start + day, 5.0))
+        self.assertEqual(len(hum), 0)
+        signal("timeseries.last").disconnect(last_func)
+
+        # only newer points replace the stored value
+        db.timeseries.insert("lvs1", "act", [(start + 20 * day, 20.0)])
+        db.timeseries.insert("lvs1", "act", [(start + 5 * day, 5.0)])
+        db.timeseries.insert("lvs1", "hum", [(start, 1.0)])
+        act, hum = db.timeseries.get_last_values("lvs1", ["act", "hum"])
+        self.assertEqual((act[0].ts, act[0].value), (start + 20 * day, 20.0))
+        self.assertEqual((hum[0].ts, hum[0].value), (start, 1.0))
+
+        db.timeseries.delete_timeseries("lvs1", ["act"], start + 20 * day, start + 20 * day)
+        act = db.timeseries.get_last_value("lvs1", "act")
+        self.assertEqual((act[0].ts, act[0].value), (start + 5 * day, 5.0))
+        db.timeseries.delete_timeseries("lvs1", ["act"], start, start + 5 * day)
+        act = db.timeseries.get_last_value("lvs1", "act")
+        self.assertEqual(len(act), 0)
+
+        # a failed insert leaves the last value alone
+        with mock.patch.object(db.timeseries, "_write_upserts", side_effect=ValueError("failed")):
+            with self.assertRaises(ValueError):
+                db.timeseries.insert("lvs1", "hum", [(start + day, 2.0)])
+        self.assertEqual(store.get_items("lvs1", ["hum"])["hum"][0], start)
+
+        # concurrent writers of one key keep the newest point
+        items = [(start + i * 600, b"") for i in range(200)]
+        random.shuffle(items)
+        threads = [threading.Thread(target=lambda part: [store.put_items("lvs2", {"act": i}) for i in part],
+                                    args=(items[n::4],)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(store.get_items("lvs2", ["act"])["act"][0], start + 199 * 600)
+
+    def test_rollups(self):
+        from blinker import signal
+        conf = get_unit_test_config()
+        metrics = get_test_metrics() + [MetricDefinition("rollph", "rlp", MetricType.FLOATSERIES, True, rollups=True)]
+        db = Connection(engine=conf.ENGINE, engine_options=conf.ENGINE_OPTIONS, metric_definitions=metrics)
+        db.database_init(silent=True)
+
+        start = 1546300800
+        day = 24 * 60 * 60
+        values = [(start + i * 600, float(i % 50) / 3.0) for i in range(3 * 144)]
+        # appended in two parts, then one point is overwritten
+        db.timeseries.insert("roll1", "rollph", values[:200])
+        db.timeseries.insert("roll1", "rollph", values[200:])
+        db.timeseries.insert("roll1", "rollph", [(start + 30 * 600, 100.0)])
+
+        def check(from_ts, to_ts):
+            raw = db.timeseries.get_single_timeseries("roll1", "rollph", from_ts, to_ts)
+            for span in ["hourly", "daily"]:
+                for func in ["mean", "count", "sum", "min", "max", "amp", "median"]:
+                    agg = db.timeseries.get_aggregated_timeseries("roll1", "rollph", from_ts, to_ts, span, func)
+                    expected = list(raw.aggregation(span, func, raw=True))
+                    self.assertEqual(len(agg), len(expected))
+                    for p, e in zip(agg.all(raw=True), expected):
+                        self.assertEqual(p.ts, e.ts)
+                        self.assertAlmostEqual(p.value, e.value, 4)
+
+        get_func = mock.MagicMock(spec={})
+        signal("timeseries.get").connect(get_func)
+        db.timeseries.get_aggregated_timeseries("roll1", "rollph", start, start + 3 * day - 1, "daily", "mean")
+        self.assertEqual(get_func.call_args_list[-1][1]["info"]["count"], 3)
+        signal("timeseries.get").disconnect(get_func)
+
+        check(start, start + 3 * day - 1)
+        check(start + 1800, start + 2 * day + 5000)
+        check(start + 600, start + 1200)
+
+        # concurrent inserts of one day keep every point in the rollups
+        db.timeseries.delete_timeseries("roll2", ["rollph"], start, start)
+        rollup_upserts = db.timeseries._rollup_upserts
+
+        def slow_rollup_upserts(*args):
+            res = rollup_upserts(*args)
+            time.sleep(0.002)
+            return res
+
+        parts = [[(start + (i * 4 + n) * 60, 1.0) for i in range(10)] for n in range(4)]
+        threads = [threading.Thread(target=lambda part: [db.timeseries.insert("roll2", "rollph", [p]) for p in part],
+                                    args=(part,)) for part in parts]
+        with mock.patch.object(db.timeseries, "_rollup_upserts", side_effect=slow_rollup_upserts):
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        agg = db.timeseries.get_aggregated_timeseries("roll2", "rollph", start, start + day - 1, "daily", "count")
+        self.assertEqual(agg[0].value, 40.0)
+
+        # rollups are deleted with the raw data
+        db.timeseries.delete_timeseries("roll1", ["rollph"], start + day, start + day)
+        check(start, start + 3 * day - 1)
+
+        # rebuild missing rollups
+        db.timeseries.table().delete_row(db.timeseries.get_row_key("roll1", start), column_families=["rlp_r"])
+        self.assertEqual(len(db.timeseries.get_aggregated_timeseries("roll1", "rollph", start, start + day - 1,
+                                                                     "daily", "count")), 0)
+        self.assertEqual(db.timeseries.recompute_rollups("roll1", "rollph", start, start + 3 * day - 1), 2)
+        check(start, start + 3 * day - 1)
+        with self.assertRaises(ValueError):
+            db.timeseries.recompute_rollups("roll1", "ph", start, start + day)
+
+        res = db.timeseries.get_full_timeseries("roll1")
+        self.assertEqual(len(res), 1)
+
+    def test_row_cache(self):
+        conf = get_unit_test_config()
+        engine_options = dict(conf.ENGINE_OPTIONS, row_cache_size=10000)
+        db = Connection(engine=conf.ENGINE, engine_options=engine_options,
+                        metric_definitions=get_test_metrics())
+        db.database_init(silent=True)
+        cache = db.timeseries.row_cache
+
+        start = 1546300800
+        end = start + 3 * 24 * 60 * 60 - 1
+        db.timeseries.insert("cache1", "rawph", [(start + i * 600, 1.0) for i in range(3*144)])
+        db.timeseries.insert("cache1", "ph", [(start + i * 600, 2.0) for i in range(3*144)])
+
+        from blinker import signal
+        get_func = mock.MagicMock(spec={})
+        signal("timeseries.get").connect(get_func)
+
+        r = db.timeseries.get_timeseries("cache1", ["rawph", "ph"], start, end)
+        self.assertEqual(len(r[0]), 3*144)
+        self.assertEqual(cache.info()["items"], 3)
+        self.assertEqual(cache.size, 3*144)
+        self.assertEqual(get_func.call_args_list[-1][1]["info"]["cached"], 0)
+
+        # rawph from cache, ph (delete possible) from the database
+        r = db.timeseries.get_timeseries("cache1", ["rawph", "ph"], start + 100, end)
+        self.assertEqual(get_func.call_args_list[-1][1]["info"]["cached"], 3)
+        self.assertEqual(len(r[0]), 3*144 - 1)
+        self.assertEqual(len(r[1]), 3*144 - 1)
+        self.assertEqual(r[0][0].value, 1.0)
+        self.assertEqual(cache.info()["hits"], 3)
+
+        # writes invalidate the cached rows
+        db.timeseries.insert("cache1", "rawph", [(start + 300, 5.0)])
+        self.assertEqual(cache.info()["items"], 2)
+        r = db.timeseries.get_single_timeseries("cache1", "rawph", start, end)
+        self.assertEqual(len(r), 3*144 + 1)
+        self.assertEqual(r[1].value, 5.0)
+        self.assertEqual(cache.info()["items"], 3)
+
+        # empty days are cached as well, the current day is not
+        now = int(time.time())
+        db.timeseries.get_single_timeseries("cache2", "rawph", now - 5 * 24 * 60 * 60, now)
+        self.assertEqual(cache.info()["items"], 7)
+        self.assertIn("row_cache", db.info())
+
+    def test_block_encoding(self):
+        conf = get_unit_test_config()
+        block_metric = MetricDefinition("blockph", "bph", MetricType.FLOATSERIES, True, block_encoding=True)
+        db = Connection(engine=conf.ENGINE, engine_options=conf.ENGINE_OPTIONS,
+                        metric_definitions=get_test_metrics() + [block_metric])
+        db.database_init(silent=True)
+        db.timeseries._create_metric("blockph", silent=True)
+
+        start = 1584489600
+        end = start + 3 * 24 * 60 * 60 - 60
+        db.timeseries.delete_timeseries("blk1", ["blockph"], start, end)
+
+        d1 = [(start + i * 60, 7.123456789) for i in range(0, 3*1440, 2)]
+        d2 = [(start + i * 60, 6.1) for i in range(1, 3*1440, 2)]
+        self.assertEqual(db.timeseries.insert("blk1", "blockph", d1), 3*720)
+        # merged into the existing blocks
+        db.timeseries.insert("blk1", "blockph", d2 + [(start, 1.5)])
+
+        row_key = db.timeseries.get_row_key("blk1", start)
+        row = db.read_row(db.timeseries.TABLENAME, row_key)
+        self.assertEqual(list(row.keys()), ["bph:b"])
+
+        r = db.timeseries.get_single_timeseries("blk1", "blockph", start, end)
+        self.assertEqual(len(r), 3*1440)
+        self.assertEqual(r[0].value, 1.5)
+        # no float32 rounding
+        self.assertEqual(r[2].value, 7.123456789)
+        self.assertEqual(r[3].value, 6.1)
+
+        r = db.timeseries.get_single_timeseries("blk1", "blockph", start + 30, start + 24*60*60 + 30)
+        self.assertEqual(len(r), 1440)
+
+        last = db.timeseries.get_last_values("blk1", ["blockph"])[0]
+        self.assertEqual(last[0].ts, end)
+
+        full = db.timeseries.get_full_timeseries("blk1")
+        self.assertEqual(len(full), 1)
+        self.assertEqual(len(full[0]), 3*1440)
+
+        r = db.timeseries.delete_timeseries("blk1", ["blockph"], start, start)
+        self.assertEqual(r, 1)
+        r = db.timeseries.get_single_timeseries("blk1", "blockph", start, end)
+        self.assertEqual(len(r), 2*1440)
+
+        d = block_metric.to_dict()
+        self.assertTrue(MetricDefinition.from_dict(d).block_encoding)
+        del d["block_encoding"]
+        self.assertFalse(MetricDefinition.from_dict(d).block_encoding)
+
     def test_assert_limit(self):
         conf = get_unit_test_config()
         db = Connection(engine=conf.ENGINE, engine_options=conf.ENGINE_OPTIONS,